@@ -243,6 +243,8 @@ class WindowAttention(nn.Layer):
                               bias_attr=b_attr_2)
         self.proj_dropout = nn.Dropout(dropout)
         self.softmax = nn.Softmax(axis=-1)
+        # eval only: (mask, attn_bias) of the last forward, see get_cached_attn_bias
+        self._attn_bias_cache = None
 
     def _init_weights(self):
         weight_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
@@ -265,12 +267,14 @@ class WindowAttention(nn.Layer):
         relative_position_bias = paddle.index_select(x=table, index=index)
         return relative_position_bias
 
-    def forward(self, x, mask=None):
-        qkv = self.qkv(x).chunk(3, axis=-1)  # list of 3 elements
-        q, k, v = map(self.transpose_multihead, qkv)
-        q = q * self.scale
-        attn = paddle.matmul(q, k, transpose_y=True)
+    def get_attn_bias(self, mask=None):
+        """Return the additive attention bias: relative position bias (+ shifted window mask)
 
+        Args:
+            mask: tensor, [nW, window_h*window_w, window_h*window_w], default: None
+        Returns:
+            attn_bias: tensor, [1 or nW, num_heads, window_h*window_w, window_h*window_w]
+        """
         relative_position_bias = self.get_relative_pos_bias_from_pos_index()
 
         relative_position_bias = relative_position_bias.reshape(
@@ -280,17 +284,48 @@ class WindowAttention(nn.Layer):
 
         # nH, window_h*window_w, window_h*window_w
         relative_position_bias = relative_position_bias.transpose([2, 0, 1])
-        attn = attn + relative_position_bias.unsqueeze(0)
+        attn_bias = relative_position_bias.unsqueeze(0)
+        if mask is not None:
+            attn_bias = attn_bias + mask.unsqueeze(1)
+        return attn_bias
+
+    def get_cached_attn_bias(self, mask=None):
+        """Return get_attn_bias(mask), materialized once in eval mode
+
+        In train mode the bias is computed in every forward and the cache is
+        dropped. In eval mode, the bias computed without grad (e.g., under
+        paddle.no_grad) is kept for the last mask until clear_attn_bias_cache is
+        called, which is done by train(), eval() and set_state_dict of SwinTransformer.
+        """
+        if self.training:
+            self._attn_bias_cache = None
+            return self.get_attn_bias(mask)
+        if self._attn_bias_cache is not None and self._attn_bias_cache[0] is mask:
+            return self._attn_bias_cache[1]
+        attn_bias = self.get_attn_bias(mask)
+        if attn_bias.stop_gradient:
+            self._attn_bias_cache = (mask, attn_bias)
+        return attn_bias
+
+    def clear_attn_bias_cache(self):
+        self._attn_bias_cache = None
 
+    def forward(self, x, mask=None):
+        qkv = self.qkv(x).chunk(3, axis=-1)  # list of 3 elements
+        q, k, v = map(self.transpose_multihead, qkv)
+        q = q * self.scale
+        attn = paddle.matmul(q, k, transpose_y=True)
+
+        attn_bias = self.get_cached_attn_bias(mask)
         if mask is not None:
             nW = mask.shape[0]
             attn = attn.reshape(
                 [x.shape[0] // nW, nW, self.num_heads, x.shape[1], x.shape[1]])
-            attn += mask.unsqueeze(1).unsqueeze(0)
+            attn = attn + attn_bias.unsqueeze(0)
             attn = attn.reshape([-1, self.num_heads, x.shape[1], x.shape[1]])
-            attn = self.softmax(attn)
         else:
-            attn = self.softmax(attn)
+            attn = attn + attn_bias
+        attn = self.softmax(attn)
 
         attn = self.attn_dropout(attn)
 
@@ -638,6 +673,27 @@ class SwinTransformer(nn.Layer):
         bias_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.Constant(0.0))
         return weight_attr, bias_attr
 
+    def clear_attn_bias_cache(self):
+        """Drop the attention bias cached in eval mode, see WindowAttention"""
+        for layer in self.sublayers():
+            if isinstance(layer, WindowAttention):
+                layer.clear_attn_bias_cache()
+
+    def train(self, *args, **kwargs):
+        self.clear_attn_bias_cache()
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        self.clear_attn_bias_cache()
+        return super().eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        self.clear_attn_bias_cache()
+        return super().set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
     def forward_features(self, x):
         x = self.patch_embedding(x)  # [batch, h*w, embed_dim]
         if self.ape:
@@ -26,6 +26,7 @@ from functools import partial
 import paddle
 import paddle.nn as nn
 import paddle.nn.functional as F
+from paddle.distributed.fleet.utils import recompute
 from droppath import DropPath
 
 trunc_normal_ = nn.initializer.TruncatedNormal(std=0.02)
@@ -371,9 +372,12 @@ class Beit(nn.Layer):
                  use_rel_pos_bias=False,
                  use_shared_rel_pos_bias=False,
                  use_mean_pooling=True,
-                 init_scale=0.001):
+                 init_scale=0.001,
+                 recompute_interval=0):
         super().__init__()
         self.num_classes = num_classes
+        # activations of every k-th block are recomputed in backward, 0 to disable
+        self.recompute_interval = recompute_interval
         # num_features for consistency with other models
         self.num_features = self.embed_dim = embed_dim
 
@@ -487,8 +491,11 @@ class Beit(nn.Layer):
         x = self.pos_drop(x)
 
         rel_pos_bias = self.rel_pos_bias() if self.rel_pos_bias is not None else None
-        for blk in self.blocks:
-            x = blk(x, rel_pos_bias=rel_pos_bias)
+        for idx, blk in enumerate(self.blocks):
+            if self.training and self.recompute_interval > 0 and idx % self.recompute_interval == 0:
+                x = recompute(blk, x, rel_pos_bias)
+            else:
+                x = blk(x, rel_pos_bias=rel_pos_bias)
 
         x = self.norm(x)
         if self.fc_norm is not None:
@@ -517,5 +524,6 @@ def build_beit(config):
         use_rel_pos_bias=config.MODEL.USE_REL_POS_BIAS,
         init_values=config.MODEL.INIT_VALUES,
         qkv_bias=config.MODEL.QKV_BIAS,
+        recompute_interval=config.MODEL.RECOMPUTE_INTERVAL,
     )
     return model
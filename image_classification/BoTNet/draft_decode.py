@@ -0,0 +1,103 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Crop-aware JPEG decoding for RandomResizedCrop
+
+RandomResizedCrop usually decodes the full-resolution image and throws most
+pixels away. DraftRandomResizedCrop samples the crop box from the image size
+in the JPEG header, then uses the draft mode of PIL (DCT-domain downscaling by
+1/2, 1/4 or 1/8) to decode the image at the smallest scale at which the crop
+box is still not smaller than the output size.
+"""
+
+import math
+from PIL import Image
+from paddle.vision import transforms
+
+PIL_INTERPOLATIONS = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'box': Image.BOX,
+    'lanczos': Image.LANCZOS,
+    'hamming': Image.HAMMING,
+}
+
+
+def is_lazy_decode(transform_ops):
+    """Return True if the first op of transform_ops decodes the image itself"""
+    ops = getattr(transform_ops, 'transforms', None)
+    return bool(ops) and getattr(ops[0], 'draft', False)
+
+
+def convert_image(image, transform_ops=None):
+    """Convert the lazily opened PIL image into RGB (which decodes it),
+    unless the decoding is deferred to the crop-aware first op of transform_ops"""
+    if is_lazy_decode(transform_ops):
+        return image
+    return image.convert('RGB')
+
+
+class DraftRandomResizedCrop(transforms.RandomResizedCrop):
+    """RandomResizedCrop which decodes JPEG images at a reduced scale
+
+    The crop box is sampled as RandomResizedCrop does. If draft is True and the
+    input is a JPEG image not decoded yet (see convert_image), the image is
+    decoded by PIL draft mode at the smallest sufficient scale, and the crop
+    box is resized from the reduced image. Otherwise it is the same as
+    RandomResizedCrop.
+
+    Args:
+        size: int or tuple, output size (h, w)
+        scale: tuple, range of crop area relative to the image. Default: (0.08, 1.0)
+        ratio: tuple, range of aspect ratio of the crop. Default: (3/4, 4/3)
+        interpolation: str, interpolation of the resize. Default: 'bilinear'
+        draft: bool, if True, JPEG images are decoded in draft mode. Default: True
+    """
+    def __init__(self,
+                 size,
+                 scale=(0.08, 1.0),
+                 ratio=(3. / 4, 4. / 3),
+                 interpolation='bilinear',
+                 draft=True):
+        super().__init__(size, scale=scale, ratio=ratio, interpolation=interpolation)
+        self.draft = draft
+
+    def _sample_box(self, image):
+        # paddle<2.5 names it _get_param, later versions _dynamic_get_param
+        get_param = getattr(self, '_get_param', None) or self._dynamic_get_param
+        return get_param(image)
+
+    def _apply_image(self, img):
+        if not isinstance(img, Image.Image):
+            return super()._apply_image(img)
+        if not (self.draft and img.format == 'JPEG' and img.tile):
+            # not a lazily opened JPEG image, e.g., png or decoded already
+            return super()._apply_image(img if img.mode == 'RGB' else img.convert('RGB'))
+
+        # the crop box is sampled from the size in header, before decoding
+        ori_w, ori_h = img.size
+        i, j, h, w = self._sample_box(img)
+        out_h, out_w = self.size
+        # draft picks the largest downscaling keeping the image >= requested size,
+        # thus the crop box keeps >= output size after downscaling
+        img.draft('RGB', (max(1, math.ceil(ori_w * out_w / w)),
+                          max(1, math.ceil(ori_h * out_h / h))))
+        scale_w = img.size[0] / ori_w
+        scale_h = img.size[1] / ori_h
+        img = img.convert('RGB')
+        box = (j * scale_w, i * scale_h, (j + w) * scale_w, (i + h) * scale_h)
+        interpolation = PIL_INTERPOLATIONS.get(self.interpolation, self.interpolation)
+        return img.resize((out_w, out_h), interpolation, box=box)
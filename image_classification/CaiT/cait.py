@@ -21,7 +21,9 @@ A Paddle Implementation of CaiT as described in:
 """
 import paddle
 import paddle.nn as nn
+from paddle.distributed.fleet.utils import recompute
 from droppath import DropPath
+from interpolate_position_embedding import PositionEmbeddingInterpolation
 
 
 class Identity(nn.Layer):
@@ -397,6 +399,8 @@ class Cait(nn.Layer):
         init_values: initial value for layer scales, default: 1e-4
         mlp_ratio_class_token: float, mlp_ratio for mlp used in class attention blocks, default: 4.0
         depth_token_only, int, num of class attention blocks, default: 2
+        recompute_interval: int, recompute activations of every k-th self-attention block in
+            backward to save memory (gradient checkpointing), 0 to disable, default: 0
     """
     def __init__(self,
                  image_size=224,
@@ -413,9 +417,11 @@ class Cait(nn.Layer):
                  droppath=0,
                  init_values=1e-4,
                  mlp_ratio_class_token=4.0,
-                 depth_token_only=2):
+                 depth_token_only=2,
+                 recompute_interval=0):
         super().__init__()
         self.num_classes = num_classes
+        self.recompute_interval = recompute_interval
         # convert image to paches
         self.patch_embed = PatchEmbedding(image_size=image_size,
                                           patch_size=patch_size,
@@ -432,6 +438,9 @@ class Cait(nn.Layer):
             shape=[1, num_patches, embed_dim],
             dtype='float32',
             default_initializer=nn.initializer.Constant(0.0))
+        # interpolate position embedding for inputs of other sizes
+        self.pos_embed_interpolation = PositionEmbeddingInterpolation(
+            self.patch_embed.patches_resolution, num_extra_tokens=0)
 
         self.pos_dropout = nn.Dropout(dropout)
 
@@ -467,13 +476,18 @@ class Cait(nn.Layer):
 
     def forward_features(self, x):
         # Patch Embedding
+        grid_size = (x.shape[2] // self.patch_embed.patch_size[0],
+                     x.shape[3] // self.patch_embed.patch_size[1])
         x = self.patch_embed(x) # [B, num_patches, embed_dim]
         cls_tokens = self.cls_token.expand([x.shape[0], -1, -1]) # [B, 1, embed_dim]
-        x = x + self.pos_embed
+        x = x + self.pos_embed_interpolation(self.pos_embed, grid_size)
         x = self.pos_dropout(x)
         # Self-Attention blocks
         for idx, block in enumerate(self.blocks):
-            x = block(x) # [B, num_patches, embed_dim]
+            if self.training and self.recompute_interval > 0 and idx % self.recompute_interval == 0:
+                x = recompute(block, x) # [B, num_patches, embed_dim]
+            else:
+                x = block(x) # [B, num_patches, embed_dim]
         # Class-Attention blocks
         for idx, block in enumerate(self.blocks_token_only):
             cls_tokens = block(x, cls_tokens) # [B, 1, embed_dim]
@@ -504,5 +518,6 @@ def build_cait(config):
                  droppath=config.MODEL.DROPPATH,
                  init_values=config.MODEL.INIT_VALUES,
                  mlp_ratio_class_token=config.MODEL.MLP_RATIO,
-                 depth_token_only=config.MODEL.DEPTH_TOKEN_ONLY)
+                 depth_token_only=config.MODEL.DEPTH_TOKEN_ONLY,
+                 recompute_interval=config.MODEL.RECOMPUTE_INTERVAL)
     return model
@@ -28,6 +28,10 @@ _C.DATA = CN()
 _C.DATA.BATCH_SIZE = 256  # train batch_size on single GPU
 _C.DATA.BATCH_SIZE_EVAL = None  # (disabled in update_config) val batch_size on single GPU
 _C.DATA.DATA_PATH = '/dataset/imagenet/'  # path to dataset
+_C.DATA.PACKED_PATH = None  # path to packed shards (see packed_dataset.py), used instead of DATA_PATH if set
+_C.DATA.SHUFFLE_BUFFER_SIZE = 4096  # shuffle buffer size of each worker when reading packed shards
+_C.DATA.VAL_CACHE_PATH = None  # path to cache the resized and center-cropped val images, built on first use
+_C.DATA.DRAFT_DECODE = False  # decode train JPEGs at reduced scale for RandomResizedCrop, see draft_decode.py
 _C.DATA.DATASET = 'imagenet2012'  # dataset name, currently only support imagenet2012
 _C.DATA.IMAGE_SIZE = 224  # input image size e.g., 224
 _C.DATA.IMAGE_CHANNELS = 3  # input image channels: e.g., 3
@@ -46,6 +50,7 @@ _C.MODEL.NUM_CLASSES = 1000  # num of classes for classifier
 _C.MODEL.DROPOUT = 0.0
 _C.MODEL.ATTENTION_DROPOUT = 0.0
 _C.MODEL.DROPPATH = 0.1
+_C.MODEL.RECOMPUTE_INTERVAL = 0 # recompute activations of every k-th block in backward, 0 to disable
 # model transformer settings
 _C.MODEL.PATCH_SIZE = 16
 _C.MODEL.EMBED_DIM = 768
@@ -82,6 +87,8 @@ _C.TRAIN.OPTIMIZER.BETAS = (0.9, 0.999)
 _C.TRAIN.MODEL_EMA = True
 _C.TRAIN.MODEL_EMA_DECAY = 0.99996
 _C.TRAIN.MODEL_EMA_FORCE_CPU = True
+_C.TRAIN.MODEL_EMA_UPDATE_EVERY = 1 # update ema once every k steps, decay is compensated
+_C.TRAIN.MODEL_EMA_ASYNC = False # update ema in a background thread if it is on cpu
 
 # data augmentation (optional, check datasets.py)
 _C.TRAIN.SMOOTHING = 0.1
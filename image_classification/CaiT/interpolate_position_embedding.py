@@ -14,7 +14,9 @@
 """interpolate position tokens
    interpolate when  number of model's position tokens is not equal to loaded model state dict,
    keep the extra tokens (cls_token, dist_token, etc.) unchanged.
+   PositionEmbeddingInterpolation interpolates at runtime to the patch grid of the input.
 """
+from collections import OrderedDict
 import paddle
 
 
@@ -43,3 +45,56 @@ def interpolate_position_embedding(model, state_dict):
             pos_tokens = pos_tokens.flatten(1, 2) # [n, h*w, d]
             new_pos_embed = paddle.concat([extra_tokens, pos_tokens], axis=1)
             state_dict['pos_embed'] = new_pos_embed
+
+
+class PositionEmbeddingInterpolation():
+    """Runtime interpolation of position embeddings to the patch grid of the input
+
+    The position tokens are bicubic interpolated from the patch grid of the model
+    to the patch grid (h, w) of the input, the extra tokens (e.g., cls_token)
+    are kept unchanged. Bicubic interpolation is linear, so the interpolation
+    to each grid is computed once as a [h*w, src_h*src_w] weight (by interpolating
+    one-hot tokens) and kept in a LRU cache, the position embeddings are then
+    interpolated by a matmul. The weight does not depend on the position embeddings,
+    so the cache stays valid in training and after loading other weights.
+
+    Args:
+        src_size: tuple of ints, (h, w) patch grid of the position embeddings
+        num_extra_tokens: int, number of tokens before the position tokens
+        cache_size: int, number of patch grids whose weight is cached, default: 8
+    """
+    def __init__(self, src_size, num_extra_tokens, cache_size=8):
+        self.src_size = tuple(src_size)
+        self.num_extra_tokens = num_extra_tokens
+        self.cache_size = cache_size
+        self._weight_cache = OrderedDict()
+
+    def interpolate(self, pos_tokens, size):
+        """bicubic interpolate pos_tokens [n, d, src_h, src_w] to [n, d, h, w]"""
+        return paddle.nn.functional.interpolate(
+            pos_tokens, size=size, mode='bicubic', align_corners=False)
+
+    def get_weight(self, size):
+        """Return the [h*w, src_h*src_w] interpolation weight to patch grid size (h, w)"""
+        if size in self._weight_cache:
+            self._weight_cache.move_to_end(size)
+            return self._weight_cache[size]
+        num_tokens = self.src_size[0] * self.src_size[1]
+        with paddle.no_grad():
+            one_hot = paddle.eye(num_tokens).reshape(
+                [num_tokens, 1, self.src_size[0], self.src_size[1]])
+            weight = self.interpolate(one_hot, size).reshape([num_tokens, -1]).transpose([1, 0])
+        self._weight_cache[size] = weight
+        if len(self._weight_cache) > self.cache_size:
+            self._weight_cache.popitem(last=False)
+        return weight
+
+    def __call__(self, pos_embed, size):
+        """Return pos_embed [1, num_extra_tokens + src_h*src_w, d] for patch grid size (h, w)"""
+        size = tuple(size)
+        if size == self.src_size:
+            return pos_embed
+        pos_tokens = paddle.matmul(self.get_weight(size), pos_embed[:, self.num_extra_tokens:])
+        if self.num_extra_tokens == 0:
+            return pos_tokens
+        return paddle.concat([pos_embed[:, :self.num_extra_tokens], pos_tokens], axis=1)
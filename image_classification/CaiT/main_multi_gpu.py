@@ -18,17 +18,16 @@ import os
 import time
 import argparse
 import random
-import math
 import numpy as np
 import paddle
 from datasets import get_dataloader
 from datasets import get_dataset
 from config import get_config
 from config import update_config
-from utils import AverageMeter
+from utils import DistributedMeter
+from utils import grad_sync_context
 from utils import get_logger
 from utils import write_log
-from utils import all_reduce_mean
 from utils import skip_weight_decay_fn
 from mixup import Mixup
 from model_ema import ModelEma
@@ -89,17 +88,14 @@ def train(dataloader,
         local_logger: logger for local process/gpu, default: None
         master_logger: logger for main process, default: None
     Returns:
-        train_loss_meter.avg: float, average loss on current process/gpu
-        train_acc_meter.avg: float, average acc@1 on current process/gpu
-        master_loss_meter.avg: float, average loss on all processes/gpus
-        master_acc_meter.avg: float, average acc@1 on all processes/gpus
+        train_meter.avg['loss']: float, average loss on current process/gpu
+        train_meter.avg['acc']: float, average acc@1 on current process/gpu
+        train_meter.master_avg['loss']: float, average loss on all processes/gpus
+        train_meter.master_avg['acc']: float, average acc@1 on all processes/gpus
         train_time: float, training time
     """
     time_st = time.time()
-    train_loss_meter = AverageMeter()
-    train_acc_meter = AverageMeter()
-    master_loss_meter = AverageMeter()
-    master_acc_meter = AverageMeter()
+    train_meter = DistributedMeter(['loss', 'acc'])
 
     model.train()
     optimizer.clear_grad()
@@ -114,32 +110,32 @@ def train(dataloader,
         if mixup_fn is not None:
             images, label = mixup_fn(images, label_orig)
 
-        # forward
-        with paddle.amp.auto_cast(amp_grad_scaler is not None):
-            output = model(images)
-            loss = criterion(output, label)
-
-        loss_value = loss.item()
-        if not math.isfinite(loss_value):
-            print("Loss is {}, stopping training".format(loss_value))
-            sys.exit(1)
-
-        loss = loss / accum_iter
-
-        # backward and step
-        if amp_grad_scaler is None: # fp32
-            loss.backward()
-            if ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                optimizer.step()
-                optimizer.clear_grad()
-        else: # amp
-            scaled_loss = amp_grad_scaler.scale(loss)
-            scaled_loss.backward()
-            if ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                # amp for param group reference: https://github.com/PaddlePaddle/Paddle/issues/37188
-                amp_grad_scaler.step(optimizer)
-                amp_grad_scaler.update()
-                optimizer.clear_grad()
+        # gradients are all-reduced across gpus only at the accumulation boundary
+        update_step = ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader))
+        with grad_sync_context(model, update_step):
+            # forward
+            with paddle.amp.auto_cast(amp_grad_scaler is not None):
+                output = model(images)
+                loss = criterion(output, label)
+
+            loss_value = loss.detach()
+
+            loss = loss / accum_iter
+
+            # backward and step
+            if amp_grad_scaler is None: # fp32
+                loss.backward()
+                if update_step:
+                    optimizer.step()
+                    optimizer.clear_grad()
+            else: # amp
+                scaled_loss = amp_grad_scaler.scale(loss)
+                scaled_loss.backward()
+                if update_step:
+                    # amp for param group reference: https://github.com/PaddlePaddle/Paddle/issues/37188
+                    amp_grad_scaler.step(optimizer)
+                    amp_grad_scaler.update()
+                    optimizer.clear_grad()
 
         if model_ema is not None and paddle.distributed.get_rank() == 0:
             model_ema.update(model)
@@ -147,36 +143,34 @@ def train(dataloader,
         # average of output and kd_output, same as eval mode
         pred = paddle.nn.functional.softmax(output)
         acc = paddle.metric.accuracy(pred,
-            label_orig if mixup_fn else label_orig.unsqueeze(1)).item()
+            label_orig if mixup_fn else label_orig.unsqueeze(1))
 
-        # sync from other gpus for overall loss and acc
-        master_loss = all_reduce_mean(loss_value)
-        master_acc = all_reduce_mean(acc)
-        master_batch_size = all_reduce_mean(batch_size)
-
-        master_loss_meter.update(master_loss, master_batch_size)
-        master_acc_meter.update(master_acc, master_batch_size)
-        train_loss_meter.update(loss_value, batch_size)
-        train_acc_meter.update(acc, batch_size)
+        # metrics are kept on device, synced from other gpus only for logging
+        train_meter.update([loss_value, acc], batch_size)
 
         if batch_id % debug_steps == 0 or batch_id + 1 == len(dataloader):
+            train_meter.sync()
+            if train_meter.num_nonfinite > 0:
+                print("Loss is not finite, stopping training")
+                sys.exit(1)
             general_message = (f"Epoch[{epoch:03d}/{total_epochs:03d}], "
                                f"Step[{batch_id:04d}/{total_batches:04d}], "
                                f"Lr: {optimizer.get_lr():04f}, ")
             local_message = (general_message +
-                             f"Loss: {loss_value:.4f} ({train_loss_meter.avg:.4f}), "
-                             f"Avg Acc: {train_acc_meter.avg:.4f}")
+                             f"Loss: {train_meter.val['loss']:.4f} ({train_meter.avg['loss']:.4f}), "
+                             f"Avg Acc: {train_meter.avg['acc']:.4f}")
             master_message = (general_message +
-                              f"Loss: {master_loss:.4f} ({master_loss_meter.avg:.4f}), "
-                              f"Avg Acc: {master_acc_meter.avg:.4f}")
+                              f"Loss: {train_meter.master_val['loss']:.4f} "
+                              f"({train_meter.master_avg['loss']:.4f}), "
+                              f"Avg Acc: {train_meter.master_avg['acc']:.4f}")
             write_log(local_logger, master_logger, local_message, master_message)
 
     #paddle.distributed.barrier()
     train_time = time.time() - time_st
-    return (train_loss_meter.avg,
-            train_acc_meter.avg,
-            master_loss_meter.avg,
-            master_acc_meter.avg,
+    return (train_meter.avg['loss'],
+            train_meter.avg['acc'],
+            train_meter.master_avg['loss'],
+            train_meter.master_avg['acc'],
             train_time)
 
 
@@ -197,21 +191,16 @@ def validate(dataloader,
         local_logger: logger for local process/gpu, default: None
         master_logger: logger for main process, default: None
     Returns:
-        val_loss_meter.avg: float, average loss on current process/gpu
-        val_acc1_meter.avg: float, average top1 accuracy on current processes/gpus
-        val_acc5_meter.avg: float, average top5 accuracy on current processes/gpus
-        master_loss_meter.avg: float, average loss on all processes/gpus
-        master_acc1_meter.avg: float, average top1 accuracy on all processes/gpus
-        master_acc5_meter.avg: float, average top5 accuracy on all processes/gpus
+        val_meter.avg['loss']: float, average loss on current process/gpu
+        val_meter.avg['acc1']: float, average top1 accuracy on current processes/gpus
+        val_meter.avg['acc5']: float, average top5 accuracy on current processes/gpus
+        val_meter.master_avg['loss']: float, average loss on all processes/gpus
+        val_meter.master_avg['acc1']: float, average top1 accuracy on all processes/gpus
+        val_meter.master_avg['acc5']: float, average top5 accuracy on all processes/gpus
         val_time: float, validation time
     """
     model.eval()
-    val_loss_meter = AverageMeter()
-    val_acc1_meter = AverageMeter()
-    val_acc5_meter = AverageMeter()
-    master_loss_meter = AverageMeter()
-    master_acc1_meter = AverageMeter()
-    master_acc5_meter = AverageMeter()
+    val_meter = DistributedMeter(['loss', 'acc1', 'acc5'])
 
     time_st = time.time()
 
@@ -223,43 +212,34 @@ def validate(dataloader,
 
         output = model(images)
         loss = criterion(output, label)
-        loss_value = loss.item()
 
         pred = paddle.nn.functional.softmax(output)
-        acc1 = paddle.metric.accuracy(pred, label.unsqueeze(1)).item()
-        acc5 = paddle.metric.accuracy(pred, label.unsqueeze(1), k=5).item()
-
-        # sync from other gpus for overall loss and acc
-        master_loss = all_reduce_mean(loss_value)
-        master_acc1 = all_reduce_mean(acc1)
-        master_acc5 = all_reduce_mean(acc5)
-        master_batch_size = all_reduce_mean(batch_size)
-
-        master_loss_meter.update(master_loss, master_batch_size)
-        master_acc1_meter.update(master_acc1, master_batch_size)
-        master_acc5_meter.update(master_acc5, master_batch_size)
-        val_loss_meter.update(loss_value, batch_size)
-        val_acc1_meter.update(acc1, batch_size)
-        val_acc5_meter.update(acc5, batch_size)
+        acc1 = paddle.metric.accuracy(pred, label.unsqueeze(1))
+        acc5 = paddle.metric.accuracy(pred, label.unsqueeze(1), k=5)
+
+        # metrics are kept on device, synced from other gpus only for logging
+        val_meter.update([loss, acc1, acc5], batch_size)
 
         if batch_id % debug_steps == 0:
+            val_meter.sync()
             local_message = (f"Step[{batch_id:04d}/{total_batches:04d}], "
-                             f"Avg Loss: {val_loss_meter.avg:.4f}, "
-                             f"Avg Acc@1: {val_acc1_meter.avg:.4f}, "
-                             f"Avg Acc@5: {val_acc5_meter.avg:.4f}")
+                             f"Avg Loss: {val_meter.avg['loss']:.4f}, "
+                             f"Avg Acc@1: {val_meter.avg['acc1']:.4f}, "
+                             f"Avg Acc@5: {val_meter.avg['acc5']:.4f}")
             master_message = (f"Step[{batch_id:04d}/{total_batches:04d}], "
-                              f"Avg Loss: {master_loss_meter.avg:.4f}, "
-                              f"Avg Acc@1: {master_acc1_meter.avg:.4f}, "
-                              f"Avg Acc@5: {master_acc5_meter.avg:.4f}")
+                              f"Avg Loss: {val_meter.master_avg['loss']:.4f}, "
+                              f"Avg Acc@1: {val_meter.master_avg['acc1']:.4f}, "
+                              f"Avg Acc@5: {val_meter.master_avg['acc5']:.4f}")
             write_log(local_logger, master_logger, local_message, master_message)
+    val_meter.sync()
     #paddle.distributed.barrier()
     val_time = time.time() - time_st
-    return (val_loss_meter.avg,
-            val_acc1_meter.avg,
-            val_acc5_meter.avg,
-            master_loss_meter.avg,
-            master_acc1_meter.avg,
-            master_acc5_meter.avg,
+    return (val_meter.avg['loss'],
+            val_meter.avg['acc1'],
+            val_meter.avg['acc5'],
+            val_meter.master_avg['loss'],
+            val_meter.master_avg['acc1'],
+            val_meter.master_avg['acc5'],
             val_time)
 
 
@@ -286,7 +266,10 @@ def main_worker(*args):
     # define model ema
     model_ema = None
     if not config.EVAL and config.TRAIN.MODEL_EMA and local_rank == 0:
-        model_ema = ModelEma(model, decay=config.TRAIN.MODEL_EMA_DECAY)
+        model_ema = ModelEma(model,
+                             decay=config.TRAIN.MODEL_EMA_DECAY,
+                             update_every=config.TRAIN.MODEL_EMA_UPDATE_EVERY,
+                             async_update=config.TRAIN.MODEL_EMA_ASYNC)
         if config.TRAIN.MODEL_EMA_FORCE_CPU:
             model_ema.to('cpu')
 
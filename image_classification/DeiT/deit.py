@@ -22,6 +22,7 @@ A Paddle Implementation of Data Efficient Image Transformer (DeiT) as described
 import paddle
 import paddle.nn as nn
 from droppath import DropPath
+from interpolate_position_embedding import PositionEmbeddingInterpolation
 
 
 class Identity(nn.Layer):
@@ -357,6 +358,9 @@ class VisionTransformer(nn.Layer):
             shape=[1, 1 + self.patch_embedding.num_patches, embed_dim],
             dtype='float32',
             default_initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
+        # interpolate position embedding for inputs of other sizes
+        self.position_embedding_interpolation = PositionEmbeddingInterpolation(
+            (image_size // patch_size, image_size // patch_size), num_extra_tokens=1)
         # create cls token
         self.cls_token = paddle.create_parameter(
             shape=[1, 1, embed_dim],
@@ -401,10 +405,12 @@ class VisionTransformer(nn.Layer):
         return weight_attr, bias_attr
 
     def forward_features(self, x):
+        grid_size = (x.shape[2] // self.patch_embedding.patch_size,
+                     x.shape[3] // self.patch_embedding.patch_size)
         x = self.patch_embedding(x)
         cls_tokens = self.cls_token.expand((x.shape[0], -1, -1))
         x = paddle.concat((cls_tokens, x), axis=1)
-        x = x + self.position_embedding
+        x = x + self.position_embedding_interpolation(self.position_embedding, grid_size)
         x = self.pos_dropout(x)
         x = self.encoder(x)
         x = self.pre_logits(x[:, 0]) # cls_token only
@@ -456,6 +462,8 @@ class DistilledVisionTransformer(VisionTransformer):
             shape=[1, 2 + self.patch_embedding.num_patches, embed_dim],
             dtype='float32',
             default_initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
+        self.position_embedding_interpolation = PositionEmbeddingInterpolation(
+            (image_size // patch_size, image_size // patch_size), num_extra_tokens=2)
         # create distill token
         self.dist_token = paddle.create_parameter(
             shape=[1, 1, embed_dim],
@@ -469,11 +477,13 @@ class DistilledVisionTransformer(VisionTransformer):
                                          bias_attr=b_attr_1)
 
     def forward_features(self, x):
+        grid_size = (x.shape[2] // self.patch_embedding.patch_size,
+                     x.shape[3] // self.patch_embedding.patch_size)
         x = self.patch_embedding(x)
         cls_tokens = self.cls_token.expand((x.shape[0], -1, -1))
         dist_tokens = self.dist_token.expand((x.shape[0], -1, -1))
         x = paddle.concat((cls_tokens, dist_tokens, x), axis=1)
-        x = x + self.position_embedding
+        x = x + self.position_embedding_interpolation(self.position_embedding, grid_size)
         x = self.pos_dropout(x)
         x = self.encoder(x)
         return x[:, 0], x[:, 1]
@@ -88,7 +88,7 @@ class DistillationLoss(nn.Layer):
         self.alpha = alpha
         self.tau = tau
 
-    def forward(self, inputs, outputs, targets):
+    def forward(self, inputs, outputs, targets, teacher_outputs=None):
         """
         Args:
             inputs: tensor, the orginal model inputs
@@ -97,6 +97,9 @@ class DistillationLoss(nn.Layer):
                          this is usually obtained by a separate branch
                          in the last layer of the model
             targets: tensor, the labels for the base criterion
+            teacher_outputs: tensor, the teacher outputs, e.g., read from the
+                             offline teacher cache, if None the teacher model
+                             is run on inputs, default: None
         """
         outputs_kd = None
         if not isinstance(outputs, paddle.Tensor):
@@ -105,8 +108,9 @@ class DistillationLoss(nn.Layer):
         if self.type == 'none':
             return base_loss
 
-        with paddle.no_grad():
-            teacher_outputs = self.teacher_model(inputs)
+        if teacher_outputs is None:
+            with paddle.no_grad():
+                teacher_outputs = self.teacher_model(inputs)
 
         if self.type == 'soft':
             distillation_loss = F.kl_div(
@@ -170,11 +170,13 @@ class Mixup:
         self.num_classes = num_classes
         self.mode = mode
         self.correct_lam = correct_lam
+        self.lam = 1.
         assert mode == 'batch', 'Now only batch mode is supported!'
 
     def __call__(self, x, target):
         assert x.shape[0] % 2 == 0, "Batch size should be even"
         lam = self._mix_batch(x)
+        self.lam = lam
         target = mixup_one_hot(target, self.num_classes, lam, self.label_smoothing)
         return x, target
 
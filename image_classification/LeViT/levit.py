@@ -188,12 +188,34 @@ class Attention(nn.Layer):
         self.register_buffer('attn_bias_idxs', rel_pos)
 
         self.softmax = nn.Softmax(-1)
+        # eval only, a dict keeps the cached tensor out of the layer buffers
+        self._attn_biases_cache = {}
 
     def get_attn_biases(self):
-        res = paddle.zeros([self.num_heads] + self.attn_bias_idxs.shape)
-        for idx in range(self.resolution_out_area):
-            res[:, idx, :] = paddle.gather(self.attn_biases, self.attn_bias_idxs[idx, :], axis=1)
-        return res
+        # gather the biases of all (query, key) pairs at once: [num_heads, res_out**2, res**2]
+        res = paddle.index_select(self.attn_biases, self.attn_bias_idxs.flatten(), axis=1)
+        return res.reshape([self.num_heads] + self.attn_bias_idxs.shape)
+
+    def get_cached_attn_biases(self):
+        """Return get_attn_biases(), materialized once in eval mode
+
+        In train mode the biases are gathered in every forward and the cache is
+        dropped. In eval mode, the biases gathered without grad (e.g., under
+        paddle.no_grad) are kept until clear_attn_biases_cache is called, which
+        is done by train(), eval() and set_state_dict of LeViT.
+        """
+        if self.training:
+            self._attn_biases_cache.clear()
+            return self.get_attn_biases()
+        if 'attn_biases' not in self._attn_biases_cache:
+            attn_biases = self.get_attn_biases()
+            if not attn_biases.stop_gradient:
+                return attn_biases
+            self._attn_biases_cache['attn_biases'] = attn_biases
+        return self._attn_biases_cache['attn_biases']
+
+    def clear_attn_biases_cache(self):
+        self._attn_biases_cache.clear()
 
     def forward(self, x):
         if self.use_conv:
@@ -204,7 +226,7 @@ class Attention(nn.Layer):
 
             q = q * self.scale
             attn = paddle.matmul(q, k, transpose_y=True)
-            attn = attn + self.get_attn_biases()
+            attn = attn + self.get_cached_attn_biases()
             attn  = self.softmax(attn)
 
             z = paddle.matmul(attn, v)
@@ -221,7 +243,7 @@ class Attention(nn.Layer):
             q = q * self.scale
             attn = paddle.matmul(q, k, transpose_y=True)
 
-            attn = attn + self.get_attn_biases()
+            attn = attn + self.get_cached_attn_biases()
             attn  = self.softmax(attn)
 
             z = paddle.matmul(attn, v)
@@ -280,12 +302,34 @@ class AttentionSubsample(nn.Layer):
         self.register_buffer('attn_bias_idxs', rel_pos)
 
         self.softmax = nn.Softmax(-1)
+        # eval only, a dict keeps the cached tensor out of the layer buffers
+        self._attn_biases_cache = {}
 
     def get_attn_biases(self):
-        res = paddle.zeros([self.num_heads] + self.attn_bias_idxs.shape)
-        for idx in range(self.resolution_out_area):
-            res[:, idx, :] = paddle.gather(self.attn_biases, self.attn_bias_idxs[idx, :], axis=1)
-        return res
+        # gather the biases of all (query, key) pairs at once: [num_heads, res_out**2, res**2]
+        res = paddle.index_select(self.attn_biases, self.attn_bias_idxs.flatten(), axis=1)
+        return res.reshape([self.num_heads] + self.attn_bias_idxs.shape)
+
+    def get_cached_attn_biases(self):
+        """Return get_attn_biases(), materialized once in eval mode
+
+        In train mode the biases are gathered in every forward and the cache is
+        dropped. In eval mode, the biases gathered without grad (e.g., under
+        paddle.no_grad) are kept until clear_attn_biases_cache is called, which
+        is done by train(), eval() and set_state_dict of LeViT.
+        """
+        if self.training:
+            self._attn_biases_cache.clear()
+            return self.get_attn_biases()
+        if 'attn_biases' not in self._attn_biases_cache:
+            attn_biases = self.get_attn_biases()
+            if not attn_biases.stop_gradient:
+                return attn_biases
+            self._attn_biases_cache['attn_biases'] = attn_biases
+        return self._attn_biases_cache['attn_biases']
+
+    def clear_attn_biases_cache(self):
+        self._attn_biases_cache.clear()
 
     def forward(self, x):
         if self.use_conv:
@@ -299,7 +343,7 @@ class AttentionSubsample(nn.Layer):
 
             q = q * self.scale
             attn = paddle.matmul(q, k, transpose_y=True)
-            attn = attn + self.get_attn_biases()
+            attn = attn + self.get_cached_attn_biases()
             attn  = self.softmax(attn)
 
             z = paddle.matmul(attn, v)
@@ -319,7 +363,7 @@ class AttentionSubsample(nn.Layer):
 
             q = q * self.scale
             attn = paddle.matmul(q, k, transpose_y=True)
-            attn = attn + self.get_attn_biases()
+            attn = attn + self.get_cached_attn_biases()
             attn  = self.softmax(attn)
 
             z = paddle.matmul(attn, v)
@@ -431,6 +475,27 @@ class LeViT(nn.Layer):
         self.blocks = nn.LayerList(layer_list)
         self.head = NormLinear(embed_dim[-1], num_classes, bias_attr=True) if num_classes > 0 else Identity()
 
+    def clear_attn_biases_cache(self):
+        """Drop the attention biases cached in eval mode, see Attention"""
+        for layer in self.sublayers():
+            if isinstance(layer, (Attention, AttentionSubsample)):
+                layer.clear_attn_biases_cache()
+
+    def train(self, *args, **kwargs):
+        self.clear_attn_biases_cache()
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        self.clear_attn_biases_cache()
+        return super().eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        self.clear_attn_biases_cache()
+        return super().set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
     def forward_features(self, x):
         x = self.patch_embed(x)
         if not self.use_conv:
@@ -0,0 +1,157 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline teacher logits for distillation
+
+The augmentation of each training sample is seeded by (seed, epoch, index), so
+it can be replayed exactly. The teacher is run once over the replayed samples
+of every epoch, and its top-k log probs are stored in memory-mapped arrays of
+shape (num_epochs, num_samples, topk). Training then replays the same
+augmentation and reads the teacher outputs from the cache, instead of running
+the teacher forward on every batch.
+
+Mixup/CutMix is applied on the batch after the cache lookup, the teacher probs
+of a mixed batch are approximated by mixing the cached probs with the same lam.
+The noise pixels of RandomErasing('pixel') come from the paddle generator and
+are not replayed, only the erased boxes are.
+
+Usage (run once with the config of the distillation, then set TRAIN.TEACHER_CACHE):
+    python build_teacher_cache.py -cfg ./configs/levit_256.yaml \
+        -dataset imagenet2012 -data_path /dataset/imagenet \
+        -teacher_model_path ./regnety_160.pdparams -cache_path ./teacher_cache -num_epochs 300
+"""
+
+import os
+import json
+import random
+import numpy as np
+import paddle
+from paddle.io import Dataset
+
+
+class TeacherLogitCache():
+    """Reader of the top-k teacher log probs written by build_teacher_cache.py
+
+    The arrays are memory-mapped lazily in each process (dataloader workers included).
+
+    Args:
+        cache_path: path where the cache files are stored
+
+    Attributes:
+        seed: int, augmentation seed of the cache
+        num_epochs: int, number of cached epochs, later epochs reuse them in turn
+        num_samples: int, number of training samples
+        num_classes: int, number of classes of the teacher
+        topk: int, number of log probs kept per sample
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        meta_file = os.path.join(cache_path, 'meta.json')
+        assert os.path.isfile(meta_file), f'{meta_file} not exist! see build_teacher_cache.py'
+        with open(meta_file, 'r') as infile:
+            meta = json.load(infile)
+        self.seed = meta['seed']
+        self.num_epochs = meta['num_epochs']
+        self.num_samples = meta['num_samples']
+        self.num_classes = meta['num_classes']
+        self.topk = meta['topk']
+        self._values = None
+        self._indices = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_values'] = None
+        state['_indices'] = None
+        return state
+
+    def get_probs(self, epoch, index):
+        """Return the teacher probs (num_classes,) of sample index at epoch
+
+        The probability mass out of the top-k is spread uniformly over the
+        other classes.
+        """
+        if self._values is None:
+            self._values = np.load(os.path.join(self.cache_path, 'values.npy'), mmap_mode='r')
+            self._indices = np.load(os.path.join(self.cache_path, 'indices.npy'), mmap_mode='r')
+        epoch = epoch % self.num_epochs
+        topk_probs = np.exp(self._values[epoch, index].astype('float32'))
+        rest = max(1. - topk_probs.sum(), 0.) / max(self.num_classes - self.topk, 1)
+        probs = np.full([self.num_classes], rest, dtype='float32')
+        probs[self._indices[epoch, index].astype('int64')] = topk_probs
+        return probs
+
+
+class ReplayAugDataset(Dataset):
+    """Dataset wrapper which seeds the augmentation of each sample by (seed, epoch, index)
+
+    The states of random and np.random are restored after each sample, thus
+    the other random ops of the process are not affected.
+
+    Args:
+        dataset: training dataset, ImageNet2012Dataset or PackedImageNet2012Dataset
+        seed: int, augmentation seed
+        teacher_cache: TeacherLogitCache, if not None, the teacher probs of each
+            sample are returned instead of its index. Default: None
+
+    Returns (of __getitem__):
+        data, label, and the teacher probs (num_classes,) or the sample index
+    """
+    def __init__(self, dataset, seed, teacher_cache=None):
+        super().__init__()
+        self.dataset = dataset
+        self.seed = seed
+        self.teacher_cache = teacher_cache
+        self.epoch = 0
+        if teacher_cache is not None and teacher_cache.num_samples != len(dataset):
+            raise ValueError(f'teacher cache has {teacher_cache.num_samples} samples but the '
+                             f'dataset has {len(dataset)}, the cache should be built on the same dataset')
+
+    def set_epoch(self, epoch):
+        """Set the epoch (0-based) to replay, set before iterating the dataloader"""
+        if self.teacher_cache is not None:
+            epoch = epoch % self.teacher_cache.num_epochs
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        sample_seed = (self.seed + self.epoch * len(self.dataset) + index) % (2 ** 32)
+        random_state = random.getstate()
+        np_random_state = np.random.get_state()
+        random.seed(sample_seed)
+        np.random.seed(sample_seed)
+        try:
+            data, label = self.dataset[index]
+        finally:
+            random.setstate(random_state)
+            np.random.set_state(np_random_state)
+        if self.teacher_cache is not None:
+            return data, label, self.teacher_cache.get_probs(self.epoch, index)
+        return data, label, index
+
+
+def cached_teacher_outputs(teacher_probs, lam=1.0):
+    """Return the teacher logits (log probs) of a batch from its cached probs
+
+    Args:
+        teacher_probs: tensor, [batch_size, num_classes] probs read from the cache
+        lam: float, lam of Mixup/CutMix, the batch is mixed with its flipped version
+    Returns:
+        teacher_outputs: tensor, [batch_size, num_classes] teacher logits
+    """
+    if lam < 1.0:
+        teacher_probs = teacher_probs * lam + teacher_probs.flip(axis=[0]) * (1 - lam)
+    return paddle.log(teacher_probs.clip(min=1e-12))
@@ -31,6 +31,10 @@ _C.DATA = CN()
 _C.DATA.BATCH_SIZE = 256  # 256 # train batch_size for single GPU
 _C.DATA.BATCH_SIZE_EVAL = 8  # 64 # val batch_size for single GPU
 _C.DATA.DATA_PATH = '/dataset/imagenet/'  # path to dataset
+_C.DATA.PACKED_PATH = None  # path to packed shards (see packed_dataset.py), used instead of DATA_PATH if set
+_C.DATA.SHUFFLE_BUFFER_SIZE = 4096  # shuffle buffer size of each worker when reading packed shards
+_C.DATA.VAL_CACHE_PATH = None  # path to cache the resized and center-cropped val images, built on first use
+_C.DATA.DRAFT_DECODE = False  # decode train JPEGs at reduced scale for RandomResizedCrop, see draft_decode.py
 _C.DATA.DATASET = 'imagenet2012'  # dataset name
 _C.DATA.IMAGE_SIZE = 224  # input image size: 224 for pretrain, 384 for finetune
 # input image scale ratio, scale is applied before centercrop in eval mode
@@ -33,6 +33,11 @@ from augment import RandAugment
 from masking_generator import RandomMaskingGenerator
 from transforms import RandomHorizontalFlip
 from random_erasing import RandomErasing
+from packed_dataset import PackedImageNet2012Dataset
+from packed_dataset import ShardBatchSampler
+from val_cache import CachedValDataset
+from draft_decode import DraftRandomResizedCrop
+from draft_decode import convert_image
 
 class ImageNet2012Dataset(Dataset):
     """Build ImageNet2012 dataset
@@ -84,7 +89,7 @@ class ImageNet2012Dataset(Dataset):
         return len(self.label_list)
 
     def __getitem__(self, index):
-        data = image_load(self.img_path_list[index]).convert('RGB')
+        data = convert_image(image_load(self.img_path_list[index]), self.transform)
         data = self.transform(data)
         if self.mask_generator is not None:
             mask = self.mask_generator()
@@ -114,8 +119,9 @@ def get_train_transforms(config):
     aug_op_list = []
     # STEP1: random crop and resize
     aug_op_list.append(
-        transforms.RandomResizedCrop((config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
-                                     scale=(0.05, 1.0), interpolation='bicubic'))
+        DraftRandomResizedCrop((config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
+                               scale=(0.05, 1.0), interpolation='bicubic',
+                               draft=config.DATA.DRAFT_DECODE))
     # STEP2: auto_augment or color jitter
     if config.TRAIN.AUTO_AUGMENT:
         policy = auto_augment_policy_original()
@@ -201,14 +207,25 @@ def get_dataset(config, mode='train'):
             mode = 'test'
             dataset = datasets.Cifar100(mode=mode, transform=get_val_transforms(config))
     elif config.DATA.DATASET == "imagenet2012":
+        dataset_class = PackedImageNet2012Dataset if config.DATA.PACKED_PATH else ImageNet2012Dataset
+        data_path = config.DATA.PACKED_PATH if config.DATA.PACKED_PATH else config.DATA.DATA_PATH
         if mode == 'train':
-            dataset = ImageNet2012Dataset(config.DATA.DATA_PATH,
-                                          mode=mode,
-                                          transform=get_train_transforms(config))
+            dataset = dataset_class(data_path,
+                                    mode=mode,
+                                    transform=get_train_transforms(config))
         else:
-            dataset = ImageNet2012Dataset(config.DATA.DATA_PATH,
-                                          mode=mode,
-                                          transform=get_val_transforms(config))
+            transform_ops = get_val_transforms(config)
+            dataset = dataset_class(data_path,
+                                    mode=mode,
+                                    transform=transform_ops)
+            if config.DATA.VAL_CACHE_PATH:
+                # deterministic resize and center crop are done once into a cache
+                dataset = CachedValDataset(dataset,
+                                           transform_ops,
+                                           config.DATA.VAL_CACHE_PATH,
+                                           config.DATA.IMAGE_SIZE,
+                                           config.DATA.CROP_PCT,
+                                           num_workers=config.DATA.NUM_WORKERS)
     else:
         raise NotImplementedError(
             "[{config.DATA.DATASET}] Only cifar10, cifar100, imagenet2012 are supported now")
@@ -225,6 +242,7 @@ def get_dataloader(config, dataset, mode='train', multi_process=False):
         dataset: paddle.io.dataset object
         mode: train/val
         multi_process: if True, use DistributedBatchSampler to support multi-processing
+            for packed training set, ShardBatchSampler is used instead
     Returns:
         dataloader: paddle.io.DataLoader object.
     """
@@ -234,6 +252,20 @@ def get_dataloader(config, dataset, mode='train', multi_process=False):
     else:
         batch_size = config.DATA.BATCH_SIZE_EVAL
 
+    if mode == 'train' and isinstance(dataset, PackedImageNet2012Dataset):
+        # packed shards are read sequentially by each worker with a shuffle buffer
+        sampler = ShardBatchSampler(dataset,
+                                    batch_size=batch_size,
+                                    num_workers=config.DATA.NUM_WORKERS,
+                                    buffer_size=config.DATA.SHUFFLE_BUFFER_SIZE,
+                                    drop_last=False,
+                                    num_replicas=None if multi_process else 1,
+                                    rank=None if multi_process else 0)
+        dataloader = DataLoader(dataset,
+                                batch_sampler=sampler,
+                                num_workers=config.DATA.NUM_WORKERS)
+        return dataloader
+
     if multi_process is True:
         sampler = DistributedBatchSampler(dataset,
                                           batch_size=batch_size,
@@ -30,7 +30,8 @@ from datasets import get_dataset
 from transformer import build_mae_finetune as build_model
 from losses import LabelSmoothingCrossEntropyLoss
 from losses import SoftTargetCrossEntropyLoss
-from utils import AverageMeter
+from utils import DistributedMeter
+from utils import grad_sync_context
 from utils import WarmupCosineScheduler
 from utils import get_exclude_from_weight_decay_fn
 from config import get_config
@@ -105,17 +106,14 @@ def train(dataloader,
         local_logger: logger for local process/gpu, default: None
         master_logger: logger for main process, default: None
     Returns:
-        train_loss_meter.avg: float, average loss on current process/gpu
-        train_acc_meter.avg: float, average top1 accuracy on current process/gpu
-        master_train_loss_meter.avg: float, average loss on all processes/gpus
-        master_train_acc_meter.avg: float, average top1 accuracy on all processes/gpus
+        train_meter.avg['loss']: float, average loss on current process/gpu
+        train_meter.avg['acc']: float, average top1 accuracy on current process/gpu
+        train_meter.master_avg['loss']: float, average loss on all processes/gpus
+        train_meter.master_avg['acc']: float, average top1 accuracy on all processes/gpus
         train_time: float, training time
     """
     model.train()
-    train_loss_meter = AverageMeter()
-    train_acc_meter = AverageMeter()
-    master_train_loss_meter = AverageMeter()
-    master_train_acc_meter = AverageMeter()
+    train_meter = DistributedMeter(['loss', 'acc'])
 
     if amp is True:
         scaler = paddle.amp.GradScaler(init_loss_scaling=1024)
@@ -129,27 +127,30 @@ def train(dataloader,
         if mixup_fn is not None:
             image, label = mixup_fn(image, label_orig)
         
-        if amp is True: # mixed precision training
-            with paddle.amp.auto_cast():
+        # gradients are all-reduced across gpus only at the accumulation boundary
+        update_step = ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader))
+        with grad_sync_context(model, update_step):
+            if amp is True: # mixed precision training
+                with paddle.amp.auto_cast():
+                    output = model(image)
+                    loss = criterion(output, label)
+                scaled = scaler.scale(loss)
+                scaled.backward()
+                if update_step:
+                    scaler.minimize(optimizer, scaled)
+                    optimizer.clear_grad()
+            else: # full precision training
                 output = model(image)
                 loss = criterion(output, label)
-            scaled = scaler.scale(loss)
-            scaled.backward()
-            if ((batch_id +1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                scaler.minimize(optimizer, scaled)
-                optimizer.clear_grad()
-        else: # full precision training
-            output = model(image)
-            loss = criterion(output, label)
-            # NOTE: division may be needed depending on the loss function
-            # Here no division is needed:
-            # default 'reduction' param in nn.CrossEntropyLoss is set to 'mean'
-            # loss =  loss / accum_iter
-            loss.backward()
+                # NOTE: division may be needed depending on the loss function
+                # Here no division is needed:
+                # default 'reduction' param in nn.CrossEntropyLoss is set to 'mean'
+                # loss =  loss / accum_iter
+                loss.backward()
 
-            if ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                optimizer.step()
-                optimizer.clear_grad()
+                if update_step:
+                    optimizer.step()
+                    optimizer.clear_grad()
 
         pred = F.softmax(output)
         if mixup_fn:
@@ -157,42 +158,30 @@ def train(dataloader,
         else:
             acc = paddle.metric.accuracy(pred, label_orig.unsqueeze(1))
 
-        batch_size = paddle.to_tensor(image.shape[0])
-
-        # sync from other gpus for overall loss and acc
-        master_loss = loss.clone()
-        master_acc = acc.clone()
-        master_batch_size = batch_size.clone()
-        dist.all_reduce(master_loss)
-        dist.all_reduce(master_acc)
-        dist.all_reduce(master_batch_size)
-        master_loss = master_loss / dist.get_world_size()
-        master_acc = master_acc / dist.get_world_size()
-        master_train_loss_meter.update(master_loss.numpy()[0], master_batch_size.numpy()[0])
-        master_train_acc_meter.update(master_acc.numpy()[0], master_batch_size.numpy()[0])
-
-        train_loss_meter.update(loss.numpy()[0], batch_size.numpy()[0])
-        train_acc_meter.update(acc.numpy()[0], batch_size.numpy()[0])
+        # metrics are kept on device, synced from other gpus only for logging
+        train_meter.update([loss, acc], image.shape[0])
 
         if batch_id % debug_steps == 0:
+            train_meter.sync()
             if local_logger:
                 local_logger.info(
                     f"Epoch[{epoch:03d}/{total_epochs:03d}], " +
                     f"Step[{batch_id:04d}/{total_batch:04d}], " +
-                    f"Avg Loss: {train_loss_meter.avg:.4f}, " +
-                    f"Avg Acc: {train_acc_meter.avg:.4f}")
+                    f"Avg Loss: {train_meter.avg['loss']:.4f}, " +
+                    f"Avg Acc: {train_meter.avg['acc']:.4f}")
             if master_logger and dist.get_rank() == 0:
                 master_logger.info(
                     f"Epoch[{epoch:03d}/{total_epochs:03d}], " +
                     f"Step[{batch_id:04d}/{total_batch:04d}], " +
-                    f"Avg Loss: {master_train_loss_meter.avg:.4f}, " +
-                    f"Avg Acc: {master_train_acc_meter.avg:.4f}")
+                    f"Avg Loss: {train_meter.master_avg['loss']:.4f}, " +
+                    f"Avg Acc: {train_meter.master_avg['acc']:.4f}")
 
+    train_meter.sync()
     train_time = time.time() - time_st
-    return (train_loss_meter.avg,
-            train_acc_meter.avg,
-            master_train_loss_meter.avg,
-            master_train_acc_meter.avg,
+    return (train_meter.avg['loss'],
+            train_meter.avg['acc'],
+            train_meter.master_avg['loss'],
+            train_meter.master_avg['acc'],
             train_time)
 
 
@@ -213,21 +202,16 @@ def validate(dataloader,
         local_logger: logger for local process/gpu, default: None
         master_logger: logger for main process, default: None
     Returns:
-        val_loss_meter.avg: float, average loss on current process/gpu
-        val_acc1_meter.avg: float, average top1 accuracy on current process/gpu
-        val_acc5_meter.avg: float, average top5 accuracy on current process/gpu
-        master_val_loss_meter.avg: float, average loss on all processes/gpus
-        master_val_acc1_meter.avg: float, average top1 accuracy on all processes/gpus
-        master_val_acc5_meter.avg: float, average top5 accuracy on all processes/gpus
+        val_meter.avg['loss']: float, average loss on current process/gpu
+        val_meter.avg['acc1']: float, average top1 accuracy on current process/gpu
+        val_meter.avg['acc5']: float, average top5 accuracy on current process/gpu
+        val_meter.master_avg['loss']: float, average loss on all processes/gpus
+        val_meter.master_avg['acc1']: float, average top1 accuracy on all processes/gpus
+        val_meter.master_avg['acc5']: float, average top5 accuracy on all processes/gpus
         val_time: float, validation time
     """
     model.eval()
-    val_loss_meter = AverageMeter()
-    val_acc1_meter = AverageMeter()
-    val_acc5_meter = AverageMeter()
-    master_val_loss_meter = AverageMeter()
-    master_val_acc1_meter = AverageMeter()
-    master_val_acc5_meter = AverageMeter()
+    val_meter = DistributedMeter(['loss', 'acc1', 'acc5'])
     time_st = time.time()
 
     with paddle.no_grad():
@@ -242,49 +226,31 @@ def validate(dataloader,
             acc1 = paddle.metric.accuracy(pred, label.unsqueeze(1))
             acc5 = paddle.metric.accuracy(pred, label.unsqueeze(1), k=5)
 
-            batch_size = paddle.to_tensor(image.shape[0])
-
-            master_loss = loss.clone()
-            master_acc1 = acc1.clone()
-            master_acc5 = acc5.clone()
-            master_batch_size = batch_size.clone()
-
-            dist.all_reduce(master_loss)
-            dist.all_reduce(master_acc1)
-            dist.all_reduce(master_acc5)
-            dist.all_reduce(master_batch_size)
-            master_loss = master_loss / dist.get_world_size()
-            master_acc1 = master_acc1 / dist.get_world_size()
-            master_acc5 = master_acc5 / dist.get_world_size()
-
-            master_val_loss_meter.update(master_loss.numpy()[0], master_batch_size.numpy()[0])
-            master_val_acc1_meter.update(master_acc1.numpy()[0], master_batch_size.numpy()[0])
-            master_val_acc5_meter.update(master_acc5.numpy()[0], master_batch_size.numpy()[0])
-
-            val_loss_meter.update(loss.numpy()[0], batch_size.numpy()[0])
-            val_acc1_meter.update(acc1.numpy()[0], batch_size.numpy()[0])
-            val_acc5_meter.update(acc5.numpy()[0], batch_size.numpy()[0])
+            # metrics are kept on device, synced from other gpus only for logging
+            val_meter.update([loss, acc1, acc5], image.shape[0])
 
             if batch_id % debug_steps == 0:
+                val_meter.sync()
                 if local_logger:
                     local_logger.info(
                         f"Val Step[{batch_id:04d}/{total_batch:04d}], " +
-                        f"Avg Loss: {val_loss_meter.avg:.4f}, " +
-                        f"Avg Acc@1: {val_acc1_meter.avg:.4f}, " +
-                        f"Avg Acc@5: {val_acc5_meter.avg:.4f}")
+                        f"Avg Loss: {val_meter.avg['loss']:.4f}, " +
+                        f"Avg Acc@1: {val_meter.avg['acc1']:.4f}, " +
+                        f"Avg Acc@5: {val_meter.avg['acc5']:.4f}")
                 if master_logger and dist.get_rank() == 0:
                     master_logger.info(
                         f"Val Step[{batch_id:04d}/{total_batch:04d}], " +
-                        f"Avg Loss: {master_val_loss_meter.avg:.4f}, " +
-                        f"Avg Acc@1: {master_val_acc1_meter.avg:.4f}, " +
-                        f"Avg Acc@5: {master_val_acc5_meter.avg:.4f}")
+                        f"Avg Loss: {val_meter.master_avg['loss']:.4f}, " +
+                        f"Avg Acc@1: {val_meter.master_avg['acc1']:.4f}, " +
+                        f"Avg Acc@5: {val_meter.master_avg['acc5']:.4f}")
+    val_meter.sync()
     val_time = time.time() - time_st
-    return (val_loss_meter.avg,
-            val_acc1_meter.avg,
-            val_acc5_meter.avg,
-            master_val_loss_meter.avg,
-            master_val_acc1_meter.avg,
-            master_val_acc5_meter.avg,
+    return (val_meter.avg['loss'],
+            val_meter.avg['acc1'],
+            val_meter.avg['acc5'],
+            val_meter.master_avg['loss'],
+            val_meter.master_avg['acc1'],
+            val_meter.master_avg['acc5'],
             val_time)
 
 
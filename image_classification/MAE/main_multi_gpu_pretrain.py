@@ -28,7 +28,8 @@ import paddle.distributed as dist
 from datasets import get_dataloader
 from datasets import get_dataset
 from transformer import build_mae_pretrain as build_model
-from utils import AverageMeter
+from utils import DistributedMeter
+from utils import grad_sync_context
 from utils import WarmupCosineScheduler
 from utils import get_exclude_from_weight_decay_fn
 from config import get_config
@@ -105,15 +106,12 @@ def train(dataloader,
         local_logger: logger for local process/gpu, default: None
         master_logger: logger for main process, default: None
     Returns:
-        train_loss_meter.avg: float, average loss on current process/gpu
-        train_acc_meter.avg: float, average top1 accuracy on current process/gpu
-        master_train_loss_meter.avg: float, average loss on all processes/gpus
-        master_train_acc_meter.avg: float, average top1 accuracy on all processes/gpus
+        train_meter.avg['loss']: float, average loss on current process/gpu
+        train_meter.master_avg['loss']: float, average loss on all processes/gpus
         train_time: float, training time
     """
     model.train()
-    train_loss_meter = AverageMeter()
-    master_train_loss_meter = AverageMeter()
+    train_meter = DistributedMeter(['loss'])
 
     if amp is True:
         scaler = paddle.amp.GradScaler(init_loss_scaling=1024)
@@ -144,56 +142,52 @@ def train(dataloader,
             B, _, C = images_patch.shape
             labels = images_patch[masks[:, 1:]].reshape([B, -1, C])
 
-        if amp is True:
-            with paddle.amp.auto_cast():
+        # gradients are all-reduced across gpus only at the accumulation boundary
+        update_step = ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader))
+        with grad_sync_context(model, update_step):
+            if amp is True:
+                with paddle.amp.auto_cast():
+                    reconstructed_patches = model(images, masks)
+                    loss = criterion(reconstructed_patches, labels)
+                scaled = scaler.scale(loss)
+                scaled.backward()
+
+                if update_step:
+                    scaler.minimize(optimizer, scaled)
+                    optimizer.clear_grad()
+            else:
                 reconstructed_patches = model(images, masks)
                 loss = criterion(reconstructed_patches, labels)
-            scaled = scaler.scale(loss)
-            scaled.backward()
+                # NOTE: division may be needed depending on the loss function
+                # Here no division is needed:
+                # default 'reduction' param in nn.CrossEntropyLoss is set to 'mean'
+                # loss =  loss / accum_iter
+                loss.backward()
 
-            if ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                scaler.minimize(optimizer, scaled)
-                optimizer.clear_grad()
-        else:
-            reconstructed_patches = model(images, masks)
-            loss = criterion(reconstructed_patches, labels)
-            # NOTE: division may be needed depending on the loss function
-            # Here no division is needed:
-            # default 'reduction' param in nn.CrossEntropyLoss is set to 'mean'
-            # loss =  loss / accum_iter
-            loss.backward()
-
-            if ((batch_id + 1) % accum_iter == 0) or (batch_id + 1 == len(dataloader)):
-                optimizer.step()
-                optimizer.clear_grad()
-
-        batch_size = paddle.to_tensor(images.shape[0])
-
-        # sync from other gpus for overall loss and acc
-        master_loss = loss.clone()
-        master_batch_size = batch_size.clone()
-        dist.all_reduce(master_loss)
-        dist.all_reduce(master_batch_size)
-        master_loss = master_loss / dist.get_world_size()
-        master_train_loss_meter.update(master_loss.numpy()[0], master_batch_size.numpy()[0])
-
-        train_loss_meter.update(loss.numpy()[0], batch_size.numpy()[0])
+                if update_step:
+                    optimizer.step()
+                    optimizer.clear_grad()
+
+        # metrics are kept on device, synced from other gpus only for logging
+        train_meter.update([loss], images.shape[0])
 
         if batch_id % debug_steps == 0:
+            train_meter.sync()
             if local_logger:
                 local_logger.info(
                     f"Epoch[{epoch:03d}/{total_epochs:03d}], " +
                     f"Step[{batch_id:04d}/{total_batch:04d}], " +
-                    f"Avg Loss: {train_loss_meter.avg:.4f}")
+                    f"Avg Loss: {train_meter.avg['loss']:.4f}")
             if master_logger and dist.get_rank() == 0:
                 master_logger.info(
                     f"Epoch[{epoch:03d}/{total_epochs:03d}], " +
                     f"Step[{batch_id:04d}/{total_batch:04d}], " +
-                    f"Avg Loss: {master_train_loss_meter.avg:.4f}")
+                    f"Avg Loss: {train_meter.master_avg['loss']:.4f}")
 
+    train_meter.sync()
     train_time = time.time() - time_st
-    return (train_loss_meter.avg,
-            master_train_loss_meter.avg,
+    return (train_meter.avg['loss'],
+            train_meter.master_avg['loss'],
             train_time)
 
 
@@ -0,0 +1,297 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Packed ImageNet2012 dataset
+
+The samples listed in train_list.txt/val_list.txt are packed into large shard
+files (the encoded image bytes are concatenated as is), with a compact index of
+shard ids, offsets, lengths and labels. Reading a sample is a slice of a
+memory-mapped shard instead of opening an individual file, which avoids the
+metadata and seek cost of ~1.28M small files on network filesystems.
+
+Usage (pack once, then set DATA.PACKED_PATH in config):
+    python packed_dataset.py --data_path /dataset/imagenet --out_path /dataset/imagenet_packed
+"""
+
+import os
+import io
+import argparse
+import numpy as np
+from PIL import Image
+import paddle
+from paddle.io import Dataset
+from paddle.io import BatchSampler
+from draft_decode import convert_image
+
+
+def pack_imagenet_dataset(data_path, out_path, is_train=True, shard_size=1 << 30, seed=0):
+    """Pack the samples of train_list.txt/val_list.txt into shard files
+
+    Train samples are packed in a random order, since train_list.txt is sorted
+    by class and the training sampler only shuffles within a buffer of shards.
+
+    Args:
+        data_path: path where imagenet images and train/val_list.txt are stored
+        out_path: path to write the shard files and the index
+        is_train: bool, set True to pack training set, otherwise val set. Default: True
+        shard_size: int, max bytes of a shard file. Default: 1GB
+        seed: int, random seed of the packing order of training set. Default: 0
+    Returns:
+        index_file: path of the written index file
+    """
+    split = 'train' if is_train else 'val'
+    list_file = os.path.join(data_path, f'{split}_list.txt')
+    assert os.path.isfile(list_file), f'{list_file} not exist!'
+    with open(list_file, 'r') as infile:
+        samples = [line.strip().split() for line in infile if line.strip()]
+    if is_train:
+        np.random.RandomState(seed).shuffle(samples)
+    os.makedirs(out_path, exist_ok=True)
+
+    num_samples = len(samples)
+    shard_ids = np.zeros([num_samples], dtype='int32')
+    offsets = np.zeros([num_samples], dtype='int64')
+    lengths = np.zeros([num_samples], dtype='int32')
+    labels = np.zeros([num_samples], dtype='int32')
+    shard_names = []
+    shard_file = None
+    for idx, (img_path, img_label) in enumerate(samples):
+        with open(os.path.join(data_path, img_path), 'rb') as infile:
+            img_bytes = infile.read()
+        if shard_file is None or shard_file.tell() + len(img_bytes) > shard_size:
+            if shard_file is not None:
+                shard_file.close()
+            shard_names.append(f'{split}-{len(shard_names):05d}.bin')
+            shard_file = open(os.path.join(out_path, shard_names[-1]), 'wb')
+        shard_ids[idx] = len(shard_names) - 1
+        offsets[idx] = shard_file.tell()
+        lengths[idx] = len(img_bytes)
+        labels[idx] = int(img_label)
+        shard_file.write(img_bytes)
+    if shard_file is not None:
+        shard_file.close()
+
+    index_file = os.path.join(out_path, f'{split}_index.npz')
+    np.savez(index_file, shard_ids=shard_ids, offsets=offsets, lengths=lengths,
+             labels=labels, shard_names=np.array(shard_names, dtype='str'))
+    print(f'----- Imagenet2012 {split}: {num_samples} samples packed in {len(shard_names)} shards')
+    return index_file
+
+
+class PackedImageNet2012Dataset(Dataset):
+    """Build ImageNet2012 dataset from packed shards, see pack_imagenet_dataset
+
+    Drop-in replacement of ImageNet2012Dataset. Shards are memory-mapped lazily
+    in each process (dataloader workers included), thus opened shards are
+    never pickled to workers.
+
+    Attributes:
+        packed_path: path where shard files and index are stored
+        transform: preprocessing ops to apply on image
+        shard_paths: list of full path of shard files
+        shard_ids: shard id of each sample, samples are stored in shard order
+        offsets: byte offset of each sample in its shard
+        lengths: byte length of each sample
+        label_list: labels of whole dataset
+    """
+
+    def __init__(self, packed_path, mode="train", transform=None):
+        """Init packed ImageNet2012 Dataset with packed path, mode(train/val), and transform"""
+        super().__init__()
+        assert mode in ["train", "val"]
+        self.packed_path = packed_path
+
+        if isinstance(transform, tuple):
+            # training: transform = [transform, mask_generator]
+            self.transform = transform[0]
+            self.mask_generator = transform[1] # if mae finetune, mask_generator is None
+        else:
+            # val: transform = transform
+            self.transform = transform
+            self.mask_generator = None
+
+        split = mode
+        index_file = os.path.join(self.packed_path, f'{split}_index.npz')
+        assert os.path.isfile(index_file), f'{index_file} not exist! see packed_dataset.py'
+        index = np.load(index_file)
+        self.shard_paths = [os.path.join(packed_path, name) for name in index['shard_names']]
+        self.shard_ids = index['shard_ids']
+        self.offsets = index['offsets']
+        self.lengths = index['lengths']
+        self.label_list = index['labels']
+        self._shards = {}
+        print(f'----- Imagenet2012 packed {split} len = {len(self.label_list)}')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def __len__(self):
+        return len(self.label_list)
+
+    def get_shard_ranges(self):
+        """Return [start, end) sample indices of each shard"""
+        bounds = np.searchsorted(self.shard_ids, np.arange(len(self.shard_paths) + 1))
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def load_image(self, index, transform_ops=None):
+        """Decode the image of index from its memory-mapped shard, see convert_image"""
+        shard_id = self.shard_ids[index]
+        if shard_id not in self._shards:
+            self._shards[shard_id] = np.memmap(self.shard_paths[shard_id], dtype='uint8', mode='r')
+        offset = self.offsets[index]
+        img_bytes = self._shards[shard_id][offset: offset + self.lengths[index]]
+        return convert_image(Image.open(io.BytesIO(img_bytes.tobytes())), transform_ops)
+
+    def __getitem__(self, index):
+        data = self.load_image(index, self.transform)
+        data = self.transform(data)
+        if self.mask_generator is not None:
+            mask = self.mask_generator()
+        else:
+            mask = None
+
+        if mask is None:
+            label = int(self.label_list[index])
+            return data, label
+
+        return data, mask
+
+
+class ShardBatchSampler(BatchSampler):
+    """Batch sampler of PackedImageNet2012Dataset for training
+
+    Each epoch, the shards are shuffled and split over ranks, and the shards of
+    a rank are split into one stream per dataloader worker. Each stream reads
+    its shards sequentially through a shuffle buffer, and the batches of the
+    streams are interleaved in turn. Since DataLoader dispatches batches to its
+    workers in turn, each worker keeps reading the same shards (shard affinity)
+    until its stream is exhausted near the end of an epoch. Every rank yields
+    the same number of batches, a rank with fewer samples wraps around its
+    shards, as DistributedBatchSampler pads its indices.
+
+    Args:
+        dataset: PackedImageNet2012Dataset
+        batch_size: int, batch size on each rank
+        num_workers: int, num_workers of the DataLoader. Default: 0
+        buffer_size: int, shuffle buffer size of each stream. Default: 4096
+        shuffle: bool, if True, shards and samples are shuffled. Default: True
+        drop_last: bool, if True, the last incomplete batch is dropped. Default: True
+        num_replicas: int, number of ranks, use the env of paddle.distributed if None
+        rank: int, current rank, use the env of paddle.distributed if None
+    """
+
+    def __init__(self,
+                 dataset,
+                 batch_size,
+                 num_workers=0,
+                 buffer_size=4096,
+                 shuffle=True,
+                 drop_last=True,
+                 num_replicas=None,
+                 rank=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.buffer_size = max(buffer_size, 1)
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.nranks = num_replicas if num_replicas is not None else paddle.distributed.get_world_size()
+        self.local_rank = rank if rank is not None else paddle.distributed.get_rank()
+        self.shard_ranges = dataset.get_shard_ranges()
+        if len(self.shard_ranges) < self.nranks:
+            raise ValueError(f'{len(self.shard_ranges)} shards can not be split over '
+                             f'{self.nranks} ranks, please pack with smaller shard_size')
+        self.num_streams = max(num_workers, 1)
+        self.epoch = 0
+        num_samples = len(dataset) // self.nranks
+        if self.drop_last:
+            self.num_batches = num_samples // batch_size
+        else:
+            self.num_batches = (num_samples + batch_size - 1) // batch_size
+        self.num_samples = num_samples
+
+    def _stream(self, shard_list, rng):
+        """Yield indices of shards sequentially through a shuffle buffer"""
+        buffer = []
+        for shard_id in shard_list:
+            start, end = self.shard_ranges[shard_id]
+            for index in range(start, end):
+                if not self.shuffle:
+                    yield index
+                    continue
+                buffer.append(index)
+                if len(buffer) >= self.buffer_size:
+                    pos = rng.randint(len(buffer))
+                    buffer[pos], buffer[-1] = buffer[-1], buffer[pos]
+                    yield buffer.pop()
+        rng.shuffle(buffer)
+        while buffer:
+            yield buffer.pop()
+
+    def __iter__(self):
+        rng = np.random.RandomState(self.epoch)
+        self.epoch += 1
+        shard_order = np.arange(len(self.shard_ranges))
+        if self.shuffle:
+            rng.shuffle(shard_order)
+        rank_shards = shard_order[self.local_rank::self.nranks]
+        num_streams = min(self.num_streams, len(rank_shards))
+        streams = []
+        num_yielded = 0
+        for batch_id in range(self.num_batches):
+            size = min(self.batch_size, self.num_samples - num_yielded)
+            batch_indices = []
+            while len(batch_indices) < size:
+                if not streams:
+                    # a new pass over the shards of this rank (wrap around)
+                    streams = [self._stream(rank_shards[i::num_streams], rng)
+                               for i in range(num_streams)]
+                stream_id = batch_id % len(streams)
+                index = next(streams[stream_id], None)
+                if index is None:
+                    # an exhausted stream is dropped, the others fill its batches
+                    streams.pop(stream_id)
+                    continue
+                batch_indices.append(index)
+            yield batch_indices
+            num_yielded += size
+
+    def __len__(self):
+        return self.num_batches
+
+    def set_epoch(self, epoch):
+        """Set the epoch which seeds the shuffle of next iteration"""
+        self.epoch = epoch
+
+
+def main():
+    parser = argparse.ArgumentParser('Pack ImageNet2012 into shards')
+    parser.add_argument('--data_path', type=str, required=True)
+    parser.add_argument('--out_path', type=str, required=True)
+    parser.add_argument('--splits', type=str, nargs='+', default=['train', 'val'])
+    parser.add_argument('--shard_size', type=int, default=1 << 30, help='max bytes of a shard')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for split in args.splits:
+        pack_imagenet_dataset(args.data_path,
+                              args.out_path,
+                              is_train=(split == 'train'),
+                              shard_size=args.shard_size,
+                              seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
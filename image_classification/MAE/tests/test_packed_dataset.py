@@ -0,0 +1,75 @@
+#   Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+from paddle.vision import image_load
+from packed_dataset import pack_imagenet_dataset
+from packed_dataset import PackedImageNet2012Dataset
+from packed_dataset import ShardBatchSampler
+
+
+class PackedDatasetTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data_path = tempfile.mkdtemp()
+        cls.packed_path = os.path.join(cls.data_path, 'packed')
+        os.makedirs(os.path.join(cls.data_path, 'train'))
+        rng = np.random.RandomState(0)
+        cls.samples = {}
+        with open(os.path.join(cls.data_path, 'train_list.txt'), 'w') as outfile:
+            for i in range(50):
+                img_path = f'train/{i}.JPEG'
+                img = (rng.rand(16 + i % 5, 20, 3) * 255).astype('uint8')
+                Image.fromarray(img).save(os.path.join(cls.data_path, img_path))
+                outfile.write(f'{img_path} {i // 10}\n')
+                cls.samples[img_path] = i // 10
+        pack_imagenet_dataset(cls.data_path, cls.packed_path, is_train=True, shard_size=4000)
+        cls.dataset = PackedImageNet2012Dataset(cls.packed_path, mode='train')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_path)
+
+    def test_samples(self):
+        self.assertEqual(len(self.dataset), len(self.samples))
+        self.assertGreater(len(self.dataset.shard_paths), 1)
+        ref_images = {p: np.array(image_load(os.path.join(self.data_path, p)).convert('RGB'))
+                      for p in self.samples}
+        for index in range(len(self.dataset)):
+            img = np.array(self.dataset.load_image(index))
+            matched = [p for p, ref in ref_images.items()
+                       if ref.shape == img.shape and np.array_equal(ref, img)]
+            self.assertEqual(len(matched), 1)
+            self.assertEqual(self.samples[matched[0]], self.dataset.label_list[index])
+
+    def test_sampler(self):
+        indices = []
+        for rank in range(2):
+            sampler = ShardBatchSampler(self.dataset, batch_size=4, num_workers=2,
+                                        buffer_size=8, num_replicas=2, rank=rank)
+            batches = list(sampler)
+            self.assertEqual(len(batches), len(sampler))
+            self.assertTrue(all(len(batch) == 4 for batch in batches))
+            indices.extend(sum(batches, []))
+        self.assertTrue(all(0 <= index < len(self.dataset) for index in indices))
+
+        sampler = ShardBatchSampler(self.dataset, batch_size=4, drop_last=False,
+                                    num_replicas=1, rank=0)
+        indices = sum(list(sampler), [])
+        self.assertEqual(sorted(indices), list(range(len(self.dataset))))
@@ -19,7 +19,10 @@ and WarmupCosineScheduler for training
 
 """
 
+import contextlib
 import math
+import paddle
+import paddle.distributed as dist
 from paddle.optimizer.lr import LRScheduler
 
 
@@ -44,6 +47,87 @@ class AverageMeter():
         self.avg = self.sum / self.cnt
 
 
+class DistributedMeter():
+    """ Meter for monitoring metrics (e.g., loss and acc) without per-step sync
+
+    The running sums of metrics are kept as device tensors, thus update does
+    not sync the device. The averages on current and all processes/gpus are
+    fetched and all-reduced at once only when sync is called, e.g., every
+    debug_steps and at the end of epoch. sync is a collective op, it must be
+    called by all processes at the same steps.
+
+    Attributes:
+        names: list of metric names
+        val: dict, metrics of the last update on current process/gpu, set by sync
+        avg: dict, average metrics on current process/gpu, set by sync
+        master_val: dict, metrics of the last update on all processes/gpus, set by sync
+        master_avg: dict, average metrics on all processes/gpus, set by sync
+        num_nonfinite: int, num of non-finite updates on all processes/gpus, set by sync
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.reset()
+
+    def reset(self):
+        """reset all values to zeros"""
+        num_metrics = len(self.names)
+        # [sums of metrics * n, last metrics, sum of n, num of non-finite updates]
+        self.stats = paddle.zeros([num_metrics * 2 + 2], dtype='float32')
+        self.val = {name: 0 for name in self.names}
+        self.avg = {name: 0 for name in self.names}
+        self.master_val = {name: 0 for name in self.names}
+        self.master_avg = {name: 0 for name in self.names}
+        self.num_nonfinite = 0
+
+    def update(self, vals, n=1):
+        """update by vals and n on device, where vals are tensors of metrics averaged over n values"""
+        num_metrics = len(self.names)
+        vals = paddle.concat([val.detach().astype('float32').reshape([1]) for val in vals])
+        nonfinite = paddle.logical_not(paddle.isfinite(vals)).any().astype('float32').reshape([1])
+        n = paddle.full([1], n, dtype='float32')
+        self.stats = paddle.concat([self.stats[:num_metrics] + vals * n,
+                                    vals,
+                                    self.stats[num_metrics * 2:] + paddle.concat([n, nonfinite])])
+
+    def sync(self):
+        """fetch the local averages and all-reduce the master averages"""
+        num_metrics = len(self.names)
+        world_size = dist.get_world_size()
+        stats = self.stats
+        if world_size > 1:
+            master_stats = stats.clone()
+            dist.all_reduce(master_stats)
+            stats = paddle.concat([stats, master_stats])
+        stats = stats.numpy()
+        local_stats, master_stats = stats[:num_metrics * 2 + 2], stats[-(num_metrics * 2 + 2):]
+        for idx, name in enumerate(self.names):
+            self.val[name] = float(local_stats[num_metrics + idx])
+            self.avg[name] = float(local_stats[idx] / max(local_stats[-2], 1))
+            self.master_val[name] = float(master_stats[num_metrics + idx] / world_size)
+            self.master_avg[name] = float(master_stats[idx] / max(master_stats[-2], 1))
+        self.num_nonfinite = int(master_stats[-1])
+
+
+def grad_sync_context(model, sync=True):
+    """Return the context for forward/backward of a (possibly DataParallel) model
+
+    With gradient accumulation, DataParallel all-reduces gradients in every
+    backward by default. On the non-boundary micro-steps (sync is False), the
+    backward runs under model.no_sync(), gradients are accumulated locally and
+    all-reduced once in the backward of the boundary step, which cuts the
+    communication by a factor of accum_iter.
+
+    Args:
+        model: nn.Layer, the model, may be wrapped by paddle.DataParallel
+        sync: bool, if True (boundary step), gradients are all-reduced as usual
+    Returns:
+        context manager, model.no_sync() if sync is False, otherwise a null context
+    """
+    if sync or not hasattr(model, 'no_sync'):
+        return contextlib.nullcontext()
+    return model.no_sync()
+
+
 
 def get_exclude_from_weight_decay_fn(exclude_list=[]):
     """ Set params with no weight decay during the training
@@ -26,6 +26,11 @@ from augment import AutoAugment
 from augment import rand_augment_policy_increasing
 from augment import RandAugment
 from random_erasing import RandomErasing
+from packed_dataset import PackedImageNet2012Dataset
+from packed_dataset import ShardBatchSampler
+from val_cache import CachedValDataset
+from draft_decode import DraftRandomResizedCrop
+from draft_decode import convert_image
 
 
 class ImageNet2012Dataset(Dataset):
@@ -68,7 +73,7 @@ class ImageNet2012Dataset(Dataset):
         return len(self.label_list)
 
     def __getitem__(self, index):
-        data = image_load(self.img_path_list[index]).convert('RGB')
+        data = convert_image(image_load(self.img_path_list[index]), self.transforms)
         data = self.transforms(data)
         label = self.label_list[index]
 
@@ -92,8 +97,9 @@ def get_train_transforms_deit(config):
     aug_op_list = []
     # STEP1: random crop and resize
     aug_op_list.append(
-        transforms.RandomResizedCrop((config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
-                                     scale=(0.08, 1.0), interpolation='bicubic'))
+        DraftRandomResizedCrop((config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
+                               scale=(0.08, 1.0), interpolation='bicubic',
+                               draft=config.DATA.DRAFT_DECODE))
     # STEP2: random horizontalflip
     aug_op_list.append(transforms.RandomHorizontalFlip())
     # STEP3: rand_augment or auto_augment or color jitter
@@ -140,8 +146,9 @@ def get_train_transforms_vit(config):
         transforms_train: transform ops
     """
     transforms_train = transforms.Compose([
-        transforms.RandomResizedCrop(size=(config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
-                                     interpolation='bicubic'),
+        DraftRandomResizedCrop(size=(config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE),
+                               interpolation='bicubic',
+                               draft=config.DATA.DRAFT_DECODE),
         transforms.RandomHorizontalFlip(),
         transforms.ToTensor(),
         transforms.Normalize(mean=config.DATA.IMAGENET_MEAN, std=config.DATA.IMAGENET_STD)])
@@ -185,9 +192,22 @@ def get_dataset(config, is_train=True):
             transform_ops = get_train_transforms_deit(config)
         else:
             transform_ops = get_val_transforms(config)
-        dataset = ImageNet2012Dataset(config.DATA.DATA_PATH,
-                                      is_train=is_train,
-                                      transform_ops=transform_ops)
+        if config.DATA.PACKED_PATH:
+            dataset = PackedImageNet2012Dataset(config.DATA.PACKED_PATH,
+                                                is_train=is_train,
+                                                transform_ops=transform_ops)
+        else:
+            dataset = ImageNet2012Dataset(config.DATA.DATA_PATH,
+                                          is_train=is_train,
+                                          transform_ops=transform_ops)
+        if not is_train and config.DATA.VAL_CACHE_PATH:
+            # deterministic resize and center crop are done once into a cache
+            dataset = CachedValDataset(dataset,
+                                       transform_ops,
+                                       config.DATA.VAL_CACHE_PATH,
+                                       config.DATA.IMAGE_SIZE,
+                                       config.DATA.CROP_PCT,
+                                       num_workers=config.DATA.NUM_WORKERS)
     else:
         raise NotImplementedError(
             "Wrong dataset name: [{config.DATA.DATASET}]. Only 'imagenet2012' is supported now")
@@ -203,11 +223,25 @@ def get_dataloader(config, dataset, is_train=True, use_dist_sampler=False):
         dataset: paddle.io.dataset object
         is_train: bool, when False, shuffle is off and BATCH_SIZE_EVAL is used, default: True
         use_dist_sampler: if True, DistributedBatchSampler is used, default: False
+            for packed training set, ShardBatchSampler is used instead
     Returns:
         dataloader: paddle.io.DataLoader object.
     """
     batch_size = config.DATA.BATCH_SIZE if is_train else config.DATA.BATCH_SIZE_EVAL
 
+    if is_train and isinstance(dataset, PackedImageNet2012Dataset):
+        # packed shards are read sequentially by each worker with a shuffle buffer
+        sampler = ShardBatchSampler(dataset=dataset,
+                                    batch_size=batch_size,
+                                    num_workers=config.DATA.NUM_WORKERS,
+                                    buffer_size=config.DATA.SHUFFLE_BUFFER_SIZE,
+                                    num_replicas=None if use_dist_sampler else 1,
+                                    rank=None if use_dist_sampler else 0)
+        dataloader = DataLoader(dataset=dataset,
+                                batch_sampler=sampler,
+                                num_workers=config.DATA.NUM_WORKERS)
+        return dataloader
+
     if use_dist_sampler is True:
         sampler = DistributedBatchSampler(dataset=dataset,
                                           batch_size=batch_size,
@@ -15,47 +15,153 @@
 """ Implement the Exponential Model Averaging
 This is paddle hack from:
 https://github.com/rwightman/pytorch-image-models/blob/master/timm/utils/model_ema.py
+
+The ema weights are kept in flat contiguous buffers (one per dtype), thus an
+update is a single in-place lerp per buffer instead of a set_value per tensor.
+If the ema is on cpu, the flat buffers are numpy arrays, the model weights are
+copied to host once per update, optionally in a background thread.
 """
 
 import copy
+import threading
+import numpy as np
 import paddle
 
 
+def _is_float(tensor):
+    return tensor.dtype in (paddle.float16, paddle.float32, paddle.float64)
+
+
+def _lerp_(ema, value, weight):
+    """ema = ema + weight * (value - ema) in place, ema and value are both tensors or both arrays"""
+    if isinstance(ema, np.ndarray):
+        np.subtract(value, ema, out=value)
+        value *= weight
+        ema += value
+    elif hasattr(ema, 'lerp_'):
+        ema.lerp_(value, weight)
+    else: # paddle < 2.3
+        ema.scale_(1 - weight).add_(value.scale(weight))
+
+
 class ModelEma:
     """Model Ema
     A moving average is kept of model weights and buffers.
     Note that for multiple gpu, ema must be defined after mode init,
     but before DataParallel.
 
+    Float weights and buffers are averaged in flat buffers grouped by dtype,
+    the ema module is synced from the flat buffers when it is accessed (e.g.,
+    state_dict). Non-float buffers (e.g., relative position index) are constants,
+    they are only copied by set.
+
     Args:
         model: nn.Layer, original modela with learnable params
         decay: float, decay rate for each update, default: 0.999
+        update_every: int, average once every k calls of update, with decay**k
+            to compensate the skipped steps, default: 1
+        async_update: bool, if True and the ema is on cpu, the device to host
+            copy and the averaging run in a background thread, default: False
     """
-    def __init__(self, model, decay=0.999):
-        self.module = copy.deepcopy(model)
-        self.module.eval()
+    def __init__(self, model, decay=0.999, update_every=1, async_update=False):
+        self._module = copy.deepcopy(model)
+        self._module.eval()
         self.decay = decay
+        self.update_every = max(update_every, 1)
+        self.async_update = async_update
+        self.num_calls = 0
+        self._on_cpu = False
+        self._flat = None # {dtype: flat tensor (or array on cpu)}, None if not built
+        self._thread = None
 
-    @paddle.no_grad()
-    def _update(self, model, update_fn):
-        # update ema model parameters by model parameters
-        for (_, ema_param), (_, model_param) in zip(
-            self.module.named_parameters(), model.named_parameters()):
-            ema_param.set_value(copy.deepcopy(update_fn(ema_param, model_param)))
+    @staticmethod
+    def _float_groups(layer):
+        """Group float params and buffers of layer by dtype, in a fixed order"""
+        groups = {}
+        for tensor in list(layer.parameters()) + list(layer.buffers()):
+            if _is_float(tensor):
+                groups.setdefault(str(tensor.dtype), []).append(tensor)
+        return groups
+
+    @staticmethod
+    def _flatten(tensors):
+        return paddle.concat([t.reshape([-1]) for t in tensors])
 
-        # update ema model buffers by model buffers
-        for (_, ema_buf), (_, model_buf) in zip(
-            self.module.named_buffers(), model.named_buffers()):
-            ema_buf.set_value(copy.deepcopy(update_fn(ema_buf, model_buf)))
+    def _wait(self):
+        """Wait for the background update, if any"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
+    def _build_flat(self):
+        """Build the flat buffers from the ema module"""
+        self._flat = {}
+        for dtype, tensors in self._float_groups(self._module).items():
+            if self._on_cpu:
+                self._flat[dtype] = np.concatenate([t.numpy().reshape([-1]) for t in tensors])
+            else:
+                self._flat[dtype] = self._flatten(tensors)
+
+    def _sync_module(self):
+        """Write the flat buffers back to the ema module, the module may be modified
+        by the caller afterwards, thus the flat buffers are rebuilt on next update"""
+        self._wait()
+        if self._flat is None:
+            return
+        for dtype, tensors in self._float_groups(self._module).items():
+            flat = self._flat[dtype]
+            offset = 0
+            for tensor in tensors:
+                numel = int(np.prod(tensor.shape))
+                tensor.set_value(flat[offset: offset + numel].reshape(tensor.shape))
+                offset += numel
+        self._flat = None
+
+    @property
+    def module(self):
+        self._sync_module()
+        return self._module
+
+    @paddle.no_grad()
     def update(self, model):
-        self._update(model, update_fn=lambda e, m: self.decay * e + (1 - self.decay) * m)
+        self.num_calls += 1
+        if self.num_calls % self.update_every != 0:
+            return
+        weight = 1 - self.decay ** self.update_every
+        self._wait()
+        if self._flat is None:
+            self._build_flat()
+        # the model weights are snapshotted by concat before the next optimizer step
+        values = {dtype: self._flatten(tensors)
+                  for dtype, tensors in self._float_groups(model).items()}
+        if not self._on_cpu:
+            for dtype, value in values.items():
+                _lerp_(self._flat[dtype], value, weight)
+            return
 
+        def _update_on_host():
+            for dtype, value in values.items():
+                _lerp_(self._flat[dtype], value.numpy(), weight)
+
+        if self.async_update:
+            self._thread = threading.Thread(target=_update_on_host, daemon=True)
+            self._thread.start()
+        else:
+            _update_on_host()
+
+    @paddle.no_grad()
     def set(self, model):
-        self._update(model, update_fn=lambda e, m: m)
+        self._wait()
+        self._flat = None
+        for ema_tensor, model_tensor in zip(
+            list(self._module.parameters()) + list(self._module.buffers()),
+            list(model.parameters()) + list(model.buffers())):
+            ema_tensor.set_value(model_tensor)
 
     def to(self, device):
-        self.module.to(device)
+        self._sync_module()
+        self._module.to(device)
+        self._on_cpu = str(device).lower().startswith('cpu')
 
     def state_dict(self):
         return self.module.state_dict()
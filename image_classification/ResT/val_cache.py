@@ -0,0 +1,149 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cached validation dataset
+
+The val transforms are deterministic: Resize and CenterCrop are followed by
+ToTensor and Normalize. The resized and center-cropped uint8 images are
+materialized once into a memory-mapped array, then each validation epoch only
+reads the array and applies ToTensor and Normalize, without any decode.
+"""
+
+import os
+import multiprocessing
+import numpy as np
+from paddle.io import Dataset
+from paddle.vision import transforms
+from paddle.vision import image_load
+
+
+def split_val_transforms(transform_ops):
+    """Split val transforms into the deterministic uint8 ops and the tensor ops
+
+    Args:
+        transform_ops: val transforms, e.g., Compose([Resize, CenterCrop, ToTensor, Normalize])
+    Returns:
+        image_ops: ops before ToTensor, applied once when building the cache
+        tensor_ops: ToTensor and the ops after it, applied on each read
+        interpolation: interpolation of the Resize op, part of the cache key
+    """
+    ops = list(transform_ops.transforms)
+    to_tensor_ids = [i for i, op in enumerate(ops) if isinstance(op, transforms.ToTensor)]
+    assert len(to_tensor_ids) == 1, 'val transforms should contain exactly one ToTensor'
+    image_ops = ops[:to_tensor_ids[0]]
+    tensor_ops = ops[to_tensor_ids[0]:]
+    interpolation = [op.interpolation for op in image_ops if isinstance(op, transforms.Resize)]
+    interpolation = interpolation[0] if interpolation else 'none'
+    return image_ops, tensor_ops, interpolation
+
+
+class _ImageOpsWorker():
+    """Load and transform one image of dataset into uint8 (pickled to pool workers)"""
+    def __init__(self, dataset, image_ops):
+        self.dataset = dataset
+        self.image_ops = image_ops
+
+    def __call__(self, index):
+        if hasattr(self.dataset, 'load_image'):
+            image = self.dataset.load_image(index)
+        else:
+            image = image_load(self.dataset.img_path_list[index]).convert('RGB')
+        for op in self.image_ops:
+            image = op(image)
+        return np.asarray(image, dtype='uint8')
+
+
+def build_val_cache(dataset, image_ops, cache_file, num_workers=0):
+    """Write the uint8 images (N, H, W, C) after image_ops and labels (N,) of dataset
+
+    The image array is written into a temp file and renamed when finished,
+    thus an interrupted build is never used as a cache.
+
+    Args:
+        dataset: ImageNet2012Dataset or PackedImageNet2012Dataset
+        image_ops: list of deterministic ops, e.g., [Resize, CenterCrop]
+        cache_file: path of the '.npy' image array, labels are in '*_labels.npy'
+        num_workers: int, number of processes to decode images. Default: 0
+    """
+    worker = _ImageOpsWorker(dataset, image_ops)
+    first = worker(0)
+    tmp_file = cache_file + '.tmp.npy'
+    images = np.lib.format.open_memmap(
+        tmp_file, mode='w+', dtype='uint8', shape=(len(dataset),) + first.shape)
+    if num_workers > 0:
+        with multiprocessing.Pool(num_workers) as pool:
+            for index, image in enumerate(pool.imap(worker, range(len(dataset)), chunksize=64)):
+                images[index] = image
+    else:
+        for index in range(len(dataset)):
+            images[index] = worker(index)
+    images.flush()
+    del images
+    np.save(cache_file[:-len('.npy')] + '_labels.npy', np.asarray(dataset.label_list, dtype='int64'))
+    os.replace(tmp_file, cache_file)
+
+
+class CachedValDataset(Dataset):
+    """Validation dataset read from the cache of resized and center-cropped images
+
+    The cache is keyed by (image size, crop_pct, interpolation) and is built
+    from the wrapped dataset on first use.
+
+    Args:
+        dataset: ImageNet2012Dataset or PackedImageNet2012Dataset of val set
+        transform_ops: val transforms, see get_val_transforms
+        cache_path: path where the cache files are stored
+        image_size: int, DATA.IMAGE_SIZE, part of the cache key
+        crop_pct: float, DATA.CROP_PCT, part of the cache key
+        num_workers: int, number of processes to build the cache. Default: 0
+
+    Attributes:
+        cache_file: path of the memory-mapped uint8 images (N, H, W, C)
+        tensor_ops: ToTensor and Normalize ops applied on each read
+        label_list: labels of whole dataset
+    """
+    def __init__(self, dataset, transform_ops, cache_path, image_size, crop_pct, num_workers=0):
+        super().__init__()
+        image_ops, self.tensor_ops, interpolation = split_val_transforms(transform_ops)
+        os.makedirs(cache_path, exist_ok=True)
+        self.cache_file = os.path.join(
+            cache_path, f'val_{image_size}_{crop_pct}_{interpolation}.npy')
+        if not os.path.isfile(self.cache_file):
+            print(f'----- Building val cache {self.cache_file}')
+            build_val_cache(dataset, image_ops, self.cache_file, num_workers)
+        self.label_list = np.load(self.cache_file[:-len('.npy')] + '_labels.npy')
+        if len(self.label_list) != len(dataset):
+            raise ValueError(f'{self.cache_file} has {len(self.label_list)} samples but the '
+                             f'dataset has {len(dataset)}, please remove the cache to rebuild')
+        self._images = None
+        print(f'----- Imagenet2012 cached val len = {len(self.label_list)}')
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.label_list)
+
+    def __getitem__(self, index):
+        if self._images is None:
+            self._images = np.load(self.cache_file, mmap_mode='r')
+        data = np.array(self._images[index])
+        for op in self.tensor_ops:
+            data = op(data)
+        label = int(self.label_list[index])
+
+        return data, label
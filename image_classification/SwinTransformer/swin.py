@@ -20,8 +20,11 @@ A Paddle Implementation of Swin Transformer (Swin) as described in:
 "Swin Transformer: Hierarchical Vision Transformer using Shifted Windows"
     - Paper Link: https://arxiv.org/abs/2103.14030
 """
+from collections import OrderedDict
 import paddle
 import paddle.nn as nn
+import paddle.nn.functional as F
+from paddle.distributed.fleet.utils import recompute
 from droppath import DropPath
 
 
@@ -116,11 +119,18 @@ class PatchMerging(nn.Layer):
         bias_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.Constant(0.0))
         return weight_attr, bias_attr
 
-    def forward(self, x):
-        h, w = self.input_resolution
+    def forward(self, x, h=None, w=None):
+        if h is None:
+            h, w = self.input_resolution
         b, _, c = x.shape
         x = x.reshape([b, h, w, c])
 
+        # pad odd feature maps (dynamic shape)
+        if h % 2 == 1 or w % 2 == 1:
+            x = x.transpose([0, 3, 1, 2])  # [B, C, H, W]
+            x = F.pad(x, [0, w % 2, 0, h % 2])
+            x = x.transpose([0, 2, 3, 1])  # [B, H, W, C]
+
         x0 = x[:, 0::2, 0::2, :]  # [B, H/2, W/2, C]
         x1 = x[:, 1::2, 0::2, :]  # [B, H/2, W/2, C]
         x2 = x[:, 0::2, 1::2, :]  # [B, H/2, W/2, C]
@@ -243,6 +253,8 @@ class WindowAttention(nn.Layer):
                               bias_attr=b_attr_2)
         self.proj_dropout = nn.Dropout(dropout)
         self.softmax = nn.Softmax(axis=-1)
+        # eval only: (mask, attn_bias) of the last forward, see get_cached_attn_bias
+        self._attn_bias_cache = None
 
     def _init_weights(self):
         weight_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
@@ -265,12 +277,14 @@ class WindowAttention(nn.Layer):
         relative_position_bias = paddle.index_select(x=table, index=index)
         return relative_position_bias
 
-    def forward(self, x, mask=None):
-        qkv = self.qkv(x).chunk(3, axis=-1)  # list of 3 elements
-        q, k, v = map(self.transpose_multihead, qkv)
-        q = q * self.scale
-        attn = paddle.matmul(q, k, transpose_y=True)
+    def get_attn_bias(self, mask=None):
+        """Return the additive attention bias: relative position bias (+ shifted window mask)
 
+        Args:
+            mask: tensor, [nW, window_h*window_w, window_h*window_w], default: None
+        Returns:
+            attn_bias: tensor, [1 or nW, num_heads, window_h*window_w, window_h*window_w]
+        """
         relative_position_bias = self.get_relative_pos_bias_from_pos_index()
 
         relative_position_bias = relative_position_bias.reshape(
@@ -280,17 +294,48 @@ class WindowAttention(nn.Layer):
 
         # nH, window_h*window_w, window_h*window_w
         relative_position_bias = relative_position_bias.transpose([2, 0, 1])
-        attn = attn + relative_position_bias.unsqueeze(0)
+        attn_bias = relative_position_bias.unsqueeze(0)
+        if mask is not None:
+            attn_bias = attn_bias + mask.unsqueeze(1)
+        return attn_bias
+
+    def get_cached_attn_bias(self, mask=None):
+        """Return get_attn_bias(mask), materialized once in eval mode
+
+        In train mode the bias is computed in every forward and the cache is
+        dropped. In eval mode, the bias computed without grad (e.g., under
+        paddle.no_grad) is kept for the last mask until clear_attn_bias_cache is
+        called, which is done by train(), eval() and set_state_dict of SwinTransformer.
+        """
+        if self.training:
+            self._attn_bias_cache = None
+            return self.get_attn_bias(mask)
+        if self._attn_bias_cache is not None and self._attn_bias_cache[0] is mask:
+            return self._attn_bias_cache[1]
+        attn_bias = self.get_attn_bias(mask)
+        if attn_bias.stop_gradient:
+            self._attn_bias_cache = (mask, attn_bias)
+        return attn_bias
+
+    def clear_attn_bias_cache(self):
+        self._attn_bias_cache = None
 
+    def forward(self, x, mask=None):
+        qkv = self.qkv(x).chunk(3, axis=-1)  # list of 3 elements
+        q, k, v = map(self.transpose_multihead, qkv)
+        q = q * self.scale
+        attn = paddle.matmul(q, k, transpose_y=True)
+
+        attn_bias = self.get_cached_attn_bias(mask)
         if mask is not None:
             nW = mask.shape[0]
             attn = attn.reshape(
                 [x.shape[0] // nW, nW, self.num_heads, x.shape[1], x.shape[1]])
-            attn += mask.unsqueeze(1).unsqueeze(0)
+            attn = attn + attn_bias.unsqueeze(0)
             attn = attn.reshape([-1, self.num_heads, x.shape[1], x.shape[1]])
-            attn = self.softmax(attn)
         else:
-            attn = self.softmax(attn)
+            attn = attn + attn_bias
+        attn = self.softmax(attn)
 
         attn = self.attn_dropout(attn)
 
@@ -339,6 +384,43 @@ def windows_reverse(windows, window_size, H, W):
     return x
 
 
+def get_shifted_windows_mask(H, W, window_size, shift_size):
+    """ Attention mask of shifted windows
+    Args:
+        H: (int) height of feature map, multiple of window_size
+        W: (int) width of feature map, multiple of window_size
+        window_size: (int) window size
+        shift_size: (int) shift size of the windows
+
+    Returns:
+        attn_mask: (n_windows, window_size*window_size, window_size*window_size),
+            -100 between tokens from different regions and 0 otherwise
+    """
+    img_mask = paddle.zeros((1, H, W, 1))
+    h_slices = (slice(0, -window_size),
+                slice(-window_size, -shift_size),
+                slice(-shift_size, None))
+    w_slices = (slice(0, -window_size),
+                slice(-window_size, -shift_size),
+                slice(-shift_size, None))
+    cnt = 0
+    for h in h_slices:
+        for w in w_slices:
+            img_mask[:, h, w, :] = cnt
+            cnt += 1
+
+    mask_windows = windows_partition(img_mask, window_size)
+    mask_windows = mask_windows.reshape((-1, window_size * window_size))
+    attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
+    attn_mask = paddle.where(attn_mask != 0,
+                             paddle.ones_like(attn_mask) * float(-100.0),
+                             attn_mask)
+    attn_mask = paddle.where(attn_mask == 0,
+                             paddle.zeros_like(attn_mask),
+                             attn_mask)
+    return attn_mask
+
+
 class SwinTransformerBlock(nn.Layer):
     """Swin transformer block
 
@@ -356,11 +438,14 @@ class SwinTransformerBlock(nn.Layer):
         dropout: float, dropout for output, default: 0.
         attention_dropout: float, dropout of attention, default: 0.
         droppath: float, drop path rate, default: 0.
+        dynamic_shape: bool, if True, window_size and shift_size are not fitted to
+            input_resolution, the shift is skipped in forward if the feature map is
+            not larger than the window, default: False
     """
 
     def __init__(self, dim, input_resolution, num_heads, window_size=7, shift_size=0,
                  mlp_ratio=4., qkv_bias=True, qk_scale=None, dropout=0.,
-                 attention_dropout=0., droppath=0.):
+                 attention_dropout=0., droppath=0., dynamic_shape=False):
         super().__init__()
         self.dim = dim
         self.input_resolution = input_resolution
@@ -368,7 +453,7 @@ class SwinTransformerBlock(nn.Layer):
         self.window_size = window_size
         self.shift_size = shift_size
         self.mlp_ratio = mlp_ratio
-        if min(self.input_resolution) <= self.window_size:
+        if min(self.input_resolution) <= self.window_size and not dynamic_shape:
             self.shift_size = 0
             self.window_size = min(self.input_resolution)
 
@@ -395,30 +480,10 @@ class SwinTransformerBlock(nn.Layer):
                        hidden_features=int(dim*mlp_ratio),
                        dropout=dropout)
 
-        if self.shift_size > 0:
+        # in dynamic shape mode, the mask is given by SwinTransformerStage.get_attn_mask
+        if self.shift_size > 0 and not dynamic_shape:
             H, W = self.input_resolution
-            img_mask = paddle.zeros((1, H, W, 1))
-            h_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size, -self.shift_size),
-                        slice(-self.shift_size, None))
-            w_slices = (slice(0, -self.window_size),
-                        slice(-self.window_size, -self.shift_size),
-                        slice(-self.shift_size, None))
-            cnt = 0
-            for h in h_slices:
-                for w in w_slices:
-                    img_mask[:, h, w, :] = cnt
-                    cnt += 1
-
-            mask_windows = windows_partition(img_mask, self.window_size)
-            mask_windows = mask_windows.reshape((-1, self.window_size * self.window_size))
-            attn_mask = mask_windows.unsqueeze(1) - mask_windows.unsqueeze(2)
-            attn_mask = paddle.where(attn_mask != 0,
-                                     paddle.ones_like(attn_mask) * float(-100.0),
-                                     attn_mask)
-            attn_mask = paddle.where(attn_mask == 0,
-                                     paddle.zeros_like(attn_mask),
-                                     attn_mask)
+            attn_mask = get_shifted_windows_mask(H, W, self.window_size, self.shift_size)
         else:
             attn_mask = None
 
@@ -429,8 +494,18 @@ class SwinTransformerBlock(nn.Layer):
         bias_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.Constant(0.0))
         return weight_attr, bias_attr
 
-    def forward(self, x):
-        H, W = self.input_resolution
+    def forward(self, x, H=None, W=None, attn_mask=None):
+        """Forward of the block
+
+        Args:
+            x: tensor, [batch, H*W, c]
+            H, W: int, size of the feature map (dynamic shape), default: input_resolution
+            attn_mask: tensor, mask of the shifted windows of the padded feature map,
+                used with H and W, see SwinTransformerStage.get_attn_mask
+        """
+        if H is None:
+            H, W = self.input_resolution
+            attn_mask = self.attn_mask
         B, L, C = x.shape
         h = x
         x = self.norm1(x)  # [batch, h*w, c]
@@ -438,9 +513,20 @@ class SwinTransformerBlock(nn.Layer):
         new_shape = [B, H, W, C]
         x = x.reshape(new_shape)  # [batch, h, w, c]
 
-        if self.shift_size > 0:
+        # pad feature maps to multiples of window size (dynamic shape)
+        pad_r = (self.window_size - W % self.window_size) % self.window_size
+        pad_b = (self.window_size - H % self.window_size) % self.window_size
+        if pad_r > 0 or pad_b > 0:
+            x = x.transpose([0, 3, 1, 2])  # [batch, c, h, w]
+            x = F.pad(x, [0, pad_r, 0, pad_b])
+            x = x.transpose([0, 2, 3, 1])  # [batch, hp, wp, c]
+        Hp, Wp = H + pad_b, W + pad_r
+
+        # no shift if the feature map is not larger than the window (dynamic shape)
+        shift_size = self.shift_size if min(H, W) > self.window_size else 0
+        if shift_size > 0:
             shifted_x = paddle.roll(x,
-                                    shifts=(-self.shift_size, -self.shift_size),
+                                    shifts=(-shift_size, -shift_size),
                                     axis=(1, 2)) # [batch, h, w, c]
         else:
             shifted_x = x
@@ -449,20 +535,22 @@ class SwinTransformerBlock(nn.Layer):
         x_windows = x_windows.reshape(
             [-1, self.window_size * self.window_size, C])  # [batch*n_windows, 7*7, c]
 
-        attn_windows = self.attn(x_windows, mask=self.attn_mask)  # [batch*n_windows, 7*7, c]
+        attn_windows = self.attn(x_windows, mask=attn_mask)  # [batch*n_windows, 7*7, c]
         attn_windows = attn_windows.reshape(
             [-1, self.window_size, self.window_size, C])  # [batch*n_windows, 7, 7, c]
 
-        shifted_x = windows_reverse(attn_windows, self.window_size, H, W)   # [batch, h, w, c]
+        shifted_x = windows_reverse(attn_windows, self.window_size, Hp, Wp)   # [batch, h, w, c]
 
         # reverse cyclic shift
-        if self.shift_size > 0:
+        if shift_size > 0:
             x = paddle.roll(shifted_x,
-                            shifts=(self.shift_size, self.shift_size),
+                            shifts=(shift_size, shift_size),
                             axis=(1, 2))
         else:
             x = shifted_x
 
+        if pad_r > 0 or pad_b > 0:
+            x = x[:, :H, :W, :]
         x = x.reshape([B, H*W, C])  # [batch, h*w, c]
 
         if self.drop_path is not None:
@@ -493,14 +581,25 @@ class SwinTransformerStage(nn.Layer):
         depth: list, num of blocks in each stage
         blocks: nn.LayerList, contains SwinTransformerBlocks for one stage
         downsample: PatchMerging, patch merging layer, none if last stage
+        recompute_interval: int, activations of every k-th block are recomputed
+            in backward instead of being kept, 0 to disable
+        attn_mask_cache_size: int, number of padded feature map sizes whose shifted
+            windows mask is cached (dynamic shape), default: 8
+        dynamic_shape: bool, if True, blocks are built for inputs of any resolution,
+            see SwinTransformerBlock, default: False
     """
     def __init__(self, dim, input_resolution, depth, num_heads, window_size,
                  mlp_ratio=4., qkv_bias=True, qk_scale=None, dropout=0.,
-                 attention_dropout=0., droppath=0., downsample=None):
+                 attention_dropout=0., droppath=0., downsample=None, recompute_interval=0,
+                 attn_mask_cache_size=8, dynamic_shape=False):
         super().__init__()
         self.dim = dim
         self.input_resolution = input_resolution
         self.depth = depth
+        self.recompute_interval = recompute_interval
+        self.attn_mask_cache_size = attn_mask_cache_size
+        # LRU of the shifted windows masks, keyed by padded feature map size
+        self._attn_mask_cache = OrderedDict()
 
         self.blocks = nn.LayerList()
         for i in range(depth):
@@ -512,18 +611,54 @@ class SwinTransformerStage(nn.Layer):
                     mlp_ratio=mlp_ratio,
                     qkv_bias=qkv_bias, qk_scale=qk_scale,
                     dropout=dropout, attention_dropout=attention_dropout,
-                    droppath=droppath[i] if isinstance(droppath, list) else droppath))
+                    droppath=droppath[i] if isinstance(droppath, list) else droppath,
+                    dynamic_shape=dynamic_shape))
 
         if downsample is not None:
             self.downsample = downsample(input_resolution, dim=dim)
         else:
             self.downsample = None
 
-    def forward(self, x):
-        for block in self.blocks:
-            x = block(x)
+    def get_attn_mask(self, H, W):
+        """Return the mask of the shifted windows for the feature map of H x W
+
+        The mask only depends on the padded size, it is built once per size and
+        the same tensor is returned for the same size, thus the attention bias
+        cached by WindowAttention in eval mode stays valid for consecutive inputs
+        of the same size. None if no block of the stage is shifted, or if the
+        feature map is not larger than the window (the shift is skipped).
+        """
+        shifted_blocks = [block for block in self.blocks if block.shift_size > 0]
+        if not shifted_blocks:
+            return None
+        window_size = shifted_blocks[0].window_size
+        shift_size = shifted_blocks[0].shift_size
+        if min(H, W) <= window_size:
+            return None
+        Hp = (H + window_size - 1) // window_size * window_size
+        Wp = (W + window_size - 1) // window_size * window_size
+        if (Hp, Wp) in self._attn_mask_cache:
+            self._attn_mask_cache.move_to_end((Hp, Wp))
+            return self._attn_mask_cache[(Hp, Wp)]
+        with paddle.no_grad():
+            attn_mask = get_shifted_windows_mask(Hp, Wp, window_size, shift_size)
+        self._attn_mask_cache[(Hp, Wp)] = attn_mask
+        if len(self._attn_mask_cache) > self.attn_mask_cache_size:
+            self._attn_mask_cache.popitem(last=False)
+        return attn_mask
+
+    def forward(self, x, H=None, W=None):
+        """Forward of the stage, H and W are the size of x in dynamic shape mode,
+        None to use input_resolution"""
+        attn_mask = self.get_attn_mask(H, W) if H is not None else None
+        for idx, block in enumerate(self.blocks):
+            block_attn_mask = attn_mask if block.shift_size > 0 else None
+            if self.training and self.recompute_interval > 0 and idx % self.recompute_interval == 0:
+                x = recompute(block, x, H, W, block_attn_mask)
+            else:
+                x = block(x, H, W, block_attn_mask)
         if self.downsample is not None:
-            x = self.downsample(x)
+            x = self.downsample(x, H, W)
         return x
 
 
@@ -551,6 +686,10 @@ class SwinTransformer(nn.Layer):
         norm: nn.LayerNorm, norm layer applied after transformer
         avgpool: nn.AveragePool2D, pooling layer before classifer
         fc: nn.Linear, classifier op.
+        recompute_interval: int or list, recompute activations of every k-th block
+            in backward to save memory, a list sets k of each stage, 0 to disable
+        dynamic_shape: bool, if True, inputs of any resolution are supported, feature
+            maps are padded to multiples of window size, default: False
     """
     def __init__(self,
                  image_size=224,
@@ -567,8 +706,12 @@ class SwinTransformer(nn.Layer):
                  dropout=0.,
                  attention_dropout=0.,
                  droppath=0.,
-                 ape=False):
+                 ape=False,
+                 recompute_interval=0,
+                 dynamic_shape=False):
         super().__init__()
+        assert not (ape and dynamic_shape), 'dynamic_shape does not support ape'
+        self.dynamic_shape = dynamic_shape
         self.num_classes = num_classes
         self.num_stages = len(depths)
         self.embed_dim = embed_dim
@@ -594,6 +737,9 @@ class SwinTransformer(nn.Layer):
         self.position_dropout = nn.Dropout(dropout)
         depth_decay = [x.item() for x in paddle.linspace(0, droppath, sum(depths))]
 
+        if not isinstance(recompute_interval, (list, tuple)):
+            recompute_interval = [recompute_interval] * self.num_stages
+
         self.stages = nn.LayerList()
         for stage_idx in range(self.num_stages):
             stage = SwinTransformerStage(
@@ -613,6 +759,8 @@ class SwinTransformer(nn.Layer):
                     sum(depths[:stage_idx]):sum(depths[:stage_idx+1])],
                 downsample=PatchMerging if (
                     stage_idx < self.num_stages-1) else None,
+                recompute_interval=recompute_interval[stage_idx],
+                dynamic_shape=dynamic_shape,
                 )
             self.stages.append(stage)
 
@@ -638,14 +786,63 @@ class SwinTransformer(nn.Layer):
         bias_attr = paddle.ParamAttr(initializer=paddle.nn.initializer.Constant(0.0))
         return weight_attr, bias_attr
 
+    def clear_attn_bias_cache(self):
+        """Drop the attention bias cached in eval mode, see WindowAttention"""
+        for layer in self.sublayers():
+            if isinstance(layer, WindowAttention):
+                layer.clear_attn_bias_cache()
+
+    def train(self, *args, **kwargs):
+        self.clear_attn_bias_cache()
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        self.clear_attn_bias_cache()
+        return super().eval()
+
+    def set_state_dict(self, state_dict, *args, **kwargs):
+        self.clear_attn_bias_cache()
+        state_dict = self.resize_relative_position(state_dict)
+        return super().set_state_dict(state_dict, *args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
+    def resize_relative_position(self, state_dict):
+        """Return state_dict with relative position tensors resized to the window sizes of the model
+
+        The relative_position_bias_table of a different window size (e.g., a checkpoint
+        trained at another resolution) is bicubic interpolated, the relative_position_index
+        and attn_mask buffers of a different size are replaced by the ones of the model.
+        """
+        resized_state_dict = None
+        for key, value in self.state_dict().items():
+            if key not in state_dict or list(state_dict[key].shape) == list(value.shape):
+                continue
+            if resized_state_dict is None:
+                resized_state_dict = dict(state_dict)
+            if key.endswith('relative_position_bias_table'):
+                resized_state_dict[key] = interpolate_relative_position_bias_table(
+                    paddle.to_tensor(state_dict[key]), value.shape[0])
+            elif key.endswith(('relative_position_index', 'attn_mask')):
+                resized_state_dict[key] = value
+        return state_dict if resized_state_dict is None else resized_state_dict
+
     def forward_features(self, x):
+        H = x.shape[2] // self.patch_embedding.patch_size[0]
+        W = x.shape[3] // self.patch_embedding.patch_size[1]
         x = self.patch_embedding(x)  # [batch, h*w, embed_dim]
         if self.ape:
             x = x + self.absolute_positional_embedding
         x = self.position_dropout(x)  # [batch, h*w, embed_dim]
 
         for stage in self.stages:
-            x = stage(x)  # stage1-4: [b, 784, 192], [b, 196, 384], [b, 49, 768], [b, 49, 768]
+            if self.dynamic_shape:
+                x = stage(x, H, W)
+                if stage.downsample is not None:
+                    H, W = (H + 1) // 2, (W + 1) // 2
+            else:
+                x = stage(x)  # stage1-4: [b, 784, 192], [b, 196, 384], [b, 49, 768], [b, 49, 768]
 
         x = self.norm(x)  # [batch, h*w, embed_dim]
         x = x.transpose([0, 2, 1])
@@ -659,6 +856,23 @@ class SwinTransformer(nn.Layer):
         return x
 
 
+def interpolate_relative_position_bias_table(table, num_relative_positions):
+    """ Bicubic interpolate the relative position bias table to another window size
+    Args:
+        table: Tensor, shape=[(2*window_size-1)**2, num_heads]
+        num_relative_positions: int, (2*new_window_size-1)**2
+
+    Returns:
+        table: Tensor, shape=[num_relative_positions, num_heads]
+    """
+    src_size = int(table.shape[0] ** 0.5)
+    dst_size = int(num_relative_positions ** 0.5)
+    table = table.transpose([1, 0]).reshape([1, -1, src_size, src_size])
+    table = F.interpolate(table, size=(dst_size, dst_size), mode='bicubic', align_corners=False)
+    table = table.reshape([-1, dst_size * dst_size]).transpose([1, 0])
+    return table
+
+
 def build_swin(config):
     """build swin model from config"""
     model = SwinTransformer(image_size=config.DATA.IMAGE_SIZE,
@@ -675,5 +889,7 @@ def build_swin(config):
                             window_size=config.MODEL.WINDOW_SIZE,
                             dropout=config.MODEL.DROPOUT,
                             attention_dropout=config.MODEL.ATTENTION_DROPOUT,
-                            droppath=config.MODEL.DROPPATH)
+                            droppath=config.MODEL.DROPPATH,
+                            recompute_interval=config.MODEL.RECOMPUTE_INTERVAL,
+                            dynamic_shape=config.MODEL.DYNAMIC_SHAPE)
     return model
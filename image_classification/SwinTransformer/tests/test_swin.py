@@ -0,0 +1,67 @@
+#   Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import numpy as np
+import paddle
+from config import *
+from swin import build_swin
+
+
+class SwinDynamicShapeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        paddle.set_device('cpu')
+        cls.config = get_config()
+        cls.config.defrost()
+        cls.config.MODEL.PATCH_SIZE = 4
+        cls.config.MODEL.STAGE_DEPTHS = [2, 2, 2, 2]
+        cls.config.MODEL.DROPPATH = 0.0
+        cls.config.freeze()
+
+    @classmethod
+    def tearDown(cls):
+        pass
+
+    def build_model(self, image_size, dynamic_shape):
+        config = SwinDynamicShapeTest.config.clone()
+        config.defrost()
+        config.DATA.IMAGE_SIZE = image_size
+        config.MODEL.DYNAMIC_SHAPE = dynamic_shape
+        config.freeze()
+        model = build_swin(config)
+        model.eval()
+        return model
+
+    # @unittest.skip('skip for debug')
+    def test_dynamic_equals_static(self):
+        # dynamic model built at 224 must match a static model built at 448
+        static_model = self.build_model(448, dynamic_shape=False)
+        dynamic_model = self.build_model(224, dynamic_shape=True)
+        dynamic_model.set_state_dict(static_model.state_dict())
+
+        x = paddle.to_tensor(np.random.randn(2, 3, 448, 448).astype('float32'))
+        with paddle.no_grad():
+            out_static = static_model(x)
+            out_dynamic = dynamic_model(x)
+        self.assertEqual(out_dynamic.shape, [2, 1000])
+        np.testing.assert_allclose(out_dynamic.numpy(), out_static.numpy(), atol=1e-5)
+
+    # @unittest.skip('skip for debug')
+    def test_dynamic_odd_size(self):
+        model = self.build_model(224, dynamic_shape=True)
+        x = paddle.to_tensor(np.random.randn(1, 3, 200, 264).astype('float32'))
+        with paddle.no_grad():
+            out = model(x)
+        self.assertEqual(out.shape, [1, 1000])
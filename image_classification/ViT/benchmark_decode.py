@@ -0,0 +1,86 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the samples/sec of a single dataloader worker for the training
+transforms, with full decoding (RandomResizedCrop) and crop-aware draft
+decoding (DraftRandomResizedCrop). Synthetic JPEGs are used if no data_path
+is given.
+
+Usage:
+    python benchmark_decode.py -data_path /dataset/imagenet -num_samples 2000
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+import paddle
+from config import get_config
+from datasets import ImageNet2012Dataset
+from datasets import get_train_transforms
+
+
+def write_synthetic_dataset(data_path, num_samples, image_size):
+    """Write random smooth JPEGs (quality 90) and train_list.txt"""
+    os.makedirs(os.path.join(data_path, 'train'), exist_ok=True)
+    rng = np.random.RandomState(0)
+    with open(os.path.join(data_path, 'train_list.txt'), 'w') as outfile:
+        for idx in range(num_samples):
+            low = (rng.rand(image_size[0] // 16, image_size[1] // 16, 3) * 255).astype('uint8')
+            img = Image.fromarray(low).resize((image_size[1], image_size[0]), Image.BICUBIC)
+            img_path = f'train/{idx}.JPEG'
+            img.save(os.path.join(data_path, img_path), quality=90)
+            outfile.write(f'{img_path} {idx % 1000}\n')
+
+
+def benchmark(dataset, num_samples):
+    """Return samples/sec of reading num_samples from dataset in this process"""
+    np.random.seed(0)
+    start = time.time()
+    for idx in range(num_samples):
+        dataset[idx % len(dataset)]
+    return num_samples / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser('Benchmark of crop-aware draft decoding')
+    parser.add_argument('-data_path', type=str, default=None)
+    parser.add_argument('-num_samples', type=int, default=500)
+    parser.add_argument('-image_size', type=int, default=224)
+    parser.add_argument('-synthetic_size', type=int, nargs=2, default=[375, 500],
+                        help='(h, w) of synthetic JPEGs, the typical ImageNet size')
+    args = parser.parse_args()
+    paddle.set_device('cpu')
+
+    data_path = args.data_path
+    if data_path is None:
+        data_path = tempfile.mkdtemp()
+        write_synthetic_dataset(data_path, min(args.num_samples, 200), args.synthetic_size)
+
+    config = get_config()
+    config.defrost()
+    config.DATA.IMAGE_SIZE = args.image_size
+    for draft in [False, True]:
+        config.DATA.DRAFT_DECODE = draft
+        dataset = ImageNet2012Dataset(data_path, is_train=True,
+                                      transform_ops=get_train_transforms(config))
+        samples_per_sec = benchmark(dataset, args.num_samples)
+        print(f'draft decode: {draft}, {samples_per_sec:.1f} samples/sec per worker')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the memory and throughput of activation recomputation
+(MODEL.RECOMPUTE_INTERVAL) on a single gpu. For each recompute interval, the
+batch size is doubled until out of memory, and the step time (forward,
+backward and optimizer step with AMP) and the peak memory of each batch size
+are reported.
+
+Usage:
+    python benchmark_recompute.py -cfg ./configs/vit_large_patch16_384.yaml -intervals 0 1 2
+"""
+
+import time
+import argparse
+import paddle
+from config import get_config
+from vit import build_vit as build_model
+
+
+def benchmark(config, batch_size, num_steps):
+    """Return (step time in ms, peak memory in MB) of training steps with batch_size"""
+    model = build_model(config)
+    model.train()
+    optimizer = paddle.optimizer.AdamW(learning_rate=1e-4, parameters=model.parameters())
+    scaler = paddle.amp.GradScaler()
+    criterion = paddle.nn.CrossEntropyLoss()
+    images = paddle.randn([batch_size, 3, config.DATA.IMAGE_SIZE, config.DATA.IMAGE_SIZE])
+    labels = paddle.randint(0, config.MODEL.NUM_CLASSES, [batch_size])
+    use_gpu = paddle.is_compiled_with_cuda() and 'gpu' in paddle.get_device()
+    if use_gpu:
+        paddle.device.cuda.empty_cache()
+        if hasattr(paddle.device.cuda, 'reset_max_memory_allocated'):
+            paddle.device.cuda.reset_max_memory_allocated()
+    step_times = []
+    for _ in range(num_steps + 2):  # the first 2 steps are warmup
+        start = time.time()
+        with paddle.amp.auto_cast():
+            loss = criterion(model(images), labels)
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.clear_grad()
+        loss.numpy()  # wait for the step
+        step_times.append(time.time() - start)
+    peak_memory = paddle.device.cuda.max_memory_allocated() / 2**20 if use_gpu else float('nan')
+    return sum(step_times[2:]) / num_steps * 1000, peak_memory
+
+
+def is_out_of_memory(error):
+    return 'out of memory' in str(error).lower() or 'resourceexhausted' in type(error).__name__.lower()
+
+
+def main():
+    parser = argparse.ArgumentParser('Benchmark of activation recomputation')
+    parser.add_argument('-cfg', type=str, default=None)
+    parser.add_argument('-image_size', type=int, default=None)
+    parser.add_argument('-intervals', type=int, nargs='+', default=[0, 1],
+                        help='values of MODEL.RECOMPUTE_INTERVAL, 0 to disable')
+    parser.add_argument('-start_batch_size', type=int, default=8)
+    parser.add_argument('-max_batch_size', type=int, default=1024)
+    parser.add_argument('-num_steps', type=int, default=5)
+    args = parser.parse_args()
+
+    config = get_config(args.cfg)
+    config.defrost()
+    if args.image_size:
+        config.DATA.IMAGE_SIZE = args.image_size
+
+    print('interval | batch size | step time (ms) | images/sec | peak memory (MB)')
+    for interval in args.intervals:
+        config.MODEL.RECOMPUTE_INTERVAL = interval
+        batch_size = args.start_batch_size
+        max_batch_size = None
+        while batch_size <= args.max_batch_size:
+            try:
+                step_time, peak_memory = benchmark(config, batch_size, args.num_steps)
+            except (MemoryError, RuntimeError, SystemError) as error:
+                if not is_out_of_memory(error):
+                    raise
+                break
+            max_batch_size = batch_size
+            print(f'{interval:8d} | {batch_size:10d} | {step_time:14.1f} | '
+                  f'{batch_size / step_time * 1000:10.1f} | {peak_memory:16.0f}')
+            batch_size *= 2
+        print(f'----- recompute interval {interval}: max batch size {max_batch_size}')
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,8 @@ A Paddle Implementation of Vision Transformer (ViT) as described in:
 """
 import paddle
 import paddle.nn as nn
+from paddle.distributed.fleet.utils import recompute
+from interpolate_position_embedding import PositionEmbeddingInterpolation
 
 
 class Identity(nn.Layer):
@@ -263,6 +265,8 @@ class Encoder(nn.Layer):
     Attributes:
         layers: nn.LayerList contains multiple EncoderLayers
         encoder_norm: nn.LayerNorm which is applied after last encoder layer
+        recompute_interval: int, activations of every k-th layer are recomputed
+            in backward instead of being kept, 0 to disable
     """
     def __init__(self,
                  embed_dim,
@@ -273,8 +277,10 @@ class Encoder(nn.Layer):
                  mlp_ratio=4.0,
                  dropout=0.,
                  attention_dropout=0.,
-                 droppath=0.):
+                 droppath=0.,
+                 recompute_interval=0):
         super().__init__()
+        self.recompute_interval = recompute_interval
         # stochatic depth decay
         depth_decay = [x.item() for x in paddle.linspace(0, droppath, depth)]
 
@@ -302,8 +308,11 @@ class Encoder(nn.Layer):
         return weight_attr, bias_attr
 
     def forward(self, x):
-        for layer in self.layers:
-            x = layer(x)
+        for idx, layer in enumerate(self.layers):
+            if self.training and self.recompute_interval > 0 and idx % self.recompute_interval == 0:
+                x = recompute(layer, x)
+            else:
+                x = layer(x)
         x = self.encoder_norm(x)
         return x
 
@@ -329,6 +338,8 @@ class VisionTransformer(nn.Layer):
         attention_dropout: float, dropout rate for attention layers default: 0.
         droppath: float, droppath rate for droppath layers, default: 0.
         representation_size: int, set representation layer (pre-logits) if set, default: None
+        recompute_interval: int, recompute activations of every k-th transformer block in
+            backward to save memory (gradient checkpointing), 0 to disable, default: 0
     """
     def __init__(self,
                  image_size=224,
@@ -344,7 +355,8 @@ class VisionTransformer(nn.Layer):
                  dropout=0.,
                  attention_dropout=0.,
                  droppath=0.,
-                 representation_size=None):
+                 representation_size=None,
+                 recompute_interval=0):
         super().__init__()
         # create patch embedding
         self.patch_embedding = PatchEmbedding(image_size,
@@ -356,6 +368,9 @@ class VisionTransformer(nn.Layer):
             shape=[1, 1 + self.patch_embedding.num_patches, embed_dim],
             dtype='float32',
             default_initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
+        # interpolate position embedding for inputs of other sizes
+        self.position_embedding_interpolation = PositionEmbeddingInterpolation(
+            (image_size // patch_size, image_size // patch_size), num_extra_tokens=1)
         # create cls token
         self.cls_token = paddle.create_parameter(
             shape=[1, 1, embed_dim],
@@ -371,7 +386,8 @@ class VisionTransformer(nn.Layer):
                                mlp_ratio,
                                dropout,
                                attention_dropout,
-                               droppath)
+                               droppath,
+                               recompute_interval)
         # pre-logits
         if representation_size is not None:
             self.num_features = representation_size
@@ -400,10 +416,12 @@ class VisionTransformer(nn.Layer):
         return weight_attr, bias_attr
 
     def forward_features(self, x):
+        grid_size = (x.shape[2] // self.patch_embedding.patch_size,
+                     x.shape[3] // self.patch_embedding.patch_size)
         x = self.patch_embedding(x)
         cls_tokens = self.cls_token.expand((x.shape[0], -1, -1))
         x = paddle.concat((cls_tokens, x), axis=1)
-        x = x + self.position_embedding
+        x = x + self.position_embedding_interpolation(self.position_embedding, grid_size)
         x = self.pos_dropout(x)
         x = self.encoder(x)
         x = self.pre_logits(x[:, 0]) # cls_token only
@@ -430,5 +448,6 @@ def build_vit(config):
                               dropout=config.MODEL.DROPOUT,
                               attention_dropout=config.MODEL.ATTENTION_DROPOUT,
                               droppath=config.MODEL.DROPPATH,
-                              representation_size=None)
+                              representation_size=None,
+                              recompute_interval=config.MODEL.RECOMPUTE_INTERVAL)
     return model
@@ -0,0 +1,169 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Build the offline teacher logits for distillation using multiple GPU, see teacher_cache.py"""
+
+import os
+import json
+import argparse
+import numpy as np
+import paddle
+from paddle.io import DataLoader
+from paddle.io import DistributedBatchSampler
+from datasets import get_dataset
+from config import get_config
+from config import update_config
+from teacher_cache import ReplayAugDataset
+from regnet import build_regnet as build_teacher_model
+
+
+def get_arguments():
+    """return argumeents, this will overwrite the config by (1) yaml file (2) argument values"""
+    parser = argparse.ArgumentParser('Teacher cache')
+    parser.add_argument('-cfg', type=str, default=None)
+    parser.add_argument('-dataset', type=str, default=None)
+    parser.add_argument('-data_path', type=str, default=None)
+    parser.add_argument('-output', type=str, default=None)
+    parser.add_argument('-batch_size', type=int, default=None)
+    parser.add_argument('-batch_size_eval', type=int, default=None)
+    parser.add_argument('-image_size', type=int, default=None)
+    parser.add_argument('-accum_iter', type=int, default=None)
+    parser.add_argument('-pretrained', type=str, default=None)
+    parser.add_argument('-teacher_model_path', type=str, default=None)
+    parser.add_argument('-resume', type=str, default=None)
+    parser.add_argument('-last_epoch', type=int, default=None)
+    parser.add_argument('-eval', action='store_true')
+    parser.add_argument('-amp', action='store_true')
+    parser.add_argument('-cache_path', type=str, required=True)
+    parser.add_argument('-num_epochs', type=int, default=None, help='default: TRAIN.NUM_EPOCHS')
+    parser.add_argument('-topk', type=int, default=10, help='num of teacher log probs per sample')
+    parser.add_argument('-seed', type=int, default=0, help='augmentation seed')
+    arguments = parser.parse_args()
+    return arguments
+
+
+def create_teacher_cache(cache_path, num_epochs, num_samples, num_classes, seed=0, topk=10):
+    """Create the memory-mapped arrays and the meta of the teacher cache
+
+    Args:
+        cache_path: path where the cache files are stored
+        num_epochs: int, number of epochs to cache
+        num_samples: int, number of training samples
+        num_classes: int, number of classes of the teacher
+        seed: int, augmentation seed. Default: 0
+        topk: int, number of log probs kept per sample. Default: 10
+    """
+    assert num_classes <= np.iinfo('int16').max, 'class ids are stored as int16'
+    os.makedirs(cache_path, exist_ok=True)
+    shape = (num_epochs, num_samples, topk)
+    np.lib.format.open_memmap(
+        os.path.join(cache_path, 'values.npy'), mode='w+', dtype='float16', shape=shape).flush()
+    np.lib.format.open_memmap(
+        os.path.join(cache_path, 'indices.npy'), mode='w+', dtype='int16', shape=shape).flush()
+    with open(os.path.join(cache_path, 'meta.json'), 'w') as outfile:
+        json.dump({'seed': seed,
+                   'num_epochs': num_epochs,
+                   'num_samples': num_samples,
+                   'num_classes': num_classes,
+                   'topk': topk}, outfile)
+
+
+def build_teacher_cache(dataset,
+                        teacher_model,
+                        cache_path,
+                        num_epochs,
+                        seed=0,
+                        topk=10,
+                        batch_size=128,
+                        num_workers=4,
+                        amp=False):
+    """Run the teacher over the replayed augmentation of each epoch, store the top-k log probs
+
+    Each rank writes its part of the arrays created by create_teacher_cache.
+
+    Args:
+        dataset: training dataset with the training transforms, see get_dataset
+        teacher_model: nn.Layer, the teacher model in eval mode
+        cache_path: path where the cache files are stored
+        num_epochs: int, number of epochs to cache
+        seed: int, augmentation seed. Default: 0
+        topk: int, number of log probs kept per sample. Default: 10
+        batch_size: int, batch size of the teacher on each gpu. Default: 128
+        num_workers: int, num_workers of the dataloader. Default: 4
+        amp: bool, if True, run the teacher with auto_cast. Default: False
+    """
+    replay_dataset = ReplayAugDataset(dataset, seed)
+    sampler = DistributedBatchSampler(replay_dataset, batch_size=batch_size, shuffle=False)
+    dataloader = DataLoader(replay_dataset, batch_sampler=sampler, num_workers=num_workers)
+    values = np.load(os.path.join(cache_path, 'values.npy'), mmap_mode='r+')
+    indices = np.load(os.path.join(cache_path, 'indices.npy'), mmap_mode='r+')
+    local_rank = paddle.distributed.get_rank()
+    for epoch in range(num_epochs):
+        replay_dataset.set_epoch(epoch)
+        for batch_id, (images, _, sample_ids) in enumerate(dataloader):
+            with paddle.no_grad():
+                with paddle.amp.auto_cast(amp):
+                    outputs = teacher_model(images)
+                log_probs = paddle.nn.functional.log_softmax(outputs.astype('float32'), axis=1)
+                topk_values, topk_indices = paddle.topk(log_probs, k=topk, axis=1)
+            sample_ids = sample_ids.numpy()
+            values[epoch, sample_ids] = topk_values.numpy().astype('float16')
+            indices[epoch, sample_ids] = topk_indices.numpy().astype('int16')
+            if local_rank == 0 and batch_id % 100 == 0:
+                print(f'----- Teacher cache Epoch[{epoch:03d}/{num_epochs:03d}], '
+                      f'Step[{batch_id:04d}/{len(dataloader):04d}]')
+        values.flush()
+        indices.flush()
+
+
+def main_worker(*args):
+    """Build the teacher cache on one gpu"""
+    paddle.distributed.init_parallel_env()
+    config, dataset_train, arguments = args
+    teacher_model = build_teacher_model()
+    assert os.path.isfile(config.TRAIN.TEACHER_MODEL)
+    teacher_model.set_state_dict(paddle.load(config.TRAIN.TEACHER_MODEL))
+    teacher_model.eval()
+    build_teacher_cache(dataset_train,
+                        teacher_model,
+                        arguments.cache_path,
+                        arguments.num_epochs,
+                        seed=arguments.seed,
+                        topk=arguments.topk,
+                        batch_size=config.DATA.BATCH_SIZE,
+                        num_workers=config.DATA.NUM_WORKERS,
+                        amp=config.AMP)
+
+
+def main():
+    # config is updated in order: (1) default in config.py, (2) yaml file, (3) arguments
+    arguments = get_arguments()
+    config = update_config(get_config(), arguments)
+    config.TRAIN.TEACHER_CACHE = ''
+    if arguments.num_epochs is None:
+        arguments.num_epochs = config.TRAIN.NUM_EPOCHS
+    # the cache is built on the same training set as the distillation
+    dataset_train = get_dataset(config, is_train=True)
+    create_teacher_cache(arguments.cache_path,
+                         arguments.num_epochs,
+                         len(dataset_train),
+                         config.MODEL.NUM_CLASSES,
+                         seed=arguments.seed,
+                         topk=arguments.topk)
+    # dist spawn lunch: use CUDA_VISIBLE_DEVICES to set available gpus
+    paddle.distributed.spawn(main_worker, args=(config, dataset_train, arguments))
+
+
+if __name__ == '__main__':
+    main()
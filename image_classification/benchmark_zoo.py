@@ -0,0 +1,368 @@
+# Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Throughput and latency benchmark of the image classification model zoo
+
+Each model is built from a yaml file in <model_folder>/configs/, and measured
+in eval mode with random inputs of config.DATA.IMAGE_SIZE:
+    - throughput (images/sec) at several batch sizes
+    - p50/p99 latency of single image inference
+    - peak memory (gpu allocator peak on gpu, max rss of the process on cpu)
+    - FLOPs and params, by paddle.flops with the GELU/LayerNorm/Softmax
+      counters of MAE/stat_define.py (matmul in attention is not counted)
+
+The model folders share module names (config.py, utils.py, etc.), thus every
+config is benchmarked in its own python process, which also isolates the
+peak memory and the failure of a single model.
+
+The results are written to a json file, which can be passed as -baseline of a
+later run to report the throughput/latency regressions.
+
+Usage:
+    # all models on cpu
+    python benchmark_zoo.py -output zoo_cpu.json
+    # some models, compare with a previous run
+    python benchmark_zoo.py -models ViT DeiT SwinTransformer -configs "*224*" \
+        -batch_sizes 1 8 32 -output zoo_new.json -baseline zoo_cpu.json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import fnmatch
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+# model folder: (model module, build function), as imported by the main scripts
+MODEL_BUILDERS = {
+    'BEiT': ('beit', 'build_beit'),
+    'BoTNet': ('botnet', 'build_botnet50'),
+    'CSwin': ('cswin', 'build_cswin'),
+    'CaiT': ('cait', 'build_cait'),
+    'CoaT': ('coat', 'build_coat'),
+    'ConvMLP': ('convmlp', 'build_convmlp'),
+    'ConvMixer': ('convmixer', 'build_convmixer'),
+    'ConvNeXt': ('convnext', 'build_convnext'),
+    'CrossViT': ('crossvit', 'build_crossvit'),
+    'CvT': ('cvt', 'build_cvt'),
+    'CycleMLP': ('cyclemlp', 'build_cyclemlp'),
+    'DeiT': ('deit', 'build_vit'),
+    'FF_Only': ('ffonly', 'build_ffonly'),
+    'Focal_Transformer': ('focal_transformer', 'build_focal'),
+    'HVT': ('hvt', 'build_hvt'),
+    'HaloNet': ('halonet', 'build_halonet'),
+    'LeViT': ('levit', 'build_levit'),
+    'MAE': ('transformer', 'build_mae_finetune'),
+    'MLP-Mixer': ('mlp_mixer', 'build_mlp_mixer'),
+    'MobileFormer': ('mobileformer', 'build_mobileformer'),
+    'MobileOne': ('mobileone', 'build_mobileone'),
+    'MobileViT': ('mobilevit', 'build_mobilevit'),
+    'PVTv2': ('pvtv2', 'build_pvtv2'),
+    'PiT': ('pit', 'build_pit'),
+    'PoolFormer': ('poolformer', 'build_poolformer'),
+    'RepLKNet': ('replknet', 'build_replknet'),
+    'RepMLP': ('repmlp', 'build_repmlp'),
+    'ResMLP': ('resmlp', 'build_resmlp'),
+    'ResT': ('rest', 'build_rest'),
+    'Shuffle_Transformer': ('shuffle_transformer', 'build_shuffle_transformer'),
+    'SwinTransformer': ('swin', 'build_swin'),
+    'T2T_ViT': ('t2t_vit', 'build_t2t_vit'),
+    'TopFormer': ('topformer', 'build_topformer'),
+    'VOLO': ('volo', 'build_volo'),
+    'ViP': ('vip', 'build_vip'),
+    'ViT': ('vit', 'build_vit'),
+    'XCiT': ('xcit', 'build_xcit'),
+    'gMLP': ('gmlp', 'build_gmlp'),
+}
+
+# configs which are not image classifiers, e.g., MAE pretraining
+EXCLUDED_CONFIGS = ['*_pretrain*.yaml']
+
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+
+
+def get_arguments():
+    """return arguments of the benchmark"""
+    parser = argparse.ArgumentParser('Model zoo benchmark')
+    parser.add_argument('-models', type=str, nargs='+', default=None,
+                        help='model folders, default: all')
+    parser.add_argument('-configs', type=str, default='*.yaml',
+                        help='glob pattern of config file names')
+    parser.add_argument('-device', type=str, default='cpu', help='cpu or gpu')
+    parser.add_argument('-num_threads', type=int, default=None,
+                        help='OMP_NUM_THREADS of the benchmark processes')
+    parser.add_argument('-batch_sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('-warmup_iters', type=int, default=3)
+    parser.add_argument('-throughput_iters', type=int, default=10)
+    parser.add_argument('-latency_iters', type=int, default=50)
+    parser.add_argument('-no_flops', action='store_true')
+    parser.add_argument('-timeout', type=int, default=1800,
+                        help='timeout in seconds of each config')
+    parser.add_argument('-output', type=str, default='benchmark_zoo.json')
+    parser.add_argument('-baseline', type=str, default=None,
+                        help='json output of a previous run to compare with')
+    parser.add_argument('-tolerance', type=float, default=0.1,
+                        help='relative slowdown reported as regression')
+    # internal: benchmark a single config in this process
+    parser.add_argument('-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('-model', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('-cfg', type=str, default=None, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    return arguments
+
+
+def count_gelu(layer, inputs, output):
+    activation_flops = 8
+    layer.total_ops += inputs[0].numel() * activation_flops
+
+
+def count_softmax(layer, inputs, output):
+    softmax_flops = 5 # max/substract, exp, sum, divide
+    layer.total_ops += inputs[0].numel() * softmax_flops
+
+
+def count_layernorm(layer, inputs, output):
+    layer_norm_flops = 5 # get mean (sum), get variance (square and sum), scale(multiply)
+    layer.total_ops += inputs[0].numel() * layer_norm_flops
+
+
+def get_custom_ops():
+    """Return the flops counters of layers not counted by paddle.flops"""
+    import paddle
+    return {paddle.nn.GELU: count_gelu,
+            paddle.nn.LayerNorm: count_layernorm,
+            paddle.nn.Softmax: count_softmax}
+
+
+def get_build_model(model_name, config):
+    """Import the build function of model_name, the model folder must be in sys.path"""
+    module_name, build_name = MODEL_BUILDERS[model_name]
+    if model_name == 'ResT' and config.MODEL.TYPE != 'rest':
+        module_name, build_name = 'rest_v2', 'build_restv2'
+    module = __import__(module_name)
+    return getattr(module, build_name)
+
+
+def synchronize(output):
+    """Wait for the computation of output"""
+    import paddle
+    if paddle.is_compiled_with_cuda() and 'gpu' in paddle.get_device():
+        paddle.device.cuda.synchronize()
+    else:
+        output = output[0] if isinstance(output, (list, tuple)) else output
+        output.numpy()
+
+
+def peak_memory_mb():
+    """Peak memory of this process in MB, gpu allocator peak if on gpu, else max rss"""
+    import paddle
+    if paddle.is_compiled_with_cuda() and 'gpu' in paddle.get_device():
+        return paddle.device.cuda.max_memory_allocated() / 2**20
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KB on linux
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+def benchmark_config(model_name, cfg_file, arguments):
+    """Benchmark the model of a single config, return the result dict"""
+    import paddle
+    from config import get_config
+    paddle.set_device(arguments.device)
+    config = get_config(cfg_file)
+    model = get_build_model(model_name, config)(config)
+    model.eval()
+    image_size = config.DATA.IMAGE_SIZE
+    channels = config.DATA.get('IMAGE_CHANNELS', 3)
+    result = {'model': model_name,
+              'config': os.path.basename(cfg_file),
+              'image_size': image_size,
+              'params': int(sum(np.prod(p.shape) for p in model.parameters()))}
+
+    with paddle.no_grad():
+        # throughput
+        result['throughput'] = {}
+        for batch_size in arguments.batch_sizes:
+            images = paddle.randn([batch_size, channels, image_size, image_size])
+            for _ in range(arguments.warmup_iters):
+                synchronize(model(images))
+            start = time.perf_counter()
+            for _ in range(arguments.throughput_iters):
+                output = model(images)
+            synchronize(output)
+            elapsed = time.perf_counter() - start
+            result['throughput'][str(batch_size)] = (
+                batch_size * arguments.throughput_iters / elapsed)
+        # single image latency
+        images = paddle.randn([1, channels, image_size, image_size])
+        for _ in range(arguments.warmup_iters):
+            synchronize(model(images))
+        latencies = []
+        for _ in range(arguments.latency_iters):
+            start = time.perf_counter()
+            synchronize(model(images))
+            latencies.append((time.perf_counter() - start) * 1000)
+        result['latency_ms'] = {'p50': float(np.percentile(latencies, 50)),
+                                'p99': float(np.percentile(latencies, 99)),
+                                'mean': float(np.mean(latencies))}
+    result['peak_memory_mb'] = peak_memory_mb()
+
+    # flops is counted last, the hooks of paddle.flops do not affect the timing
+    result['flops'] = None
+    if not arguments.no_flops:
+        try:
+            result['flops'] = int(paddle.flops(model,
+                                               input_size=[1, channels, image_size, image_size],
+                                               custom_ops=get_custom_ops(),
+                                               print_detail=False))
+        except Exception as error: # the timing is kept if the flops counter fails
+            result['flops_error'] = f'{type(error).__name__}: {error}'
+    return result
+
+
+def run_worker(arguments):
+    """Entry of the benchmark process of a single config, print the result as json"""
+    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), arguments.model)
+    sys.path.insert(0, model_dir)
+    os.chdir(model_dir)
+    result = benchmark_config(arguments.model, arguments.cfg, arguments)
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def list_configs(model_names, pattern):
+    """Return [(model_name, cfg_file)] of the model folders matching pattern"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    configs = []
+    for model_name in model_names:
+        if model_name not in MODEL_BUILDERS:
+            raise ValueError(f'unknown model folder: {model_name}, '
+                             f'available: {sorted(MODEL_BUILDERS)}')
+        for cfg_file in sorted(glob.glob(os.path.join(root, model_name, 'configs', '*.yaml'))):
+            name = os.path.basename(cfg_file)
+            if not fnmatch.fnmatch(name, pattern):
+                continue
+            if any(fnmatch.fnmatch(name, excluded) for excluded in EXCLUDED_CONFIGS):
+                continue
+            configs.append((model_name, cfg_file))
+    return configs
+
+
+def run_config(model_name, cfg_file, arguments):
+    """Benchmark a single config in a new process, return the result dict"""
+    command = [sys.executable, os.path.abspath(__file__), '-worker',
+               '-model', model_name,
+               '-cfg', cfg_file,
+               '-device', arguments.device,
+               '-batch_sizes', *[str(b) for b in arguments.batch_sizes],
+               '-warmup_iters', str(arguments.warmup_iters),
+               '-throughput_iters', str(arguments.throughput_iters),
+               '-latency_iters', str(arguments.latency_iters)]
+    if arguments.no_flops:
+        command.append('-no_flops')
+    env = os.environ.copy()
+    if arguments.num_threads:
+        env['OMP_NUM_THREADS'] = str(arguments.num_threads)
+    error = None
+    try:
+        proc = subprocess.run(command, env=env, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, universal_newlines=True,
+                              timeout=arguments.timeout)
+        for line in proc.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):])
+        error = (proc.stderr.strip().splitlines() or [f'exit code {proc.returncode}'])[-1]
+    except subprocess.TimeoutExpired:
+        error = f'timeout after {arguments.timeout}s'
+    return {'model': model_name, 'config': os.path.basename(cfg_file), 'error': error}
+
+
+def get_environment(arguments):
+    """Return the environment of the benchmark, stored with the results"""
+    import paddle
+    return {'paddle': paddle.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'num_threads': arguments.num_threads,
+            'device': arguments.device,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def compare_with_baseline(results, baseline_file, tolerance):
+    """Print the throughput/latency changes from the baseline, return the regressions"""
+    with open(baseline_file, 'r') as infile:
+        baseline = {(r['model'], r['config']): r
+                    for r in json.load(infile)['results'] if 'error' not in r}
+    regressions = []
+    for result in results:
+        old = baseline.get((result['model'], result['config']))
+        if old is None or 'error' in result:
+            continue
+        changes = [(f'images/sec@{batch_size}', old['throughput'][batch_size], value, True)
+                   for batch_size, value in result['throughput'].items()
+                   if batch_size in old['throughput']]
+        changes.append(('latency p50', old['latency_ms']['p50'], result['latency_ms']['p50'], False))
+        for metric, old_value, new_value, higher_is_better in changes:
+            ratio = new_value / old_value if higher_is_better else old_value / new_value
+            if ratio < 1 - tolerance:
+                regressions.append((result['model'], result['config'], metric))
+                print(f'REGRESSION {result["model"]}/{result["config"]} {metric}: '
+                      f'{old_value:.2f} -> {new_value:.2f}')
+    return regressions
+
+
+def main():
+    arguments = get_arguments()
+    if arguments.worker:
+        run_worker(arguments)
+        return
+
+    model_names = arguments.models or sorted(MODEL_BUILDERS)
+    configs = list_configs(model_names, arguments.configs)
+    results = []
+    print(f'{"model":20s} {"config":42s} {"params(M)":>9s} {"GFLOPs":>7s} '
+          f'{"img/s@max_bs":>12s} {"p50(ms)":>8s} {"p99(ms)":>8s} {"peak(MB)":>9s}')
+    for model_name, cfg_file in configs:
+        result = run_config(model_name, cfg_file, arguments)
+        results.append(result)
+        # results are saved after each config, a long run can be inspected on the way
+        with open(arguments.output, 'w') as outfile:
+            json.dump({'environment': get_environment(arguments), 'results': results},
+                      outfile, indent=2)
+        name = f'{model_name:20s} {result["config"]:42s}'
+        if 'error' in result:
+            print(f'{name} ERROR: {result["error"]}')
+            continue
+        flops = f'{result["flops"] / 1e9:7.2f}' if result['flops'] is not None else f'{"-":>7s}'
+        print(f'{name} {result["params"] / 1e6:9.2f} {flops} '
+              f'{result["throughput"][str(max(arguments.batch_sizes))]:12.1f} '
+              f'{result["latency_ms"]["p50"]:8.2f} {result["latency_ms"]["p99"]:8.2f} '
+              f'{result["peak_memory_mb"]:9.0f}', flush=True)
+    print(f'----- results saved to {arguments.output}')
+
+    if arguments.baseline:
+        regressions = compare_with_baseline(results, arguments.baseline, arguments.tolerance)
+        print(f'----- {len(regressions)} regression(s) from {arguments.baseline}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -218,6 +218,8 @@ class WindowAttention(nn.Layer):
         self.proj = nn.Linear(dim, dim)
         self.proj_dropout = nn.Dropout(dropout)
         self.softmax = nn.Softmax(axis=-1)
+        # eval only: (mask, attn_bias) of the last forward, see get_cached_attn_bias
+        self._attn_bias_cache = None
 
     def transpose_multihead(self, x):
         new_shape = x.shape[:-1] + [self.num_heads, self.dim_head]
@@ -235,12 +237,14 @@ class WindowAttention(nn.Layer):
         relative_position_bias = paddle.index_select(x=table, index=index)
         return relative_position_bias
 
-    def forward(self, x, mask=None):
-        qkv = self.qkv(x).chunk(3, axis=-1)
-        q, k, v = map(self.transpose_multihead, qkv)
-        q = q * self.scale
-        attn = paddle.matmul(q, k, transpose_y=True)
+    def get_attn_bias(self, mask=None):
+        """Return the additive attention bias: relative position bias (+ shifted window mask)
 
+        Args:
+            mask: tensor, [nW, window_h*window_w, window_h*window_w], default: None
+        Returns:
+            attn_bias: tensor, [1 or nW, num_heads, window_h*window_w, window_h*window_w]
+        """
         relative_position_bias = self.get_relative_pos_bias_from_pos_index()
 
         relative_position_bias = relative_position_bias.reshape(
@@ -250,17 +254,49 @@ class WindowAttention(nn.Layer):
 
         # nH, window_h*window_w, window_h*window_w
         relative_position_bias = relative_position_bias.transpose([2, 0, 1])
-        attn = attn + relative_position_bias.unsqueeze(0)
+        attn_bias = relative_position_bias.unsqueeze(0)
+        if mask is not None:
+            attn_bias = attn_bias + mask.unsqueeze(1)
+        return attn_bias
+
+    def get_cached_attn_bias(self, mask=None):
+        """Return get_attn_bias(mask), materialized once in eval mode
+
+        In train mode the bias is computed in every forward and the cache is
+        dropped. In eval mode, the bias computed without grad (e.g., under
+        paddle.no_grad) is kept for the last mask until clear_attn_bias_cache is
+        called, which is done by train(), eval() and set_state_dict of SwinTransformer
+        and of SwinTransformerDet.
+        """
+        if self.training:
+            self._attn_bias_cache = None
+            return self.get_attn_bias(mask)
+        if self._attn_bias_cache is not None and self._attn_bias_cache[0] is mask:
+            return self._attn_bias_cache[1]
+        attn_bias = self.get_attn_bias(mask)
+        if attn_bias.stop_gradient:
+            self._attn_bias_cache = (mask, attn_bias)
+        return attn_bias
+
+    def clear_attn_bias_cache(self):
+        self._attn_bias_cache = None
 
+    def forward(self, x, mask=None):
+        qkv = self.qkv(x).chunk(3, axis=-1)
+        q, k, v = map(self.transpose_multihead, qkv)
+        q = q * self.scale
+        attn = paddle.matmul(q, k, transpose_y=True)
+
+        attn_bias = self.get_cached_attn_bias(mask)
         if mask is not None:
             nW = mask.shape[0]
             attn = attn.reshape(
                 [x.shape[0] // nW, nW, self.num_heads, x.shape[1], x.shape[1]])
-            attn += mask.unsqueeze(1).unsqueeze(0)
+            attn = attn + attn_bias.unsqueeze(0)
             attn = attn.reshape([-1, self.num_heads, x.shape[1], x.shape[1]])
-            attn = self.softmax(attn)
         else:
-            attn = self.softmax(attn)
+            attn = attn + attn_bias
+        attn = self.softmax(attn)
 
         attn = self.attn_dropout(attn)
 
@@ -274,6 +310,18 @@ class WindowAttention(nn.Layer):
         return z
 
 
+def clear_attn_bias_cache(model):
+    """Drop the attention bias cached in eval mode by the WindowAttention layers of model
+
+    Layer.train(), Layer.eval() and set_state_dict of a model embedding SwinTransformer
+    (e.g., the segmentor or detector) do not call the overrides of SwinTransformer,
+    thus such models call this in their own train, eval and set_state_dict.
+    """
+    for layer in [model] + model.sublayers():
+        if isinstance(layer, WindowAttention):
+            layer.clear_attn_bias_cache()
+
+
 def windows_partition(x, window_size):
     """ partite windows into window_size x window_size
     Args:
@@ -490,11 +538,20 @@ class SwinTransformerStage(nn.Layer):
             self.downsample = downsample(dim=dim)
         else:
             self.downsample = None
+        # ((Hp, Wp), attn_mask) of the last input size, see get_attn_mask
+        self._attn_mask_cache = None
 
-    def forward(self, x, H, W):
-        # calculate attention mask for SW-MSA
+    def get_attn_mask(self, H, W):
+        """Return the attention mask of shifted windows for the feature map of H x W
+
+        The mask only depends on the padded size, the mask of the last size is
+        reused, thus the attention bias cached by blocks in eval mode stays valid
+        for consecutive inputs of the same size.
+        """
         Hp = int(np.ceil(H / self.window_size)) * self.window_size
         Wp = int(np.ceil(W / self.window_size)) * self.window_size
+        if self._attn_mask_cache is not None and self._attn_mask_cache[0] == (Hp, Wp):
+            return self._attn_mask_cache[1]
         img_mask = paddle.zeros((1, Hp, Wp, 1))
         h_slices = (slice(0, -self.window_size),
                     slice(-self.window_size, -self.shift_size),
@@ -517,6 +574,12 @@ class SwinTransformerStage(nn.Layer):
         attn_mask = paddle.where(attn_mask == 0,
                                  paddle.zeros_like(attn_mask),
                                  attn_mask)
+        self._attn_mask_cache = ((Hp, Wp), attn_mask)
+        return attn_mask
+
+    def forward(self, x, H, W):
+        # calculate attention mask for SW-MSA
+        attn_mask = self.get_attn_mask(H, W)
         for block in self.blocks:
             block.H, block.W = H, W
             x = block(x, attn_mask)
@@ -672,6 +735,22 @@ class SwinTransformer(nn.Layer):
 
         return tuple(outs)
 
+    def clear_attn_bias_cache(self):
+        """Drop the attention bias cached in eval mode, see WindowAttention"""
+        clear_attn_bias_cache(self)
+
     def train(self, mode=True):
+        self.clear_attn_bias_cache()
         super(SwinTransformer, self).train(mode)
         self._freeze_stages()
+
+    def eval(self):
+        self.clear_attn_bias_cache()
+        return super(SwinTransformer, self).eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        self.clear_attn_bias_cache()
+        return super(SwinTransformer, self).set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
@@ -18,6 +18,7 @@ import paddle
 import paddle.nn as nn
 from config import get_config
 from swin_backbone import SwinTransformer
+from swin_backbone import clear_attn_bias_cache
 from det_necks.fpn import FPN, LastLevelMaxPool
 from det_heads.maskrcnn_head.rpn_head import RPNHead
 from det_heads.maskrcnn_head.roi_head import RoIHead
@@ -39,7 +40,22 @@ class SwinTransformerDet(nn.Layer):
         self.roihead = RoIHead(config)
 
         self.config = config
-    
+
+    def train(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        clear_attn_bias_cache(self)
+        return super().eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
     def forward(self, x, gt=None):
         feats = self.neck(self.backbone(x.tensors))
         rpn_out = self.rpnhead(feats, gt)
@@ -17,12 +17,12 @@ Implement Transformer Class for ViT
 """
 
 import copy
-import math
 import numpy as np
 import paddle
 import paddle.nn as nn
 import paddle.nn.functional as F
 from droppath import DropPath
+from interpolate_position_embedding import PositionEmbeddingInterpolation
 
 
 class Identity(nn.Layer):
@@ -64,6 +64,9 @@ class PatchEmbedding(nn.Layer):
             shape=[1, n_patches + 1, embed_dim],
             dtype='float32',
             default_initializer=paddle.nn.initializer.TruncatedNormal(std=.02))
+        # interpolate position embedding for inputs of other sizes (e.g., local crops)
+        self.position_embedding_interpolation = PositionEmbeddingInterpolation(
+            (image_size // patch_size, image_size // patch_size), num_extra_tokens=1)
 
         self.cls_token = paddle.create_parameter(
             shape=[1, 1, embed_dim],
@@ -73,27 +76,8 @@ class PatchEmbedding(nn.Layer):
         self.dropout = nn.Dropout(dropout)
 
     def interpolate_pos_encoding(self, x, w, h):
-        npatch = x.shape[1] - 1 # n_patches of x
-        N = self.position_embeddings.shape[1] - 1 # n_patches of pos_embed
-        if npatch == N and w == h:
-            return self.position_embeddings
-        class_pos_embed = self.position_embeddings[:, 0]
-        patch_pos_embed = self.position_embeddings[:, 1:]
-        dim = x.shape[-1]
-        w0 = w // self.patch_size
-        h0 = h // self.patch_size
-        # add small number to avoid floating point error in the interpolation
-        w0 += 0.1
-        h0 += 0.1
-        patch_pos_embed = F.interpolate(
-            patch_pos_embed.reshape(
-                (1, int(math.sqrt(N)), int(math.sqrt(N)), dim)).transpose([0, 3, 1, 2]),
-            scale_factor=(w0 / math.sqrt(N), h0 / math.sqrt(N)),
-            mode='bicubic',
-        )
-        assert int(w0) == patch_pos_embed.shape[-2] and int(h0) == patch_pos_embed.shape[-1]
-        patch_pos_embed = patch_pos_embed.transpose([0, 2, 3, 1]).reshape([1, -1, dim])
-        return paddle.concat((class_pos_embed.unsqueeze(0), patch_pos_embed), axis=1)
+        return self.position_embedding_interpolation(
+            self.position_embeddings, (w // self.patch_size, h // self.patch_size))
 
     def forward(self, x):
         B, c, w, h = x.shape
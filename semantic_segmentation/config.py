@@ -14,6 +14,7 @@ _C.DATA.DATA_PATH = '/home/ssd3/wutianyi/datasets/pascal_context'
 _C.DATA.CROP_SIZE = (480,480) # input_size (training)
 _C.DATA.NUM_CLASSES = 60  # 19 for cityscapes, 60 for Pascal-Context
 _C.DATA.NUM_WORKERS = 0 # number of data loading threads (curren paddle must set to 0)
+_C.DATA.LABEL_CACHE = None # dir of pre-decoded labels, built by tools/build_label_cache.py
 
 # model settings
 _C.MODEL = CN()
@@ -173,6 +174,10 @@ _C.TRAIN.ITERS = 80000
 _C.TRAIN.POWER = 0.9
 _C.TRAIN.DECAY_STEPS= 80000
 _C.TRAIN.APEX = False
+_C.TRAIN.AMP = False # auto mix precision training
+_C.TRAIN.AMP_LEVEL = 'O1' # 'O1': fp16 ops in white list, 'O2': fp16 model with fp32 master weights
+_C.TRAIN.AMP_LOSS_SCALE = 32768.0 # initial loss scaling of GradScaler
+_C.TRAIN.ACCUM_ITER = 1 # num of micro-batches for accumulating gradients in one iter
 _C.TRAIN.IGNORE_INDEX = 255
 
 _C.TRAIN.LR_SCHEDULER = CN()
@@ -215,6 +220,9 @@ _C.VAL.KEEP_ORI_SIZE = False
 _C.VAL.RESCALE_FROM_ORI = False
 _C.VAL.CROP_SIZE = [480,480]
 _C.VAL.STRIDE_SIZE = [320,320]
+_C.VAL.SLIDE_BATCH_SIZE = 0 # >0: infer sliding windows of all images in micro-batches
+_C.VAL.SLIDE_GAUSSIAN = False # gaussian weighted merging of sliding windows
+_C.VAL.SUBSET_SIZE = 0 # >0: validate on a fixed subset of this size during training
 _C.VAL.MEAN = [123.675, 116.28, 103.53]
 _C.VAL.STD = [58.395, 57.12, 57.375]
 
@@ -225,6 +233,7 @@ _C.TAG = "default"
 _C.SAVE_FREQ_CHECKPOINT = 1000 # freq to save chpt
 _C.LOGGING_INFO_FREQ = 50 # freq to logging info
 _C.VALIDATE_FREQ = 2000 # freq to do validation
+_C.VALIDATE_DURING_TRAIN = False # run validation every VALIDATE_FREQ iters in train.py
 _C.SEED = 0
 _C.EVAL = False # run evaluation only
 _C.LOCAL_RANK = 0
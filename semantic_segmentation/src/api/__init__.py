@@ -1,3 +1,5 @@
 from . import infer
+from . import evaluation
+from . import tiled_predictor
 
-__all__ = ['infer']
+__all__ = ['infer', 'evaluation', 'tiled_predictor']
@@ -0,0 +1,136 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import paddle
+from src.api import infer
+from src.datasets import get_dataset, SubsetDataset
+from src.transforms import Resize, Normalize
+from src.utils import metrics, progbar
+from src.utils import multi_val_fn, get_valid_sample_flags
+from src.utils import TimeAverager
+
+
+def get_val_loader(config, subset_size=0):
+    """
+    Build the validation dataset and dataloader, which can be kept and reused
+    by periodic validation during training.
+
+    Args:
+        config (CfgNode): the config.
+        subset_size (int): if > 0, a fixed evenly-spaced subset of this size
+        is used. Default: 0.
+
+    Returns:
+        dataset_val (Dataset): the validation dataset.
+        loader_val (DataLoader): the validation dataloader.
+    """
+    transforms_val = [ Resize(target_size=config.VAL.IMAGE_BASE_SIZE,
+                              keep_ori_size=config.VAL.KEEP_ORI_SIZE,
+                              size_divisor=config.VAL.SIZE_DIVISOR),
+                       Normalize(mean=config.VAL.MEAN, std=config.VAL.STD)]
+    dataset_val = get_dataset(config, data_transform=transforms_val, mode='val')
+    if 0 < subset_size < len(dataset_val):
+        dataset_val = SubsetDataset(dataset_val, subset_size)
+    batch_sampler = paddle.io.DistributedBatchSampler(dataset_val,
+        batch_size=config.DATA.BATCH_SIZE_VAL, shuffle=False, drop_last=True)
+    collate_fn = multi_val_fn()
+    loader_val = paddle.io.DataLoader(dataset_val, batch_sampler=batch_sampler,
+        num_workers=config.DATA.NUM_WORKERS, return_list=True, collate_fn=collate_fn)
+    return dataset_val, loader_val
+
+
+@paddle.no_grad()
+def evaluate(model, loader_val, config, multi_scales=False, verbose=True):
+    """
+    Evaluate the model on the validation loader.
+
+    The confusion matrix is accumulated per rank on device and reduced once
+    at the end. It is not fetched to host, thus the caller can enqueue other
+    work (e.g. next training steps) before reading the metrics.
+
+    Args:
+        model (paddle.nn.Layer): the segmentation model, set to eval mode
+        during evaluation and restored afterwards.
+        loader_val (DataLoader): the dataloader built by get_val_loader.
+        config (CfgNode): the config.
+        multi_scales (bool): whether employing multiple scales testing.
+        verbose (bool): whether to show the progress bar on rank 0.
+
+    Returns:
+        confusion_matrix (metrics.ConfusionMatrix): the reduced confusion matrix.
+    """
+    dataset_val = loader_val.dataset
+    batch_sampler = loader_val.batch_sampler
+    local_rank = paddle.distributed.ParallelEnv().local_rank
+    was_training = model.training
+    model.eval()
+    confusion_matrix = metrics.ConfusionMatrix(dataset_val.num_classes,
+        ignore_index=dataset_val.ignore_index)
+    valid_flags = get_valid_sample_flags(batch_sampler, len(dataset_val))
+    num_evaluated = 0
+    progbar_val = progbar.Progbar(target=len(loader_val), verbose=1)
+    reader_cost_averager = TimeAverager()
+    batch_cost_averager = TimeAverager()
+    batch_start = time.time()
+    for iter, (img, label) in enumerate(loader_val):
+        reader_cost_averager.record(time.time() - batch_start)
+        batch_size = len(img)
+        ori_shape = [l.shape[-2:] for l in label]
+        if multi_scales == True:
+            pred = infer.ms_inference(
+                model=model,
+                img=img,
+                ori_shape=ori_shape,
+                is_slide=config.VAL.IS_SLIDE,
+                base_size=config.VAL.IMAGE_BASE_SIZE,
+                stride_size=config.VAL.STRIDE_SIZE,
+                crop_size=config.VAL.CROP_SIZE,
+                num_classes=config.DATA.NUM_CLASSES,
+                scales=config.VAL.SCALE_RATIOS,
+                flip_horizontal=True,
+                flip_vertical=False,
+                rescale_from_ori=config.VAL.RESCALE_FROM_ORI,
+                slide_batch_size=config.VAL.SLIDE_BATCH_SIZE,
+                slide_gaussian=config.VAL.SLIDE_GAUSSIAN)
+        else:
+            pred = infer.ss_inference(
+                model=model,
+                img=img,
+                ori_shape=ori_shape,
+                is_slide=config.VAL.IS_SLIDE,
+                base_size=config.VAL.IMAGE_BASE_SIZE,
+                stride_size=config.VAL.STRIDE_SIZE,
+                crop_size=config.VAL.CROP_SIZE,
+                num_classes=config.DATA.NUM_CLASSES,
+                rescale_from_ori=config.VAL.RESCALE_FROM_ORI,
+                slide_batch_size=config.VAL.SLIDE_BATCH_SIZE,
+                slide_gaussian=config.VAL.SLIDE_GAUSSIAN)
+        for i in range(batch_size):
+            # padded duplicates of the distributed sampler are skipped
+            if valid_flags[num_evaluated + i]:
+                confusion_matrix.update(pred[i], label[i])
+        num_evaluated += batch_size
+        batch_cost_averager.record(time.time() - batch_start, num_samples=len(label))
+        batch_cost = batch_cost_averager.get_average()
+        reader_cost = reader_cost_averager.get_average()
+        if verbose and local_rank == 0:
+            progbar_val.update(iter + 1, [('batch_cost', batch_cost), ('reader cost', reader_cost)])
+        reader_cost_averager.reset()
+        batch_cost_averager.reset()
+        batch_start = time.time()
+    confusion_matrix.all_reduce()
+    if was_training:
+        model.train()
+    return confusion_matrix
@@ -19,7 +19,125 @@ import collections.abc
 import paddle
 import paddle.nn.functional as F
 
-def slide_inference(model, imgs, crop_size, stride_size, num_classes):
+def get_slide_windows(h_img, w_img, crop_size, stride_size):
+    """
+    Get the locations of sliding windows on an image. The last window of each
+    row/col is shifted back to stay inside the image.
+
+    Args:
+        h_img (int): the height of image.
+        w_img (int): the width of image.
+        crop_size (tuple|list): the size of sliding window, (w, h).
+        stride_size (tuple|list): the size of stride, (w, h).
+
+    Return:
+        windows (list): locations (h1, w1, h2, w2) of all windows.
+    """
+    w_crop, h_crop = crop_size
+    w_stride, h_stride = stride_size
+    rows = max(h_img - h_crop + h_stride -1, 0) // h_stride + 1
+    cols = max(w_img - w_crop + w_stride -1, 0) // w_stride + 1
+    windows = []
+    for r in range(rows):
+        for c in range(cols):
+            h2 = min(r * h_stride + h_crop, h_img)
+            w2 = min(c * w_stride + w_crop, w_img)
+            windows.append((max(h2 - h_crop, 0), max(w2 - w_crop, 0), h2, w2))
+    return windows
+
+
+def gaussian_window(h, w, sigma_scale=1. / 8):
+    """
+    Gaussian importance map of a sliding window, which down-weights the
+    logits near the window borders when overlapped windows are merged.
+
+    Args:
+        h (int): the height of window.
+        w (int): the width of window.
+        sigma_scale (float): sigma of gaussian relative to the window size.
+
+    Return:
+        weight (np.ndarray): weight map with shape (h, w) and max value 1.
+    """
+    y = np.arange(h, dtype='float32') - (h - 1) / 2.
+    x = np.arange(w, dtype='float32') - (w - 1) / 2.
+    sigma_y, sigma_x = h * sigma_scale, w * sigma_scale
+    weight = np.exp(-(y[:, None] ** 2 / (2 * sigma_y ** 2) +
+                      x[None, :] ** 2 / (2 * sigma_x ** 2)))
+    return (weight / weight.max()).astype('float32')
+
+
+def batched_slide_inference(model, imgs, crop_size, stride_size, num_classes,
+                            batch_size=4, gaussian=False):
+    """
+    Window-parallel inference by sliding-window with overlap.
+
+    All windows of all images are enumerated up front and fed to the model in
+    micro-batches of batch_size, the logits are merged back by overlap-add
+    into a flat buffer shared by all images, in place by index_add_ on
+    paddle>=2.5, otherwise by scatter_nd_add.
+
+    Args:
+        model (paddle.nn.Layer): model to get logits of image.
+        imgs (list): the input images, each with shape (C, H, W).
+        crop_size (tuple|list): the size of sliding window, (w, h).
+        stride_size (tuple|list): the size of stride, (w, h).
+        num_classes (int): the number of classes
+        batch_size (int): the number of windows in a forward. Default: 4.
+        gaussian (bool): whether to weight the windows by gaussian importance
+        map instead of uniform average. Default: False.
+
+    Return:
+        final_logit_list (list): The logits of input images, whose sizes are
+        equal to the sizes of imgs (not the orginal size).
+    """
+    shapes = [(img.shape[-2], img.shape[-1]) for img in imgs]
+    offsets = np.cumsum([0] + [h * w for h, w in shapes])
+    # windows are grouped by their shape, since images smaller than crop_size
+    # produce smaller windows which can not be batched with the others
+    groups = collections.OrderedDict()
+    for i, (h, w) in enumerate(shapes):
+        for h1, w1, h2, w2 in get_slide_windows(h, w, crop_size, stride_size):
+            groups.setdefault((h2 - h1, w2 - w1), []).append((i, h1, w1, h2, w2))
+    final_logit = paddle.zeros([int(offsets[-1]), num_classes])
+    count = np.zeros([int(offsets[-1]), 1], dtype='float32')
+    for (h_win, w_win), windows in groups.items():
+        weight = gaussian_window(h_win, w_win) if gaussian else None
+        ys = np.arange(h_win)[:, None]
+        xs = np.arange(w_win)[None, :]
+        for start in range(0, len(windows), batch_size):
+            batch_windows = windows[start: start + batch_size]
+            batch_data = paddle.stack(
+                [imgs[i][:, h1:h2, w1:w2] for i, h1, w1, h2, w2 in batch_windows])
+            logits = model(batch_data)[0].astype('float32')
+            if weight is not None:
+                logits = logits * paddle.to_tensor(weight)
+            # flat index of each window pixel in the shared buffer
+            index = np.stack([offsets[i] + (h1 + ys) * shapes[i][1] + (w1 + xs)
+                              for i, h1, w1, h2, w2 in batch_windows])
+            index = index.reshape([-1]).astype('int64')
+            updates = logits.transpose([0, 2, 3, 1]).reshape([-1, num_classes])
+            if hasattr(final_logit, 'index_add_'):
+                # accumulate in place, the buffer is not copied per micro-batch
+                final_logit.index_add_(paddle.to_tensor(index), 0, updates)
+            else:
+                # paddle<2.5 has no index_add_
+                final_logit = paddle.scatter_nd_add(
+                    final_logit, paddle.to_tensor(index.reshape([-1, 1])), updates)
+            np.add.at(count, index,
+                      1.0 if weight is None else np.tile(weight.reshape([-1, 1]),
+                                                         [len(batch_windows), 1]))
+    final_logit = final_logit / paddle.to_tensor(count)
+    final_logit_list = []
+    for i, (h, w) in enumerate(shapes):
+        logit = final_logit[int(offsets[i]): int(offsets[i + 1])]
+        logit = logit.reshape([h, w, num_classes]).transpose([2, 0, 1])
+        final_logit_list.append(logit.unsqueeze(0))
+    return final_logit_list
+
+
+def slide_inference(model, imgs, crop_size, stride_size, num_classes,
+                    batch_size=0, gaussian=False):
     """
     Inference by sliding-window with overlap, the overlap is equal to stride.
 
@@ -29,11 +147,18 @@ def slide_inference(model, imgs, crop_size, stride_size, num_classes):
         crop_size (tuple|list): the size of sliding window, (w, h).
         stride_size (tuple|list): the size of stride, (w, h).
         num_classes (int): the number of classes
+        batch_size (int): if > 0, windows of all images are inferred in
+        micro-batches of this size by batched_slide_inference. Default: 0.
+        gaussian (bool): whether to use gaussian weighted overlap-add, only
+        valid when batch_size > 0. Default: False.
 
     Return:
         final_logit (Tensor): The logit of input image, whose size is equal to 
         the size of img (not the orginal size).
     """
+    if batch_size > 0:
+        return batched_slide_inference(model, imgs, crop_size, stride_size,
+            num_classes, batch_size=batch_size, gaussian=gaussian)
     batch_size = len(imgs)
     h_img = [img.shape[-2] for img in imgs]
     w_img = [img.shape[-1] for img in imgs]
@@ -84,7 +209,9 @@ def ss_inference(model,
                  stride_size, 
                  crop_size, 
                  num_classes, 
-                 rescale_from_ori=False):
+                 rescale_from_ori=False,
+                 slide_batch_size=0,
+                 slide_gaussian=False):
     """
     Single-scale inference for image.
 
@@ -102,6 +229,10 @@ def ss_inference(model,
         num_classes (int): the number of classes
         rescale_from_ori (bool): whether rescale image from the original size. 
         Default: False.
+        slide_batch_size (int): micro-batch size of batched sliding-window
+        inference, 0 for inferring the windows position by position. Default: 0.
+        slide_gaussian (bool): whether to merge windows with gaussian weights.
+        Default: False.
 
     Returns:
         pred (tensor): If ori_shape is not None, a prediction with shape (1, 1, h, w) 
@@ -137,7 +268,8 @@ def ss_inference(model,
                 h, w = new_h, new_w
                 img = F.interpolate(img, (h, w), mode='bilinear')
                 #print("rescale, img.shape: ({}, {})".format(h,w))
-        logit_list = slide_inference(model, img, crop_size, stride_size, num_classes)
+        logit_list = slide_inference(model, img, crop_size, stride_size, num_classes,
+            batch_size=slide_batch_size, gaussian=slide_gaussian)
 
     if ori_shape is not None:
         # resize to original shape
@@ -153,6 +285,44 @@ def ss_inference(model,
         return logit
 
 
+def get_scaled_size(h_input, w_input, h_ori, w_ori, scale, crop_size, rescale_from_ori):
+    """
+    Get the input size of an image for a test scale.
+
+    Args:
+        h_input (int): the height of the base size for scaling.
+        w_input (int): the width of the base size for scaling.
+        h_ori (int): the height of the image to be rescaled.
+        w_ori (int): the width of the image to be rescaled.
+        scale (float): the test scale.
+        crop_size (tuple|list). the size of sliding window, (w, h).
+        rescale_from_ori (bool): whether rescale image from the original size.
+
+    Returns:
+        size (tuple): the scaled size (h, w).
+    """
+    h = int(h_input * scale + 0.5)
+    w = int(w_input * scale + 0.5)
+    if rescale_from_ori:
+        # whole image testing, rescale original image keeping the aspect
+        # ratio, the scale_factor between the origianl size and scale is
+        # scale_factor := min ( max(scale) / max(ori_size), min(scale) / min(ori_size) ) 
+        scale_factor = min(max(h, w) / max(h_ori, w_ori),
+                           min(h, w) / min(h_ori, w_ori))
+        h = int(h_ori * float(scale_factor) + 0.5)
+        w = int(w_ori * float(scale_factor) + 0.5)
+    elif min(h,w) < crop_size[0]:
+        # sliding-window testing
+        # if min(h,w) is smaller than crop_size[0], the smaller edge of the
+        # image will be matched to crop_size[0] maintaining the aspect ratio
+        new_short = crop_size[0]
+        if h > w :
+            h, w = int(new_short * h / w), new_short
+        else:
+            h, w = new_short, int(new_short * w / h)
+    return h, w
+
+
 def ms_inference(model,
                  img,
                  ori_shape,
@@ -164,20 +334,24 @@ def ms_inference(model,
                  scales=[1.0,],
                  flip_horizontal=True, 
                  flip_vertical=False,
-                 rescale_from_ori=False):
+                 rescale_from_ori=False,
+                 slide_batch_size=0,
+                 slide_gaussian=False):
 
     """
     Multi-scale inference.
 
-    For each scale, the segmentation result is first generated by sliding-window
-    testing with overlap. Then the segmentation result is resize to the original 
-    size, followed by softmax operation. Finally, the segmenation logits of all 
-    scales are averaged (+argmax) 
+    For each scale, the augmented views (the rescaled image and its flips) of
+    all images, which share the same size, are inferred in a shared batch, by
+    sliding-window testing with overlap or whole image testing. All scales are
+    resized from the original input tensor. Then the segmentation results are
+    resized to the original size, followed by softmax operation, and the 
+    probabilities of all views are accumulated in place (+argmax).
 
     Args:
         model (paddle.nn.Layer): model to get logits of image.
-        img (Tensor): the input image.
-        ori_shape (list): origin shape of image.
+        img (list): the input images, each with shape (C, H, W).
+        ori_shape (list): origin shapes of images.
         is_slide (bool): whether to infer by sliding wimdow. 
         base_size (list): the size of short edge is resize to min(base_size) 
         when it is smaller than min(base_size)  
@@ -190,65 +364,56 @@ def ms_inference(model,
         flip_horizontal (bool): whether to flip horizontally. Default: True
         flip_vertical (bool): whether to flip vertically. Default: False.
         rescale_from_ori (bool): whether rescale image from the original size. Default: False.
+        slide_batch_size (int): micro-batch size of batched sliding-window
+        inference, 0 for inferring the windows position by position. Default: 0.
+        slide_gaussian (bool): whether to merge windows with gaussian weights.
+        Default: False.
 
     Returns:
-        Pred (tensor): Prediction of image with shape (1, 1, h, w) is returned.
+        pred_list (list): Predictions of images, each with shape (1, 1, h, w).
     """
+    if not isinstance(img, collections.abc.Sequence):
+        raise TypeError("The type of img must be one of "
+            "collections.abc.Sequence, e.g. list, tuple. But received {}"
+            .format(type(img)))
     if not isinstance(scales, (tuple, list)):
-        raise('`scales` expects tuple/list, but received {}'.format(type(scales)))
-    final_logit = 0
-    if rescale_from_ori:
-        if not isinstance(base_size, tuple):
-            raise('base_size is not a tuple, but received {}'.format(type(tupel)))
-        h_input, w_input = base_size
-    else:
-        h_input, w_input = img.shape[-2], img.shape[-1]
+        raise TypeError('`scales` expects tuple/list, but received {}'.format(type(scales)))
+    if rescale_from_ori and not isinstance(base_size, (tuple, list)):
+        raise TypeError('base_size is not a tuple/list, but received {}'.format(type(base_size)))
+    # flip axes of each view, None for the unflipped view
+    flip_axes = [None]
+    if flip_horizontal:
+        flip_axes.append([2])
+    if flip_vertical:
+        flip_axes.append([1])
+    final_probs = [paddle.zeros([1, num_classes] + list(shape)) for shape in ori_shape]
     for scale in scales:
-        h = int(h_input * scale + 0.5)
-        w = int(w_input * scale + 0.5)
-        if rescale_from_ori:
-            # TODO (wutianyiRosun@gmail.com): whole image testing, rescale 
-            # original image according to the scale_factor between the 
-            # origianl size and scale
-            # scale_factor := min ( max(scale) / max(ori_size), min(scale) / min(ori_size) ) 
-            h_ori, w_ori = img.shape[-2], img.shape[-1]
-            max_long_edge = max(h, w)
-            max_short_edge = min(h, w)
-            scale_factor = min(max_long_edge / max(h, w),
-                               max_short_edge / min(h, w))
-            # compute new size
-            new_h = int(h_ori * float(scale_factor) + 0.5)
-            new_w = int(w_ori * float(scale_factor) + 0.5)
-            h, w = new_h, new_w
-            img = F.interpolate(img, (h, w), mode='bilinear')
-            logits = model(img)
-            logit = logits[0]
-        else:
-            # sliding-window testing
-            # if min(h,w) is smaller than crop_size[0], the smaller edge of the
-            # image will be matched to crop_size[0] maintaining the aspect ratio
-            if min(h,w) < crop_size[0]:
-                new_short = crop_size[0]
-                if h > w :
-                    new_h, new_w = int(new_short * h / w), new_short
-                else:
-                    new_h, new_w = new_short, int(new_short * w / h)
-                h, w = new_h, new_w
-            img = F.interpolate(img, (h, w), mode='bilinear')
-            logit = slide_inference(model, img, crop_size, stride_size, num_classes)
-
-        logit = F.interpolate(logit, ori_shape, mode='bilinear', align_corners=False)  
-        logit = F.softmax(logit, axis=1)
-        final_logit = final_logit + logit
-        # flip_horizontal testing
-        if flip_horizontal == True:
-            img_flip = img[:, :, :, ::-1]
-            logit_flip = slide_inference(model, img_flip, crop_size, 
-                stride_size, num_classes)
-            logit = logit_flip[:, :, :, ::-1]
-            logit = F.interpolate(logit, ori_shape, mode='bilinear', align_corners=False)  
-            logit = F.softmax(logit, axis=1)
-            final_logit = final_logit + logit
-        # TODO (wutianyiRosun@gmail.com): add flip_vertical testing
-    pred = paddle.argmax(final_logit, axis=1, keepdim=True, dtype='int32')
-    return pred
+        # group the views of all images by size for batched inference
+        groups = collections.OrderedDict()
+        for i, im in enumerate(img):
+            h_ori, w_ori = im.shape[-2], im.shape[-1]
+            h_input, w_input = base_size if rescale_from_ori else (h_ori, w_ori)
+            h, w = get_scaled_size(h_input, w_input, h_ori, w_ori, scale, 
+                                   crop_size, rescale_from_ori)
+            im_scaled = F.interpolate(im.unsqueeze(0), (h, w), mode='bilinear')[0]
+            for axis in flip_axes:
+                view = im_scaled if axis is None else paddle.flip(im_scaled, axis)
+                groups.setdefault((h, w), []).append((i, axis, view))
+        for views in groups.values():
+            view_imgs = [view for _, _, view in views]
+            if rescale_from_ori or not is_slide:
+                logits = model(paddle.stack(view_imgs))[0]
+                logit_list = [logits[j:j+1] for j in range(len(views))]
+            else:
+                logit_list = slide_inference(model, view_imgs, crop_size, stride_size,
+                    num_classes, batch_size=slide_batch_size, gaussian=slide_gaussian)
+            for (i, axis, _), logit in zip(views, logit_list):
+                if axis is not None:
+                    logit = paddle.flip(logit, [a + 1 for a in axis])
+                logit = F.interpolate(logit, ori_shape[i], mode='bilinear', align_corners=False)  
+                final_probs[i].add_(F.softmax(logit, axis=1))
+    pred_list = []
+    for final_prob in final_probs:
+        pred = paddle.argmax(final_prob, axis=1, keepdim=True, dtype='int32')
+        pred_list.append(pred)
+    return pred_list
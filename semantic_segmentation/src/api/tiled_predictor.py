@@ -0,0 +1,155 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import collections
+import numpy as np
+import cv2
+import paddle
+from src.api.infer import get_slide_windows, gaussian_window
+
+
+class ImageRegionReader(object):
+    """
+    Lazy region reader of a very large image (e.g. remote-sensing orthophotos).
+
+    '.npy' images (H, W, C) are memory-mapped, uncompressed '.tif' images are
+    memory-mapped by tifffile if it is installed, thus only the requested
+    regions are read. Other images are decoded once by opencv as fallback.
+    Regions are returned in RGB order, the same as Compose(to_rgb=True).
+
+    Args:
+        path (str): the path of image.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.npy':
+            self.data = np.load(path, mmap_mode='r')
+        elif ext in ('.tif', '.tiff'):
+            try:
+                import tifffile
+                self.data = tifffile.memmap(path, mode='r')
+            except (ImportError, ValueError):
+                # tifffile is not installed or the tif is compressed/tiled
+                self.data = None
+        if self.data is None:
+            img = cv2.imread(path)
+            if img is None:
+                raise ValueError('Can\'t read The image file {}!'.format(path))
+            self.data = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if self.data.ndim != 3:
+            raise ValueError("image should be (H, W, C), but the shape of {} is {}"
+                             .format(path, self.data.shape))
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def read(self, h1, h2, w1, w2):
+        """Read the region [h1:h2, w1:w2] as uint8 RGB (h, w, 3)"""
+        return np.ascontiguousarray(self.data[h1:h2, w1:w2, :3])
+
+
+class TiledPredictor(object):
+    """
+    Tile-streaming sliding-window predictor for images which do not fit in memory.
+
+    The windows are processed row by row: the image band under a row of windows
+    is read lazily, the windows are inferred in micro-batches, and the logits
+    are blended only in a rolling band of crop height. Once no later window
+    covers a band row, its argmax labels are written to an uint8 '.npy' memmap
+    on disk. Thus the memory is bounded by (num_classes, crop_h, W) instead of
+    the image size.
+
+    Args:
+        model (paddle.nn.Layer): model to get logits of image.
+        num_classes (int): the number of classes.
+        crop_size (tuple|list): the size of sliding window, (w, h).
+        stride_size (tuple|list): the size of stride, (w, h).
+        normalize (Normalize): the normalize transform, its normalize_chw is
+        applied on each uint8 window.
+        batch_size (int): the number of windows in a forward. Default: 4.
+        gaussian (bool): whether to weight the windows by gaussian importance
+        map instead of uniform average. Default: False.
+    """
+
+    def __init__(self, model, num_classes, crop_size, stride_size, normalize,
+                 batch_size=4, gaussian=False):
+        if stride_size[0] > crop_size[0] or stride_size[1] > crop_size[1]:
+            raise ValueError("stride_size {} should not be larger than crop_size {}"
+                             .format(stride_size, crop_size))
+        self.model = model
+        self.num_classes = num_classes
+        self.crop_size = crop_size
+        self.stride_size = stride_size
+        self.normalize = normalize
+        self.batch_size = max(batch_size, 1)
+        self.gaussian = gaussian
+
+    def _infer_windows(self, crops):
+        """Get the logits of crops (list of uint8 HWC) in micro-batches"""
+        logits = []
+        for start in range(0, len(crops), self.batch_size):
+            batch_data = np.stack([self.normalize.normalize_chw(crop)
+                                   for crop in crops[start: start + self.batch_size]])
+            batch_logits = self.model(paddle.to_tensor(batch_data))[0]
+            logits.extend(list(batch_logits.astype('float32').numpy()))
+        return logits
+
+    @paddle.no_grad()
+    def predict(self, reader, output_path):
+        """
+        Predict the labels of a large image tile by tile.
+
+        Args:
+            reader (ImageRegionReader): the reader of input image.
+            output_path (str): the '.npy' file to write the labels (H, W).
+
+        Returns:
+            labels (np.memmap): the memory-mapped labels written to output_path.
+        """
+        h_img, w_img = reader.shape[:2]
+        labels = np.lib.format.open_memmap(
+            output_path, mode='w+', dtype='uint8', shape=(h_img, w_img))
+        # windows grouped by rows, the row tops are non-decreasing
+        rows = collections.OrderedDict()
+        for h1, w1, h2, w2 in get_slide_windows(h_img, w_img, self.crop_size, self.stride_size):
+            rows.setdefault((h1, h2), []).append((w1, w2))
+        row_keys = list(rows.keys())
+        band_h = min(self.crop_size[1], h_img)
+        # the argmax of the weighted sum equals the argmax of the weighted
+        # average, thus the per-pixel weights need not to be accumulated
+        band_logit = np.zeros([self.num_classes, band_h, w_img], dtype='float32')
+        for r, (h1, h2) in enumerate(row_keys):
+            # the band always starts at the top of current window row
+            region = reader.read(h1, h2, 0, w_img)
+            windows = rows[(h1, h2)]
+            crops = [region[:, w1:w2] for w1, w2 in windows]
+            logits = self._infer_windows(crops)
+            for (w1, w2), logit in zip(windows, logits):
+                if self.gaussian:
+                    logit = logit * gaussian_window(h2 - h1, w2 - w1)
+                band_logit[:, :h2 - h1, w1:w2] += logit
+            # rows above the next window row are final
+            next_top = row_keys[r + 1][0] if r + 1 < len(row_keys) else h_img
+            num_final = next_top - h1
+            labels[h1:next_top] = np.argmax(band_logit[:, :num_final], axis=0)
+            labels.flush()
+            # roll the band
+            band_logit[:, :band_h - num_final] = band_logit[:, num_final:]
+            band_logit[:, band_h - num_final:] = 0
+        return labels
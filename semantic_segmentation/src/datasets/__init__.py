@@ -1,9 +1,10 @@
-from .dataset import Dataset
+from .dataset import Dataset, SubsetDataset
 from .cityscapes import Cityscapes
 from .ade import ADE20K
 from .pascal_context import PascalContext
 from .vaihingen import Vaihingen
 from .trans10k_v2 import Trans10kV2
+from .label_cache import LabelCache, build_label_cache, get_label_cache_prefix
 
 
 def get_dataset(config, data_transform, mode='train'):
@@ -56,4 +57,7 @@ def get_dataset(config, data_transform, mode='train'):
     else:
         raise NotImplementedError("{} dataset is not supported".format(config.DATA.DATASET))
 
+    if config.DATA.LABEL_CACHE:
+        dataset.use_label_cache(get_label_cache_prefix(
+            config.DATA.LABEL_CACHE, config.DATA.DATASET, mode))
     return dataset
@@ -62,18 +62,16 @@ class ADE20K(Dataset):
             label_path = os.path.join(label_dir, label_files[i])
             self.file_list.append([img_path, label_path])
 
+    def remap_label(self, label):
+        # The class 0 is ignored. And it will equal to 255 after
+        # subtracted 1, because the dtype of label is uint8.
+        return label - 1
+
     def __getitem__(self, idx):
         image_path, label_path = self.file_list[idx]
+        # labels are remapped before transforms, thus the padding value 255
+        # added by transforms is kept as ignore index
+        img, label = self.transforms(img=image_path, label=self.load_label(idx))
         if self.mode == 'val':
-            img, label = self.transforms(img=image_path, label=label_path)
-            # The class 0 is ignored. And it will equal to 255 after
-            # subtracted 1, because the dtype of label is uint8.
-            label = label - 1
             label = label[np.newaxis, :, :]
-            return img, label
-        else:
-            img, label = self.transforms(img=image_path, label=label_path)
-            label = label - 1
-            # Recover the ignore pixels adding by transform
-            label[label == 254] = 255
-            return img, label
+        return img, label
@@ -18,6 +18,7 @@ import numpy as np
 from PIL import Image
 from src.transforms import Compose
 import src.transforms.functional as F
+from src.datasets.label_cache import LabelCache
 
 
 class Dataset(paddle.io.Dataset):
@@ -56,6 +57,7 @@ class Dataset(paddle.io.Dataset):
         self.mode = mode
         self.num_classes = num_classes
         self.ignore_index = ignore_index
+        self.label_cache = None
 
         if mode.lower() not in ['train', 'val', 'test']:
             raise ValueError("mode should be 'train', 'val' or 'test', "
@@ -67,6 +69,25 @@ class Dataset(paddle.io.Dataset):
             raise FileNotFoundError("there is not `dataset_root`: {}."
                                     .format(self.dataset_root))
 
+    def use_label_cache(self, cache_prefix):
+        """Read labels from the pre-decoded cache built by build_label_cache"""
+        self.label_cache = LabelCache(
+            cache_prefix, label_paths=[item[1] for item in self.file_list])
+
+    def read_label(self, label_path):
+        """Decode the label file"""
+        return np.asarray(Image.open(label_path).convert('P'), dtype=np.uint8)
+
+    def remap_label(self, label):
+        """Map the decoded label ids to train ids, identity by default"""
+        return label
+
+    def load_label(self, idx):
+        """Get the label (in train ids) of idx-th sample, from cache if enabled"""
+        if self.label_cache is not None:
+            return self.label_cache[idx]
+        return self.remap_label(self.read_label(self.file_list[idx][1]))
+
     def __getitem__(self, idx):
         image_path, label_path = self.file_list[idx]
         if self.mode == 'test':
@@ -75,12 +96,37 @@ class Dataset(paddle.io.Dataset):
             return img, image_path
         elif self.mode == 'val':
             img, _ = self.transforms(img=image_path)
-            label = np.asarray(Image.open(label_path).convert('P'))
+            label = self.load_label(idx)
             label = label[np.newaxis, :, :]
             return img, label
         else:
-            img, label = self.transforms(img=image_path, label=label_path)
+            img, label = self.transforms(img=image_path, label=self.load_label(idx))
             return img, label
 
     def __len__(self):
         return len(self.file_list)
+
+
+class SubsetDataset(paddle.io.Dataset):
+    """
+    A fixed subset of a dataset, the samples are evenly spaced over the
+    whole dataset, e.g. for fast periodic validation during training.
+
+    Args:
+        dataset (Dataset): the whole dataset.
+        subset_size (int): the number of samples in the subset.
+    """
+
+    def __init__(self, dataset, subset_size):
+        self.dataset = dataset
+        self.num_classes = dataset.num_classes
+        self.ignore_index = dataset.ignore_index
+        subset_size = min(subset_size, len(dataset))
+        self.indices = np.unique(
+            np.linspace(0, len(dataset) - 1, subset_size).astype('int64')).tolist()
+
+    def __getitem__(self, idx):
+        return self.dataset[self.indices[idx]]
+
+    def __len__(self):
+        return len(self.indices)
@@ -0,0 +1,99 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import numpy as np
+
+
+def get_label_cache_prefix(cache_dir, dataset_name, mode):
+    """Path prefix of the label cache of a dataset split"""
+    return os.path.join(cache_dir, "{}_{}".format(dataset_name, mode))
+
+
+def build_label_cache(dataset, cache_prefix):
+    """
+    Decode all labels of a dataset once (remapped to train ids) and write them
+    into a raw uint8 store with an offset index.
+
+    Two files are written: '{cache_prefix}.bin' holds the concatenated labels,
+    '{cache_prefix}.npz' holds the offsets, shapes and label paths.
+
+    Args:
+        dataset (Dataset): the segmentation dataset, which provides file_list,
+        read_label and remap_label.
+        cache_prefix (str): the path prefix of the cache files.
+    """
+    num_samples = len(dataset.file_list)
+    offsets = np.zeros([num_samples + 1], dtype='int64')
+    shapes = np.zeros([num_samples, 2], dtype='int64')
+    label_paths = []
+    cache_dir = os.path.dirname(cache_prefix)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    with open(cache_prefix + '.bin', 'wb') as f:
+        for idx, (_, label_path) in enumerate(dataset.file_list):
+            label = dataset.remap_label(dataset.read_label(label_path))
+            label = np.ascontiguousarray(label, dtype='uint8')
+            if label.ndim != 2:
+                raise ValueError("label should be 2-dimensional, but the shape of "
+                                 "{} is {}".format(label_path, label.shape))
+            f.write(label.tobytes())
+            shapes[idx] = label.shape
+            offsets[idx + 1] = offsets[idx] + label.size
+            label_paths.append(label_path)
+    np.savez(cache_prefix + '.npz', offsets=offsets, shapes=shapes,
+             label_paths=np.array(label_paths, dtype='str'))
+
+
+class LabelCache(object):
+    """
+    Read-only label store built by build_label_cache.
+
+    The '.bin' file is memory-mapped lazily in each process (dataloader workers
+    included), and labels are returned as zero-copy read-only views of it.
+
+    Args:
+        cache_prefix (str): the path prefix of the cache files.
+        label_paths (list, optional): if given, it is checked against the label
+        paths recorded in the cache. Default: None.
+    """
+
+    def __init__(self, cache_prefix, label_paths=None):
+        if not os.path.exists(cache_prefix + '.bin') or \
+                not os.path.exists(cache_prefix + '.npz'):
+            raise FileNotFoundError("the label cache {} is not built, see "
+                                    "tools/build_label_cache.py".format(cache_prefix))
+        self.cache_prefix = cache_prefix
+        index = np.load(cache_prefix + '.npz')
+        self.offsets = index['offsets']
+        self.shapes = index['shapes']
+        if label_paths is not None and list(index['label_paths']) != list(label_paths):
+            raise ValueError("the label cache {} does not match the dataset, "
+                             "please rebuild it".format(cache_prefix))
+        self._data = None
+
+    def __getstate__(self):
+        # the memmap is reopened in each worker instead of being pickled
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def __getitem__(self, idx):
+        if self._data is None:
+            self._data = np.memmap(self.cache_prefix + '.bin', dtype='uint8', mode='r')
+        h, w = self.shapes[idx]
+        return self._data[self.offsets[idx]: self.offsets[idx + 1]].reshape([h, w])
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import math
+from collections import OrderedDict
 import numpy as np
 import paddle
 from paddle import nn
@@ -82,10 +83,12 @@ class WindowAttention(nn.Layer):
         attn_drop (float, optional): Dropout ratio of attention weight. Default: 0.0
         proj_drop (float, optional): Dropout ratio of output. Default: 0.0
         pool_method (str): window pooling method. Default: none
+        window_cache_size (int): Number of input resolutions whose window index and
+                                 masks are cached. Default: 8
     """
     def __init__(self, dim, expand_size, window_size, focal_window,
                     focal_level, num_heads, qkv_bias=True, qk_scale=None,
-                    attn_drop=0., proj_drop=0., pool_method="none"):
+                    attn_drop=0., proj_drop=0., pool_method="none", window_cache_size=8):
         super().__init__()
         self.dim = dim
         self.expand_size = expand_size
@@ -194,6 +197,81 @@ class WindowAttention(nn.Layer):
         self.proj_drop = nn.Dropout(proj_drop)
         self.softmax = nn.Softmax(axis=-1)
 
+        # LRU cache of the window index and masks, keyed by input resolution
+        self.window_cache_size = window_cache_size
+        self._window_index_cache = OrderedDict()
+
+    def get_window_index(self, x_all):
+        """Return the index of the rolled k/v tokens and the masks of the pooled windows
+
+        They only depend on the resolution of the inputs, so they are built once per
+        resolution and kept in a LRU cache of window_cache_size entries.
+        """
+        key = tuple(tuple(x.shape[1:3]) for x in x_all)
+        if key in self._window_index_cache:
+            self._window_index_cache.move_to_end(key)
+            return self._window_index_cache[key]
+        with paddle.no_grad():
+            window_index = self.build_window_index(x_all)
+        self._window_index_cache[key] = window_index
+        if len(self._window_index_cache) > self.window_cache_size:
+            self._window_index_cache.popitem(last=False)
+        return window_index
+
+    def clear_window_index_cache(self):
+        self._window_index_cache.clear()
+
+    def build_window_index(self, x_all):
+        """Build the window index and masks for the resolution of x_all
+
+        Returns:
+            dict of
+                rolled_index: (nW*n_rolled, ), flattened (H*W) index of the rolled
+                              k/v tokens of each window, if expand_size > 0
+                pooled_masks: list of (1, nW, n_unfold) masks of the pooled windows
+        """
+        window_index = {}
+        if self.expand_size > 0 and self.focal_level > 0:
+            H, W = x_all[0].shape[1:3]
+            index = paddle.arange(H * W).reshape((1, H, W, 1))
+            rolled_windows = []
+            for shifts in ((-self.expand_size, -self.expand_size),
+                           (-self.expand_size, self.expand_size),
+                           (self.expand_size, -self.expand_size),
+                           (self.expand_size, self.expand_size)):
+                index_rolled = paddle.roll(index, shifts=shifts, axis=(1, 2))
+                rolled_windows.append(windows_partition(index_rolled, self.window_size[0]).reshape(
+                    (-1, self.window_size[0] * self.window_size[1])))
+            rolled_index = paddle.concat(rolled_windows, 1)
+            # mask out tokens in current window
+            rolled_index = paddle.gather(rolled_index, self.valid_ind_rolled.flatten(), axis=1)
+            window_index['rolled_index'] = rolled_index.flatten()
+
+        pooled_masks = []
+        if self.pool_method != "none" and self.focal_level > 1:
+            for k in range(self.focal_level-1):
+                stride = 2**k
+                nWh, nWw = x_all[k+1].shape[1:3]
+                mask = paddle.ones(shape=(nWh, nWw), dtype='float32')
+                unfolded_mask = self.unfolds[k](mask.unsqueeze(0).unsqueeze(1)).reshape((
+                    1, 1, self.unfolds[k].kernel_sizes[0],
+                    self.unfolds[k].kernel_sizes[1], -1)).transpose((0, 4, 2, 3, 1)).\
+                    reshape((nWh*nWw // stride // stride, -1, 1))
+
+                if k > 0:
+                    valid_ind_unfold_k = getattr(self, "valid_ind_unfold_{}".format(k))
+                    unfolded_mask = unfolded_mask[:, valid_ind_unfold_k]
+
+                x_window_masks = unfolded_mask.flatten(1).unsqueeze(0)
+                # from numpy to paddle
+                x_window_masks = x_window_masks.numpy()
+                x_window_masks[x_window_masks==0] = -100.0
+                x_window_masks[x_window_masks>0] = 0.0
+                x_window_masks = paddle.to_tensor(x_window_masks.astype(np.float32))
+                pooled_masks.append(x_window_masks)
+        window_index['pooled_masks'] = pooled_masks
+        return window_index
+
     def forward(self, x_all, mask_all=None):
         """
         Args:
@@ -218,46 +296,17 @@ class WindowAttention(nn.Layer):
                     (-1, self.window_size[0] * self.window_size[0],
                     self.num_heads, C // self.num_heads)).transpose((0, 2, 1, 3))
 
-        if self.expand_size > 0 and self.focal_level > 0:
-            k_tl = paddle.roll(k, shifts=(-self.expand_size, -self.expand_size), axis=(1, 2))
-            v_tl = paddle.roll(v, shifts=(-self.expand_size, -self.expand_size), axis=(1, 2))
-
-            k_tr = paddle.roll(k, shifts=(-self.expand_size, self.expand_size), axis=(1, 2))
-            v_tr = paddle.roll(v, shifts=(-self.expand_size, self.expand_size), axis=(1, 2))
-
-            k_bl = paddle.roll(k, shifts=(self.expand_size, -self.expand_size), axis=(1, 2))
-            v_bl = paddle.roll(v, shifts=(self.expand_size, -self.expand_size), axis=(1, 2))
-
-            k_br = paddle.roll(k, shifts=(self.expand_size, self.expand_size), axis=(1, 2))
-            v_br = paddle.roll(v, shifts=(self.expand_size, self.expand_size), axis=(1, 2))
-
-
-            k_tl_windows = windows_partition(k_tl, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            k_tr_windows = windows_partition(k_tr, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            k_bl_windows = windows_partition(k_bl, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            k_br_windows = windows_partition(k_br, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-
-            v_tl_windows = windows_partition(v_tl, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            v_tr_windows = windows_partition(v_tr, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            v_bl_windows = windows_partition(v_bl, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-            v_br_windows = windows_partition(v_br, self.window_size[0]).reshape(
-            (-1, self.window_size[0] * self.window_size[0], self.num_heads, C // self.num_heads))
-
-            k_rolled = paddle.concat((k_tl_windows, k_tr_windows,
-                       k_bl_windows, k_br_windows), 1).transpose((0, 2, 1, 3))
-            v_rolled = paddle.concat((v_tl_windows, v_tr_windows,
-                       v_bl_windows, v_br_windows), 1).transpose((0, 2, 1, 3))
+        window_index = self.get_window_index(x_all)
 
-            # mask out tokens in current window
-            k_rolled = paddle.gather(k_rolled, self.valid_ind_rolled.flatten(), axis=2)
-            v_rolled = paddle.gather(v_rolled, self.valid_ind_rolled.flatten(), axis=2)
+        if self.expand_size > 0 and self.focal_level > 0:
+            # gather the tokens of k and v rolled to the tl, tr, bl and br of each window
+            rolled_index = window_index['rolled_index']
+            k_rolled = paddle.gather(k.reshape((B, nH * nW, C)), rolled_index, axis=1)
+            k_rolled = k_rolled.reshape((q_windows.shape[0], -1, self.num_heads,
+                                       C // self.num_heads)).transpose((0, 2, 1, 3))
+            v_rolled = paddle.gather(v.reshape((B, nH * nW, C)), rolled_index, axis=1)
+            v_rolled = v_rolled.reshape((q_windows.shape[0], -1, self.num_heads,
+                                       C // self.num_heads)).transpose((0, 2, 1, 3))
             k_rolled = paddle.concat((k_windows, k_rolled), 2)
             v_rolled = paddle.concat((v_windows, v_rolled), 2)
         else:
@@ -268,28 +317,10 @@ class WindowAttention(nn.Layer):
             k_pooled = []
             v_pooled = []
             for k in range(self.focal_level-1):
-                stride = 2**k
                 x_window_pooled = x_all[k+1]  # B, nWh, nWw, C
                 nWh, nWw = x_window_pooled.shape[1:3] 
 
-                # generate mask for pooled windows
-                mask = paddle.ones(shape=(nWh, nWw)).astype(x_window_pooled.dtype)
-                unfolded_mask = self.unfolds[k](mask.unsqueeze(0).unsqueeze(1)).reshape((
-                    1, 1, self.unfolds[k].kernel_sizes[0],
-                    self.unfolds[k].kernel_sizes[1], -1)).transpose((0, 4, 2, 3, 1)).\
-                    reshape((nWh*nWw // stride // stride, -1, 1))
-
-                if k > 0:
-                    valid_ind_unfold_k = getattr(self, "valid_ind_unfold_{}".format(k))
-                    unfolded_mask = unfolded_mask[:, valid_ind_unfold_k]
-
-                x_window_masks = unfolded_mask.flatten(1).unsqueeze(0)
-                # from numpy to paddle
-                x_window_masks = x_window_masks.numpy()
-                x_window_masks[x_window_masks==0] = -100.0
-                x_window_masks[x_window_masks>0] = 0.0
-                x_window_masks = paddle.to_tensor(x_window_masks.astype(np.float32))         
-                mask_all[k+1] = x_window_masks
+                mask_all[k+1] = window_index['pooled_masks'][k]
 
                 # generate k and v for pooled windows                
                 qkv_pooled = self.qkv(x_window_pooled).reshape((B, nWh, nWw, 3, C)).transpose(
@@ -311,6 +342,7 @@ class WindowAttention(nn.Layer):
                             self.num_heads, C // self.num_heads)).transpose((0, 2, 1, 3))
 
                 if k > 0:
+                    valid_ind_unfold_k = getattr(self, "valid_ind_unfold_{}".format(k))
                     k_pooled_k = k_pooled_k[:, :, valid_ind_unfold_k]
                     v_pooled_k = v_pooled_k[:, :, valid_ind_unfold_k]
 
@@ -34,42 +34,36 @@ class OhemCrossEntropyLoss(nn.Layer):
                 value is 0 <= label[i] <= C-1, and if shape is more than 2D, this is
                 (N, D1, D2,..., Dk), k >= 1.
         """
-        if len(label.shape) != len(logit.shape):
-            label = paddle.unsqueeze(label, 1)
+        if len(label.shape) == len(logit.shape):
+            label = paddle.squeeze(label, 1)
 
-        # get the label after ohem
+        # get the label after ohem, all the selection stays on device
         n, c, h, w = logit.shape
-        label = label.reshape((-1, ))
-        valid_mask = (label != self.ignore_index).astype('int64')
-        num_valid = valid_mask.sum()
-        label = label * valid_mask
+        label = label.astype('int64')
+        valid_mask = label != self.ignore_index
+        label = label * valid_mask.astype('int64')
 
-        prob = F.softmax(logit, axis=1)
-        prob = prob.transpose((1, 0, 2, 3)).reshape((c, -1))
-
-        if self.min_kept < num_valid and num_valid > 0:
+        if self.min_kept > 0:
+            # gather the prob of relevant label directly, instead of one-hot
+            prob = F.softmax(logit.detach(), axis=1)
+            prob = paddle.take_along_axis(prob, label.unsqueeze(1), axis=1)
+            prob = prob.reshape((n, h, w))
             # let the value which ignored greater than 1
-            prob = prob + (1 - valid_mask)
-
-            # get the prob of relevant label
-            label_onehot = F.one_hot(label, c)
-            label_onehot = label_onehot.transpose((1, 0))
-            prob = prob * label_onehot
-            prob = paddle.sum(prob, axis=0)
+            prob = paddle.where(valid_mask, prob, paddle.full_like(prob, 2.0))
 
-            threshold = self.thresh
-            if self.min_kept > 0:
-                index = prob.argsort()
-                threshold_index = index[min(len(index), self.min_kept) - 1]
-                threshold_index = int(threshold_index.numpy()[0])
-                if prob[threshold_index] > self.thresh:
-                    threshold = prob[threshold_index]
-                kept_mask = (prob < threshold).astype('int64')
-                label = label * kept_mask
-                valid_mask = valid_mask * kept_mask
+            # the min_kept-th smallest prob by top-k selection, not a full argsort
+            k = min(self.min_kept, n * h * w)
+            kth_prob = paddle.topk(prob.reshape((-1, )), k, largest=False)[0][k - 1]
+            threshold = paddle.maximum(
+                kth_prob, paddle.full_like(kth_prob, self.thresh))
+            # all valid pixels are kept if no more than min_kept of them
+            num_valid = valid_mask.astype('int64').sum()
+            kept_mask = paddle.logical_or(prob < threshold, num_valid <= self.min_kept)
+            valid_mask = paddle.logical_and(valid_mask, kept_mask)
 
         # make the invalid region as ignore
-        label = label + (1 - valid_mask) * self.ignore_index
+        label = paddle.where(
+            valid_mask, label, paddle.full_like(label, self.ignore_index))
 
         label = label.reshape((n, 1, h, w))
         valid_mask = valid_mask.reshape((n, 1, h, w)).astype('float32')
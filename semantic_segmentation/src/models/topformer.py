@@ -19,6 +19,7 @@ Implement TopFormer
 import paddle.nn as nn
 from src.models.decoders import *
 from src.models.backbones import *
+from src.models.backbones.swin_transformer import clear_attn_bias_cache
 import paddle
 import logging
 import warnings
@@ -50,6 +51,21 @@ class TopFormer(nn.Layer):
         elif 'SimpleHead' in config.MODEL.DECODER_TYPE:
             self.decoder = SimpleHead(config)
 
+    def train(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        clear_attn_bias_cache(self)
+        return super().eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
     def forward(self, inputs):
         features = self.encoder(inputs)
         out = self.decoder(features, inputs.shape)
@@ -23,6 +23,7 @@ import paddle
 import paddle.nn as nn
 from src.models.backbones import SwinTransformer
 from src.models.backbones import CSwinTransformer
+from src.models.backbones.swin_transformer import clear_attn_bias_cache
 from src.models.backbones import FocalTransformer
 from src.models.decoders import UperHead, FCNHead
 
@@ -74,6 +75,21 @@ class UperNet(nn.Layer):
     def init__decoder_lr_coef(self, config):
         pass
 
+    def train(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().train(*args, **kwargs)
+
+    def eval(self):
+        clear_attn_bias_cache(self)
+        return super().eval()
+
+    def set_state_dict(self, *args, **kwargs):
+        clear_attn_bias_cache(self)
+        return super().set_state_dict(*args, **kwargs)
+
+    set_dict = set_state_dict
+    load_dict = set_state_dict
+
     def to_2D(self, x):
         n, hw, c = x.shape                                                                                                                                    
         h = w = int(math.sqrt(hw))
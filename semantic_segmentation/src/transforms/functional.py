@@ -59,6 +59,55 @@ def imnormalize_(img, mean, std):
     cv2.multiply(img, stdinv, img)  # inplace
     return img
 
+def imnormalize_chw(img, mean, std):
+    """Normalize an image with mean and std, and transpose HWC to CHW.
+
+    The uint8 image is converted to float32 only here: each channel is mapped
+    by a 256-entry lookup table of normalized values and written into the
+    CHW output buffer directly, thus only one float buffer is allocated.
+
+    Args:
+        img (ndarray): Image to be normalized with shape (H, W, C). (0~255)
+        mean (ndarray): The mean to be used for normalize.
+        std (ndarray): The std to be used for normalize.
+
+    Returns:
+        ndarray: The normalized image with shape (C, H, W) and dtype float32.
+    """
+    mean = np.float64(mean).reshape(-1)
+    std = np.float64(std).reshape(-1)
+    h, w, c = img.shape
+    out = np.empty((c, h, w), dtype=np.float32)
+    if img.dtype == np.uint8:
+        values = np.arange(256, dtype=np.float64)
+        for i in range(c):
+            lut = ((values - mean[i]) / std[i]).astype(np.float32)
+            np.take(lut, img[:, :, i], out=out[i])
+    else:
+        for i in range(c):
+            np.subtract(img[:, :, i], mean[i], out=out[i], casting='unsafe')
+            out[i] /= np.float32(std[i])
+    return out
+
+def padding_value(value, img):
+    """Cast the padding value to the dtype of image.
+
+    For uint8 images the value is rounded half up and clipped to [0, 255]
+    explicitly, e.g. 123.675 -> 124, instead of relying on the saturation
+    rules of OpenCV. Float images keep the value unchanged.
+
+    Args:
+        value (float|list|tuple): The padding value of each channel.
+        img (ndarray): The image to be padded.
+
+    Returns:
+        float|list: The padding value for img.
+    """
+    if img.dtype != np.uint8:
+        return value
+    value = np.clip(np.floor(np.asarray(value, dtype=np.float64) + 0.5), 0, 255)
+    return value.tolist()
+
 def horizontal_flip(img):
     if len(img.shape) == 3:
         img = img[:, ::-1, :]
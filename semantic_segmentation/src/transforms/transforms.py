@@ -25,7 +25,9 @@ class Compose:
     """
     Do transformation on input data with corresponding pre-processing and 
     augmentation operations. The shape of input data to all operations is 
-    [height, width, channels].
+    [height, width, channels]. Images are read and kept as uint8 through the
+    geometric and colour operations, and converted to float32 only at the end,
+    by a fused normalize + HWC->CHW step when the last operation is Normalize.
 
     Args:
         transforms (list): A list contains data pre-processing or augmentation. 
@@ -43,6 +45,11 @@ class Compose:
             raise TypeError('The transforms must be a list!')
         self.transforms = transforms
         self.to_rgb = to_rgb
+        # the trailing Normalize is fused with the HWC->CHW transpose
+        self.normalize = None
+        if transforms and isinstance(transforms[-1], Normalize):
+            self.normalize = transforms[-1]
+            self.transforms = transforms[:-1]
 
     def __call__(self, img, label=None):
         """
@@ -54,7 +61,10 @@ class Compose:
             (tuple). A tuple including image and label after transformation.
         """
         if isinstance(img, str):
-            img = cv2.imread(img).astype('float32')
+            img_path = img
+            img = cv2.imread(img_path)
+            if img is None:
+                raise ValueError('Can\'t read The image file {}!'.format(img_path))
         if isinstance(label, str):
             label = np.asarray(Image.open(label).convert('P'), dtype=np.uint8)
         if img is None:
@@ -67,7 +77,10 @@ class Compose:
             img = outputs[0]
             if len(outputs) == 2:
                 label = outputs[1]
-        img = np.transpose(img, (2, 0, 1))
+        if self.normalize is not None:
+            img = self.normalize.normalize_chw(img)
+        else:
+            img = np.transpose(img, (2, 0, 1)).astype('float32')
         return (img, label)
 
 
@@ -311,6 +324,19 @@ class Normalize:
         else:
             return (img, label)
 
+    def normalize_chw(self, img):
+        """
+        Fused normalization and HWC->CHW transpose, used by Compose.
+
+        Args:
+            img (np.ndarray): The Image data with shape (H, W, C), uint8 or float.
+
+        Returns:
+            (np.ndarray): The normalized image with shape (C, H, W), float32.
+        """
+
+        return functional.imnormalize_chw(img, np.array(self.mean), np.array(self.std))
+
 class Padding:
     """
     Add bottom-right padding to a raw image or annotation image.
@@ -318,7 +344,7 @@ class Padding:
     Args:
         target_size (list|tuple): The target size after padding.
         im_padding_value (list, optional): The padding value of raw image.
-        Default: [127.5, 127.5, 127.5].
+        Default: [127.5, 127.5, 127.5], rounded for uint8 images.
         label_padding_value (int, optional): The padding value of annotation
         image. Default: 255.
 
@@ -370,7 +396,7 @@ class Padding:
         else:
             img = cv2.copyMakeBorder(
                 img, 0, pad_height, 0, pad_width, cv2.BORDER_CONSTANT,
-                value=self.im_padding_value)
+                value=functional.padding_value(self.im_padding_value, img))
             if label is not None:
                 label = cv2.copyMakeBorder(
                     label, 0, pad_height, 0, pad_width, cv2.BORDER_CONSTANT,
@@ -389,7 +415,7 @@ class RandomPaddingCrop:
     Args:
         crop_size (tuple, optional): The target cropping size.
         img_padding_value (list, optional): The padding value of raw image.
-        Default: (123.675, 116.28, 103.53).
+        Default: (123.675, 116.28, 103.53), rounded for uint8 images.
         label_padding_value (int, optional): The padding value of annotation
         image. Default: 255.
 
@@ -447,7 +473,7 @@ class RandomPaddingCrop:
             if (pad_height > 0 or pad_width > 0):
                 img = cv2.copyMakeBorder(
                     img, 0, pad_height, 0, pad_width, cv2.BORDER_CONSTANT, 
-                    value=self.img_padding_value)
+                    value=functional.padding_value(self.img_padding_value, img))
                 if label is not None:
                     label = cv2.copyMakeBorder(
                         label, 0, pad_height, 0, pad_width, cv2.BORDER_CONSTANT, 
@@ -516,7 +542,7 @@ class RandomRotation:
     Args:
         max_rotation (float, optional): The maximum rotation degree. Default: 15.
         img_padding_value (list, optional): The padding value of raw image.
-        Default: [127.5, 127.5, 127.5].
+        Default: [127.5, 127.5, 127.5], rounded for uint8 images.
         label_padding_value (int, optional): The padding value of annotation
         image. Default: 255.
     """
@@ -559,7 +585,7 @@ class RandomRotation:
             img = cv2.warpAffine(
                 img, r, dsize=dsize, flags=cv2.INTER_LINEAR, 
                 borderMode=cv2.BORDER_CONSTANT,
-                borderValue=self.im_padding_value)
+                borderValue=functional.padding_value(self.img_padding_value, img))
             if label is not None:
                 label = cv2.warpAffine(
                     label, r, dsize=dsize, flags=cv2.INTER_NEAREST,
@@ -652,7 +678,8 @@ class RandomDistort:
             'saturation': self.saturation_prob,
             'hue': self.hue_prob
         }
-        img = img.astype('uint8')
+        # colour ops work on uint8, the image is kept uint8 afterwards
+        img = np.ascontiguousarray(img, dtype='uint8')
         img = Image.fromarray(img)
         for id in range(len(ops)):
             params = params_dict[ops[id].__name__]
@@ -660,7 +687,7 @@ class RandomDistort:
             params['img'] = img
             if np.random.uniform(0, 1) < prob:
                 img = ops[id](**params)
-        img = np.asarray(img).astype('float32')
+        img = np.array(img)
         if label is None:
             return (img, )
         else:
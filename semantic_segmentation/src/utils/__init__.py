@@ -4,4 +4,4 @@ from .checkpoint import load_entire_model, load_pretrained_model, resume
 from .timer import TimeAverager, calculate_eta
 from . import vis
 from .multi_batch_collate import multi_val_fn
-from .dataloader import get_dataloader
+from .dataloader import get_dataloader, get_valid_sample_flags
@@ -49,6 +49,24 @@ def get_dataloader(dataset,
     return dataloader
 
 
+def get_valid_sample_flags(batch_sampler, num_samples):
+    """
+    get flags of the samples yielded by a DistributedBatchSampler on current
+    rank, the flag is False for the duplicated samples padded to the tail to
+    make the dataset evenly divisible by nranks.
+    Note: only valid for batch_sampler with shuffle=False.
+    """
+    # sampling positions of the padded index list instead of dataset indices,
+    # positions beyond num_samples are the padded duplicates
+    position_sampler = DistributedBatchSampler(dataset=range(batch_sampler.total_size),
+                                               batch_size=batch_sampler.batch_size,
+                                               num_replicas=batch_sampler.nranks,
+                                               rank=batch_sampler.local_rank,
+                                               shuffle=False,
+                                               drop_last=batch_sampler.drop_last)
+    return [pos < num_samples for batch in position_sampler for pos in batch]
+
+
 class IterationBasedBatchSampler(BatchSampler):
     """
     Wraps a BatchSampler, resampling from it until
@@ -14,12 +14,15 @@
 
 import numpy as np
 import paddle
-import paddle.nn.functional as F
 
 
-def calculate_area(pred, label, num_classes, ignore_index=255):
+def calculate_confusion_matrix(pred, label, num_classes, ignore_index=255):
     """
-    Calculate intersect, prediction and label area
+    Calculate the confusion matrix of prediction and label
+
+    Pixels whose label is ignore_index (or out of [0, num_classes)) are skipped.
+    The matrix is built by a single bincount over `label * num_classes + pred`,
+    thus no one-hot tensors are allocated.
 
     Args:
         pred (type: Tensor, shape: [B,1,H,W]):  prediction results.
@@ -28,9 +31,8 @@ def calculate_area(pred, label, num_classes, ignore_index=255):
         ignore_index (int): Specifies a class that is ignored. Default: 255.
 
     Returns:
-        Tensor: The intersection area of prediction and the ground on all class.
-        Tensor: The prediction area on all class.
-        Tensor: The ground truth area on all class.
+        Tensor: confusion matrix with shape [num_classes, num_classes] and
+        dtype int64, rows are labels and cols are predictions.
     """
 
     if len(pred.shape) == 4:
@@ -41,33 +43,105 @@ def calculate_area(pred, label, num_classes, ignore_index=255):
         raise ValueError('Shape of `pred` and `label should be equal, '
                          'but there are {} and {}.'.format(pred.shape, label.shape))
 
+    pred = pred.astype('int64').flatten()
+    label = label.astype('int64').flatten()
     # Delete ignore_index
-    mask = label != ignore_index
-    pred = pred + 1
-    label = label + 1
-    pred = pred * mask
-    label = label * mask
-    pred = F.one_hot(pred, num_classes + 1)  # dtype: float32
-    label = F.one_hot(label, num_classes + 1)
-    pred = pred[:, :, :, 1:]  # shape: [1,H,W,num_class+1]
-    label = label[:, :, :, 1:]
-    pred_area = []
-    label_area = []
-    intersect_area = []
-    for i in range(num_classes):
-        pred_i = pred[:, :, :, i]
-        label_i = label[:, :, :, i]
-        pred_area_i = paddle.sum(pred_i)
-        label_area_i = paddle.sum(label_i)
-        intersect_area_i = paddle.sum(pred_i * label_i)
-        pred_area.append(pred_area_i)
-        label_area.append(label_area_i)
-        intersect_area.append(intersect_area_i)
-    pred_area = paddle.concat(pred_area)
-    label_area = paddle.concat(label_area)
-    intersect_area = paddle.concat(intersect_area)
+    mask = (label != ignore_index) & (label >= 0) & (label < num_classes)
+    pred = paddle.masked_select(pred, mask)
+    label = paddle.masked_select(label, mask)
+    index = label * num_classes + pred
+    matrix = paddle.bincount(index, minlength=num_classes * num_classes)
+    matrix = matrix[:num_classes * num_classes].astype('int64')
+    return matrix.reshape([num_classes, num_classes])
+
+
+def area_from_confusion_matrix(matrix):
+    """
+    Calculate intersect, prediction and label area from confusion matrix
+
+    Args:
+        matrix (Tensor): confusion matrix, rows are labels and cols are predictions.
+
+    Returns:
+        Tensor: The intersection area of prediction and the ground on all class.
+        Tensor: The prediction area on all class.
+        Tensor: The ground truth area on all class.
+    """
+
+    intersect_area = paddle.diagonal(matrix)
+    pred_area = paddle.sum(matrix, axis=0)
+    label_area = paddle.sum(matrix, axis=1)
     return intersect_area, pred_area, label_area
 
+
+def calculate_area(pred, label, num_classes, ignore_index=255):
+    """
+    Calculate intersect, prediction and label area
+
+    Args:
+        pred (type: Tensor, shape: [B,1,H,W]):  prediction results.
+        label (type: Tensor, shape: [B,1,H,W]): ground truth (segmentation)
+        num_classes (int): The unique number of target classes.
+        ignore_index (int): Specifies a class that is ignored. Default: 255.
+
+    Returns:
+        Tensor: The intersection area of prediction and the ground on all class.
+        Tensor: The prediction area on all class.
+        Tensor: The ground truth area on all class.
+    """
+
+    matrix = calculate_confusion_matrix(pred, label, num_classes, ignore_index)
+    return area_from_confusion_matrix(matrix)
+
+
+class ConfusionMatrix(object):
+    """
+    Streaming confusion matrix accumulator for segmentation evaluation
+
+    The matrix is kept on device and updated by `update` for each prediction,
+    the areas and metrics (mIoU, accuracy, kappa) are computed from it at the end.
+
+    Args:
+        num_classes (int): The unique number of target classes.
+        ignore_index (int): Specifies a class that is ignored. Default: 255.
+    """
+
+    def __init__(self, num_classes, ignore_index=255):
+        self.num_classes = num_classes
+        self.ignore_index = ignore_index
+        self.reset()
+
+    def reset(self):
+        self.matrix = paddle.zeros([self.num_classes, self.num_classes], dtype='int64')
+
+    def update(self, pred, label):
+        """Accumulate the confusion matrix of pred and label"""
+        self.matrix += calculate_confusion_matrix(
+            pred, label, self.num_classes, self.ignore_index)
+
+    def update_matrix(self, matrix):
+        """Accumulate a precomputed confusion matrix (e.g. gathered from other ranks)"""
+        self.matrix += matrix.astype('int64')
+
+    def all_reduce(self):
+        """Sum the matrix over all ranks, called once after the evaluation loop"""
+        if paddle.distributed.get_world_size() > 1:
+            paddle.distributed.all_reduce(self.matrix)
+
+    def get_area(self):
+        return area_from_confusion_matrix(self.matrix)
+
+    def mean_iou(self):
+        return mean_iou(*self.get_area())
+
+    def accuracy(self):
+        intersect_area, pred_area, _ = self.get_area()
+        return accuracy(intersect_area, pred_area)
+
+    def kappa(self):
+        return kappa(*self.get_area())
+
+
 def mean_iou(intersect_area, pred_area, label_area):
     """
     Calculate iou.
@@ -137,9 +211,9 @@ def kappa(intersect_area, pred_area, label_area):
         kappa (float): kappa coefficient.
     """
 
-    intersect_area = intersect_area.numpy()
-    pred_area = pred_area.numpy()
-    label_area = label_area.numpy()
+    intersect_area = intersect_area.numpy().astype('float64')
+    pred_area = pred_area.numpy().astype('float64')
+    label_area = label_area.numpy().astype('float64')
     total_area = np.sum(label_area)
     po = np.sum(intersect_area) / total_area
     pe = np.sum(pred_area * label_area) / (total_area * total_area)
@@ -0,0 +1,131 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark the step time (forward + backward) of OhemCrossEntropyLoss against
+the previous implementation, which sorts all pixel probs by argsort and syncs
+the threshold index to host.
+
+Usage:
+    python tools/benchmark_ohem_loss.py --batch_size 8 --crop_size 769 --num_classes 19
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import paddle
+import paddle.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from src.models.losses.ohem_cross_entropy_loss import OhemCrossEntropyLoss
+
+
+class ArgsortOhemCrossEntropyLoss(paddle.nn.Layer):
+    """The previous ohem loss (one-hot gather + full argsort + host sync), for reference"""
+
+    def __init__(self, thresh=0.7, min_kept=10000, ignore_index=255):
+        super(ArgsortOhemCrossEntropyLoss, self).__init__()
+        self.thresh = thresh
+        self.min_kept = min_kept
+        self.ignore_index = ignore_index
+        self.EPS = 1e-5
+
+    def forward(self, logit, label):
+        n, c, h, w = logit.shape
+        label = label.reshape((-1, ))
+        valid_mask = (label != self.ignore_index).astype('int64')
+        num_valid = valid_mask.sum()
+        label = label * valid_mask
+
+        prob = F.softmax(logit, axis=1)
+        prob = prob.transpose((1, 0, 2, 3)).reshape((c, -1))
+
+        if self.min_kept < num_valid and num_valid > 0:
+            prob = prob + (1 - valid_mask).astype(prob.dtype)
+            label_onehot = F.one_hot(label, c)
+            label_onehot = label_onehot.transpose((1, 0))
+            prob = prob * label_onehot
+            prob = paddle.sum(prob, axis=0)
+
+            threshold = self.thresh
+            if self.min_kept > 0:
+                index = prob.argsort()
+                threshold_index = index[min(len(index), self.min_kept) - 1]
+                threshold_index = int(threshold_index)
+                if prob[threshold_index] > self.thresh:
+                    threshold = prob[threshold_index]
+                kept_mask = (prob < threshold).astype('int64')
+                label = label * kept_mask
+                valid_mask = valid_mask * kept_mask
+
+        label = label + (1 - valid_mask) * self.ignore_index
+        label = label.reshape((n, 1, h, w))
+        valid_mask = valid_mask.reshape((n, 1, h, w)).astype('float32')
+        loss = F.softmax_with_cross_entropy(
+            logit, label, ignore_index=self.ignore_index, axis=1)
+        loss = loss * valid_mask
+        return paddle.mean(loss) / (paddle.mean(valid_mask) + self.EPS)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark of OHEM cross entropy loss')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--crop_size', type=int, default=769)
+    parser.add_argument('--num_classes', type=int, default=19)
+    parser.add_argument('--min_kept', type=int, default=100000)
+    parser.add_argument('--thresh', type=float, default=0.7)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument('--device', type=str, default=None, help='cpu or gpu')
+    return parser.parse_args()
+
+
+def run_steps(loss_func, logit, label, steps):
+    for _ in range(steps):
+        logit.clear_gradient()
+        loss = loss_func(logit, label)
+        loss.backward()
+    # fetching the value syncs the device
+    return float(loss)
+
+
+def benchmark(loss_func, logit, label, warmup, iters):
+    run_steps(loss_func, logit, label, warmup)
+    start = time.time()
+    value = run_steps(loss_func, logit, label, iters)
+    return (time.time() - start) / iters, value
+
+
+def main():
+    args = parse_args()
+    if args.device:
+        paddle.set_device(args.device)
+    np.random.seed(0)
+    shape = [args.batch_size, args.num_classes, args.crop_size, args.crop_size]
+    logit = paddle.to_tensor(np.random.randn(*shape).astype('float32'), stop_gradient=False)
+    label = np.random.randint(0, args.num_classes, [args.batch_size, 1] + shape[2:])
+    label[:, :, :args.crop_size // 10] = 255
+    label = paddle.to_tensor(label.astype('int64'))
+
+    for name, loss_cls in [('argsort', ArgsortOhemCrossEntropyLoss),
+                           ('topk', OhemCrossEntropyLoss)]:
+        loss_func = loss_cls(thresh=args.thresh, min_kept=args.min_kept)
+        step_time, value = benchmark(loss_func, logit, label, args.warmup, args.iters)
+        print("{:>8s}: {:.2f} ms/step, loss: {:.6f}".format(name, step_time * 1000, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Build the pre-decoded label cache of a segmentation dataset. The labels
+(remapped to train ids) are written into a memory-mapped uint8 store, which
+is used by setting DATA.LABEL_CACHE to the output dir in the config.
+
+Usage:
+    python tools/build_label_cache.py --config configs/xxx.yaml --out_dir ./label_cache
+"""
+
+import os
+import sys
+import argparse
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from config import *
+from src.datasets import get_dataset, build_label_cache, get_label_cache_prefix
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build label cache of Seg. datasets')
+    parser.add_argument(
+        "--config",
+        dest='cfg',
+        default=None,
+        type=str,
+        help='The config file.'
+    )
+    parser.add_argument(
+        "--out_dir",
+        default=None,
+        type=str,
+        help='The dir of label cache, DATA.LABEL_CACHE is used if not set.'
+    )
+    parser.add_argument(
+        "--modes",
+        nargs='+',
+        default=['train', 'val'],
+        help='The splits of dataset to cache.'
+    )
+    return parser.parse_args()
+
+
+def main():
+    config = get_config()
+    args = parse_args()
+    config = update_config(config, args)
+    out_dir = args.out_dir if args.out_dir else config.DATA.LABEL_CACHE
+    if not out_dir:
+        raise ValueError("--out_dir or DATA.LABEL_CACHE should be set")
+    # labels are decoded from files while building
+    config.DATA.LABEL_CACHE = None
+    for mode in args.modes:
+        dataset = get_dataset(config, data_transform=[], mode=mode)
+        cache_prefix = get_label_cache_prefix(out_dir, config.DATA.DATASET, mode)
+        build_label_cache(dataset, cache_prefix)
+        print("mode: {}, {} labels are cached in {}".format(
+            mode, len(dataset.file_list), cache_prefix))
+
+
+if __name__ == '__main__':
+    main()
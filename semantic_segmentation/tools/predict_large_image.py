@@ -0,0 +1,100 @@
+#  Copyright (c) 2021 PPViT Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Predict very large images (e.g. remote-sensing orthophotos) by tile-streaming
+sliding-window inference. The images are read lazily and the labels are
+written tile by tile into uint8 '.npy' files, thus the memory is bounded by
+a band of windows instead of the image size.
+
+Usage:
+    python tools/predict_large_image.py --config configs/xxx.yaml \
+        --model_path xxx.pdparams --images a.npy b.tif --results_dir ./results
+"""
+
+import os
+import sys
+import argparse
+import paddle
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+from config import *
+from src.api.tiled_predictor import ImageRegionReader, TiledPredictor
+from src.transforms import Normalize
+from src.models import get_model
+from src.utils import logger, load_entire_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Tile-streaming prediction of large images')
+    parser.add_argument(
+        "--config",
+        dest='cfg',
+        default=None,
+        type=str,
+        help='The config file.'
+    )
+    parser.add_argument(
+        "--model_path",
+        default=None,
+        type=str,
+        help='The path of weights file (segmentation model)'
+    )
+    parser.add_argument(
+        "--images",
+        nargs='+',
+        required=True,
+        help='The large images to predict (.npy, .tif or any format of opencv)'
+    )
+    parser.add_argument(
+        "--results_dir",
+        default="./results/",
+        type=str,
+        help='The directory of predicted labels (.npy)'
+    )
+    return parser.parse_args()
+
+
+def main():
+    config = get_config()
+    args = parse_args()
+    config = update_config(config, args)
+    place = 'gpu' if config.VAL.USE_GPU else 'cpu'
+    paddle.set_device(place)
+    model = get_model(config)
+    if args.model_path:
+        load_entire_model(model, args.model_path)
+        logger.info('Loaded trained params of model successfully')
+    model.eval()
+    if not os.path.isdir(args.results_dir):
+        os.makedirs(args.results_dir)
+
+    predictor = TiledPredictor(
+        model=model,
+        num_classes=config.DATA.NUM_CLASSES,
+        crop_size=config.VAL.CROP_SIZE,
+        stride_size=config.VAL.STRIDE_SIZE,
+        normalize=Normalize(mean=config.VAL.MEAN, std=config.VAL.STD),
+        batch_size=max(config.VAL.SLIDE_BATCH_SIZE, 1),
+        gaussian=config.VAL.SLIDE_GAUSSIAN)
+    for img_path in args.images:
+        reader = ImageRegionReader(img_path)
+        img_name = os.path.splitext(os.path.basename(img_path))[0]
+        output_path = os.path.join(args.results_dir, img_name + '.npy')
+        predictor.predict(reader, output_path)
+        logger.info("{} ({}x{}) is predicted, labels are saved in {}".format(
+            img_path, reader.shape[0], reader.shape[1], output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,7 @@ import paddle
 import paddle.nn as nn
 from config import *
 from src.utils import logger
+from src.api import evaluation
 from src.datasets import get_dataset
 from src.models import get_model
 from src.transforms import *
@@ -48,6 +49,15 @@ def parse_args():
     )
     return parser.parse_args()
 
+def log_eval_results(cur_iter, confusion_matrix):
+    """Fetch the metrics of periodic validation and log them"""
+    _, miou = confusion_matrix.mean_iou()
+    _, acc = confusion_matrix.accuracy()
+    kappa = confusion_matrix.kappa()
+    if paddle.distributed.ParallelEnv().local_rank == 0:
+        logger.info("[EVAL] iter: {}, mIoU: {:.4f} Acc: {:.4f} Kappa: {:.4f}".format(
+            cur_iter, miou, acc, kappa))
+
 def main():
     config = get_config()
     args = parse_args()
@@ -67,13 +77,29 @@ def main():
     transforms_train = get_transforms(config)
     # build loss function
     loss_func = get_loss_function(config)
+    # build scaler for amp training, O2 keeps fp32 master weights in optimizer
+    amp_grad_scaler = None
+    if config.TRAIN.AMP:
+        amp_grad_scaler = paddle.amp.GradScaler(
+            init_loss_scaling=config.TRAIN.AMP_LOSS_SCALE)
+        if config.TRAIN.AMP_LEVEL == 'O2':
+            model, optimizer = paddle.amp.decorate(models=model,
+                                                   optimizers=optimizer,
+                                                   level='O2',
+                                                   master_weight=True,
+                                                   save_dtype='float32')
+    # one iter (optimizer step) consists of accum_iter micro-batches
+    accum_iter = config.TRAIN.ACCUM_ITER
     # Resume from checkpoints, and update start_iter
     start_iter = 0
     if args.resume is not None:
         assert os.path.exists(args.resume), args.resume + "is not found!"
         opt_state = paddle.load(args.resume.replace('.pdparams', '.pdopt').replace('model', 'opt'))
         start_iter = opt_state['LR_Scheduler']['last_epoch']
+        scaler_state = opt_state.pop('amp_grad_scaler', None)
         optimizer.set_state_dict(opt_state)
+        if amp_grad_scaler is not None and scaler_state is not None:
+            amp_grad_scaler.load_state_dict(scaler_state)
         model.set_state_dict(paddle.load(args.resume))
         logger.info("training from checkpoint {}, start_iter= {}".format(args.resume, start_iter))
     # build dataset_train
@@ -81,15 +107,21 @@ def main():
     train_loader = get_dataloader(dataset=dataset_train,
                                   shuffle=True,
                                   batch_size=config.DATA.BATCH_SIZE,
-                                  num_iters=config.TRAIN.ITERS,
+                                  num_iters=config.TRAIN.ITERS * accum_iter,
                                   num_workers=config.DATA.NUM_WORKERS,
-                                  start_iter=start_iter)
+                                  start_iter=start_iter * accum_iter)
     # build workspace for saving checkpoints
     if not os.path.isdir(config.SAVE_DIR):
         if os.path.exists(config.SAVE_DIR):
             os.remove(config.SAVE_DIR)
         os.makedirs(config.SAVE_DIR)
     logger.info("train_loader.len= {}".format(len(train_loader)))
+    # build val loader once, it is reused by the periodic validation
+    if config.VALIDATE_DURING_TRAIN:
+        dataset_val, loader_val = evaluation.get_val_loader(
+            config, subset_size=config.VAL.SUBSET_SIZE)
+        logger.info("validate every {} iters on {} samples".format(
+            config.VALIDATE_FREQ, len(dataset_val)))
     if nranks > 1:
         # Initialize parallel environment if not done.
         if not paddle.distributed.parallel.parallel_helper._is_parallel_ctx_initialized():
@@ -100,44 +132,68 @@ def main():
             ddp_model = paddle.DataParallel(model)
     avg_loss = 0.0
     avg_loss_list = []
-    iters_per_epoch = len(dataset_train) // config.DATA.BATCH_SIZE
+    iters_per_epoch = len(dataset_train) // (config.DATA.BATCH_SIZE * accum_iter)
     reader_cost_averager = TimeAverager()
     batch_cost_averager = TimeAverager()
     save_models = deque()
+    # the reduced confusion matrix of the last validation, kept on device
+    pending_eval = None
     batch_start = time.time()
     cur_iter = start_iter
+    micro_iter = 0
     # begin training
     for data in train_loader:
-        cur_iter += 1
+        micro_iter += 1
         reader_cost_averager.record(time.time() - batch_start)
         images = data[0]
         labels = data[1].astype('int64')
-        if nranks > 1:
-            logits_list = ddp_model(images)
-        else:
-            logits_list = model(images)
-        loss_list = loss_func(logits_list, labels)
-        loss = sum(loss_list)
-        loss.backward()
-        optimizer.step()
-        lr = optimizer.get_lr()
-        if isinstance(optimizer._learning_rate,paddle.optimizer.lr.LRScheduler):
-            optimizer._learning_rate.step()
-        model.clear_gradients()
-        avg_loss += loss.numpy()[0]
+        with paddle.amp.auto_cast(amp_grad_scaler is not None, 
+                                  level=config.TRAIN.AMP_LEVEL):
+            if nranks > 1:
+                logits_list = ddp_model(images)
+            else:
+                logits_list = model(images)
+            loss_list = loss_func(logits_list, labels)
+            loss = sum(loss_list)
+        # gradients are averaged over the accumulated micro-batches
+        backward_loss = loss / accum_iter if accum_iter > 1 else loss
+        if amp_grad_scaler is not None:
+            backward_loss = amp_grad_scaler.scale(backward_loss)
+        backward_loss.backward()
+        # losses are summed on device and fetched only when logged
+        avg_loss += loss.detach()
         if not avg_loss_list:
-            avg_loss_list = [l.numpy() for l in loss_list]
+            avg_loss_list = [l.detach() for l in loss_list]
         else:
             for i in range(len(loss_list)):
-                avg_loss_list[i] += loss_list[i].numpy()
+                avg_loss_list[i] += loss_list[i].detach()
         batch_cost_averager.record(
             time.time() - batch_start, num_samples=config.DATA.BATCH_SIZE)
+        if micro_iter % accum_iter != 0:
+            batch_start = time.time()
+            continue
+        cur_iter += 1
+        if amp_grad_scaler is not None:
+            amp_grad_scaler.step(optimizer)
+            amp_grad_scaler.update()
+        else:
+            optimizer.step()
+        lr = optimizer.get_lr()
+        if isinstance(optimizer._learning_rate,paddle.optimizer.lr.LRScheduler):
+            optimizer._learning_rate.step()
+        model.clear_gradients()
+        # metrics of the last validation are fetched once the next optimizer
+        # step is enqueued, thus the device is not idle while the host waits
+        if pending_eval is not None:
+            log_eval_results(*pending_eval)
+            pending_eval = None
         if (cur_iter) % config.LOGGING_INFO_FREQ == 0 and local_rank == 0:
-            avg_loss /= config.LOGGING_INFO_FREQ
-            avg_loss_list = [l[0] / config.LOGGING_INFO_FREQ for l in avg_loss_list]
+            avg_loss = avg_loss.item() / (config.LOGGING_INFO_FREQ * accum_iter)
+            avg_loss_list = [l.item() / (config.LOGGING_INFO_FREQ * accum_iter) 
+                             for l in avg_loss_list]
             remain_iters = config.TRAIN.ITERS - cur_iter
-            avg_train_batch_cost = batch_cost_averager.get_average()
-            avg_train_reader_cost = reader_cost_averager.get_average()
+            avg_train_batch_cost = batch_cost_averager.get_average() * accum_iter
+            avg_train_reader_cost = reader_cost_averager.get_average() * accum_iter
             eta = calculate_eta(remain_iters, avg_train_batch_cost)
             logger.info("[TRAIN] epoch: {}, iter: {}/{}, loss: {:.4f}, lr: {:.8f}, batch_cost:\
                 {:.4f}, reader_cost: {:.5f}, ips: {:.4f} samples/sec | ETA {}".format(
@@ -154,8 +210,11 @@ def main():
                 "iter_{}_model_state.pdparams".format(cur_iter))
             current_save_opt_file = os.path.join(config.SAVE_DIR,
                 "iter_{}_opt_state.pdopt".format(cur_iter))
+            opt_state = optimizer.state_dict()
+            if amp_grad_scaler is not None:
+                opt_state['amp_grad_scaler'] = amp_grad_scaler.state_dict()
             paddle.save(model.state_dict(), current_save_weigth_file)
-            paddle.save(optimizer.state_dict(), current_save_opt_file)
+            paddle.save(opt_state, current_save_opt_file)
             save_models.append([current_save_weigth_file,
                                 current_save_opt_file])
             logger.info("saving the weights of model to {}".format(
@@ -164,7 +223,15 @@ def main():
                 files_to_remove = save_models.popleft()
                 os.remove(files_to_remove[0])
                 os.remove(files_to_remove[1])
+        if config.VALIDATE_DURING_TRAIN and cur_iter % config.VALIDATE_FREQ == 0:
+            with paddle.amp.auto_cast(amp_grad_scaler is not None, 
+                                      level=config.TRAIN.AMP_LEVEL):
+                confusion_matrix = evaluation.evaluate(
+                    model, loader_val, config, verbose=False)
+            pending_eval = (cur_iter, confusion_matrix)
         batch_start = time.time()
+    if pending_eval is not None:
+        log_eval_results(*pending_eval)
     time.sleep(1.0)
 
 if __name__ == '__main__':